@@ -0,0 +1,230 @@
+import logging
+import random
+import threading
+import time
+from serverRequest import ServerRequestHandler
+
+ADMIN_PAGE_SIZE = 50  # Rows per page when a listing command gives no page size
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+
+class SamplingFilter(logging.Filter):
+    """Let through only a fraction of records below WARNING; warnings and errors always pass."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1.0 or random.random() < self.rate
+
+
+class AdminServer:
+    """
+    Line-based introspection channel on its own TCP port, e.g.
+    `printf 'SEARCHES 1 20\\n' | nc 127.0.0.1 5007`. Each response ends with a
+    line holding a single ".".
+
+      STATS                         counts of clients, searches, offers, transactions, threads, payments,
+                                    notifications, outbound queues, send latencies, heartbeats,
+                                    search pools and the offer cache
+      CLIENTS [page] [page_size]    registered clients and whether their heartbeats are current
+      SEARCHES [page] [page_size]   open searches with their offer counts
+      TRANSACTIONS [page] [size]    open transactions and their states
+      LOG_LEVEL <level>             change the server log level
+      LOG_SAMPLE <rate>             keep this fraction (0-1) of DEBUG/INFO records
+      PROFILE START <cprofile|sample> <seconds> | STOP | STATUS
+                                    profile request handlers, see profiler.py
+      RATE_LIMITS [RELOAD]          show rate limits and counters, or reload rate_limits.json
+      DRAIN [seconds]               refuse new searches, let open ones finish, then exit
+      RESTART [seconds]             hand sockets and state over to a new server process
+
+    Dumps copy the shared dictionaries while holding each lock for a single
+    dict copy and format the rows after releasing it, so a large dump does
+    not stall request handlers.
+    """
+
+    def __init__(self, registered_clients, ongoing_requests, offers_by_rq, transactions,
+                 requests_lock, offers_lock, profiler=None, rate_limiter=None, drain=None, restart=None,
+                 settlement=None, coalescer=None, outbound=None, liveness=None, search_pools=None,
+                 offer_cache=None):
+        self.registered_clients = registered_clients
+        self.ongoing_requests = ongoing_requests
+        self.offers_by_rq = offers_by_rq
+        self.transactions = transactions
+        self.requests_lock = requests_lock
+        self.offers_lock = offers_lock
+        self.profiler = profiler
+        self.rate_limiter = rate_limiter
+        self.drain = drain  # drain(deadline) and restart(deadline) from MarketplaceServer
+        self.restart = restart
+        self.settlement = settlement  # SettlementQueue, its counters are part of STATS
+        self.coalescer = coalescer  # NotificationCoalescer, likewise
+        self.outbound = outbound  # OutboundStage, backlog and send latencies
+        self.liveness = liveness  # LivenessIndex, heartbeat counters and per-client liveness
+        self.search_pools = search_pools  # SearchPools, broadcasts sent and searches pooled
+        self.offer_cache = offer_cache  # OfferCache, hit rate and waiting time saved
+        self.sampling = SamplingFilter()  # On the root log handlers from construction until stop()
+        for handler in logging.getLogger().handlers:
+            handler.addFilter(self.sampling)
+        self.commands = {
+            "STATS": self.stats,
+            "CLIENTS": self.clients,
+            "SEARCHES": self.searches,
+            "TRANSACTIONS": self.list_transactions,
+            "LOG_LEVEL": self.log_level,
+            "LOG_SAMPLE": self.log_sample,
+            "PROFILE": self.profile,
+            "RATE_LIMITS": self.rate_limits,
+            "DRAIN": self.start_drain,
+            "RESTART": self.hot_restart,
+        }
+
+    def stop(self):
+        """Take the log sampling filter off the root log handlers again."""
+        for handler in logging.getLogger().handlers:
+            handler.removeFilter(self.sampling)
+
+    def serve(self, admin_socket, is_running):
+        """Accept admin connections until is_running() turns False."""
+        while is_running():
+            try:
+                connection, address = admin_socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.handle_connection, args=(connection, address), daemon=True).start()
+
+    def handle_connection(self, connection, address):
+        try:
+            with connection, connection.makefile("r", encoding="utf-8") as lines:
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    logging.info(f"Admin command from {address}: {line.strip()}")
+                    connection.sendall(f"{self.execute(line)}\n.\n".encode("utf-8"))
+        except OSError as e:
+            logging.error(f"Admin connection from {address} failed: {e}")
+
+    def execute(self, line):
+        """Run one admin command line and return its text response."""
+        parts = line.split()
+        command = self.commands.get(parts[0].upper())
+        if not command:
+            return f"ERROR: Unknown admin command {parts[0]}. Commands: {' '.join(self.commands)}"
+        try:
+            return command(*parts[1:])
+        except (TypeError, ValueError, OSError) as e:
+            return f"ERROR: {e}"
+
+    def snapshot(self):
+        """Copy searches and offer counts under the handlers' lock order, then the transaction table."""
+        with self.requests_lock:
+            searches = dict(self.ongoing_requests)
+            with self.offers_lock:
+                offer_counts = {rq: len(offers) for rq, offers in self.offers_by_rq.items()}
+        return searches, offer_counts, self.transactions.snapshot()
+
+    def stats(self):
+        searches, offer_counts, transactions = self.snapshot()
+        handlers = sum(isinstance(thread, ServerRequestHandler) for thread in threading.enumerate())
+        return "\n".join([
+            f"clients {len(self.registered_clients)}",
+            f"registry_version {self.registered_clients.version}",
+            f"searches {len(searches)}",
+            f"offers {sum(offer_counts.values())}",
+            f"transactions {len(transactions)}",
+            f"transactions_paying {sum(t[0] == 'PAYING' for t in transactions.values())}",
+            f"handler_threads {handlers}",
+            f"threads {threading.active_count()}",
+            f"log_level {logging.getLevelName(logging.getLogger().level)}",
+            f"log_sample {self.sampling.rate}",
+        ] + (self.settlement.describe() if self.settlement else [])
+          + (self.coalescer.describe() if self.coalescer else [])
+          + (self.outbound.describe() if self.outbound else [])
+          + (self.liveness.describe() if self.liveness is not None else [])
+          + (self.search_pools.describe() if self.search_pools else [])
+          + (self.offer_cache.describe() if self.offer_cache is not None else []))
+
+    def clients(self, page="1", page_size=None):
+        rows = [f"{name} {info['ip']} udp={info['udp_socket']} tcp={info['tcp_socket']} rq={info['rq']}"
+                + (f" alive={'yes' if self.liveness.alive(name) else 'no'}" if self.liveness is not None else "")
+                for name, info in sorted(self.registered_clients.snapshot().items())]
+        return self.paginate(rows, page, page_size)
+
+    def searches(self, page="1", page_size=None):
+        searches, offer_counts, _ = self.snapshot()
+        rows = [f"{rq} {search.name} {search.item_name} max={search.max_price} offers={offer_counts.get(rq, 0)}"
+                for rq, search in sorted(searches.items())]
+        return self.paginate(rows, page, page_size)
+
+    def list_transactions(self, page="1", page_size=None):
+        _, _, transactions = self.snapshot()
+        now = time.time()
+        rows = [f"{rq} {state} {buyer} <- {seller or '-'} {item_name} {'-' if price is None else price} "
+                f"age={now - started:.1f}s"
+                for rq, (state, buyer, seller, item_name, price, started) in sorted(transactions.items())]
+        return self.paginate(rows, page, page_size)
+
+    @staticmethod
+    def paginate(rows, page, page_size):
+        page = int(page)
+        page_size = int(page_size) if page_size else ADMIN_PAGE_SIZE
+        if page < 1 or page_size < 1:
+            raise ValueError("page and page_size must be positive")
+        pages = max(1, -(-len(rows) // page_size))
+        start = (page - 1) * page_size
+        return "\n".join([f"PAGE {page}/{pages} total={len(rows)}"] + rows[start:start + page_size])
+
+    def log_level(self, level):
+        level = level.upper()
+        if level not in LOG_LEVELS:
+            raise ValueError(f"log level must be one of {' '.join(LOG_LEVELS)}")
+        logging.getLogger().setLevel(level)
+        logging.warning(f"Log level set to {level} by admin")
+        return f"OK log_level {level}"
+
+    def log_sample(self, rate):
+        rate = float(rate)
+        if not 0 <= rate <= 1:
+            raise ValueError("sample rate must be between 0 and 1")
+        self.sampling.rate = rate
+        logging.warning(f"Log sampling set to {rate} by admin")
+        return f"OK log_sample {rate}"
+
+    def profile(self, action, mode="sample", seconds="30"):
+        if not self.profiler:
+            return "ERROR: Profiling is not enabled on this server."
+        action = action.upper()
+        if action == "START":
+            if not self.profiler.start(mode.lower(), float(seconds)):
+                return "ERROR: A profiling session is already running."
+            return f"OK profiling {mode.lower()} for {seconds}s"
+        if action == "STOP":
+            paths = self.profiler.stop()
+            return "\n".join(["OK profiling stopped"] + paths)
+        if action == "STATUS":
+            return self.profiler.status()
+        raise ValueError("PROFILE takes START, STOP or STATUS")
+
+    def rate_limits(self, action=None):
+        if not self.rate_limiter:
+            return "ERROR: Rate limiting is not enabled on this server."
+        if action is None:
+            return "\n".join(self.rate_limiter.describe())
+        if action.upper() != "RELOAD":
+            raise ValueError("RATE_LIMITS takes no argument or RELOAD")
+        self.rate_limiter.reload()
+        logging.warning(f"Rate limits reloaded from {self.rate_limiter.path} by admin")
+        return "\n".join(["OK rate limits reloaded"] + self.rate_limiter.describe())
+
+    def start_drain(self, seconds=None):
+        if not self.drain:
+            return "ERROR: Draining is not supported by this server."
+        args = (float(seconds),) if seconds else ()
+        threading.Thread(target=self.drain, args=args, daemon=True).start()
+        return "OK draining"
+
+    def hot_restart(self, seconds=None):
+        if not self.restart:
+            return "ERROR: Hot restart is not supported by this server."
+        return self.restart(float(seconds)) if seconds else self.restart()
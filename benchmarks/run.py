@@ -0,0 +1,578 @@
+"""
+Micro-benchmarks of the server's building blocks, and the trace latency report.
+
+    python benchmarks/run.py                        # every benchmark
+    python benchmarks/run.py NAME...                # only the named benchmarks
+    python benchmarks/run.py trace_report [traces.jsonl]
+
+Each benchmark compares a component with the approach it replaced and prints
+the numbers; none of them needs a running server.
+"""
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def item_index():
+    """Lookup latency benchmark over 1M synthetic items."""
+    from itemIndex import ItemIndex
+
+    random.seed(7)
+    brands = ["iphone", "galaxy", "pixel", "xperia", "thinkpad", "macbook", "surface", "kindle",
+              "walkman", "playstation", "switch", "lumia", "nokia", "canon", "nikon", "gopro"]
+    words = ["pro", "max", "mini", "ultra", "lite", "plus", "air", "edge", "note", "neo"]
+    index = ItemIndex()
+    start = time.perf_counter()
+    for doc_id in range(1_000_000):
+        name = f"{random.choice(brands)}{random.randint(1, 60)}-{random.choice(words)}{doc_id % 997}"
+        index.add(doc_id, name)
+    print(f"Indexed {len(index)} items in {time.perf_counter() - start:.1f}s")
+
+    for query in ["iPhone13-pro5", "iphone 13 pro 5", "iphnoe13pro5", "thinkpad"]:
+        start = time.perf_counter()
+        runs = 20
+        for _ in range(runs):
+            results = index.search(query, limit=5)
+        elapsed = (time.perf_counter() - start) / runs
+        print(f"{query!r}: {elapsed * 1000:.2f} ms, top={results[:2]}")
+
+
+def matching_engine():
+    """Matching throughput benchmark."""
+    from idAllocator import IdAllocator
+    from matchingEngine import MatchingEngine
+
+    random.seed(7)
+    engine = MatchingEngine(IdAllocator())
+    items = [f"item{i}" for i in range(100)]
+    orders = [(random.random() < 0.5, random.choice(items), random.randint(80, 120))
+              for _ in range(500_000)]
+
+    start = time.perf_counter()
+    fills = 0
+    for is_bid, item_name, price in orders:
+        if is_bid:
+            _, matched = engine.submit_bid("buyer", "1", item_name, price)
+        else:
+            _, matched = engine.submit_ask("seller", "1", item_name, price)
+        fills += len(matched)
+    elapsed = time.perf_counter() - start
+    print(f"{len(orders)} orders, {fills} fills, {engine.resting_orders()} resting "
+          f"in {elapsed:.2f}s ({len(orders) / elapsed:,.0f} orders/s)")
+
+
+def price_stats():
+    """Memory and query latency benchmark."""
+    from priceStats import PriceStats
+
+    random.seed(7)
+    stats = PriceStats()
+    items = [f"item{i}" for i in range(10_000)]
+    for _ in range(500_000):
+        item = random.choice(items)
+        stats.record_offer(item, random.randint(50, 150))
+        if random.random() < 0.2:
+            stats.record_trade(item, random.randint(50, 150), random.randint(1, 3))
+    print(f"Memory per tracked item: {stats.memory_per_item()} bytes")
+
+    for batch in (1, 10, 100):
+        start = time.perf_counter()
+        runs = 200
+        for _ in range(runs):
+            stats.quotes(random.sample(items, batch))
+        elapsed = (time.perf_counter() - start) / runs
+        print(f"Quote batch of {batch}: {elapsed * 1000:.3f} ms")
+
+
+def client_registry():
+    """Lookup and broadcast throughput while another thread churns registrations."""
+    from clientRegistry import ClientRegistry
+
+    registry = ClientRegistry()
+    for i in range(1000):
+        registry.register(f"client{i}", {"ip": "127.0.0.1", "udp_socket": str(20000 + i)})
+
+    running = True
+
+    def churn():
+        i = 0
+        while running:
+            registry.register(f"churn{i}", {"ip": "127.0.0.1", "udp_socket": "1"})
+            registry.deregister(f"churn{i}")
+            i += 1
+        print(f"Writer published {registry.version} versions")
+
+    writer = threading.Thread(target=churn)
+    writer.start()
+    start = time.perf_counter()
+    lookups = 0
+    for _ in range(200):
+        for name, info in registry.snapshot().items():
+            registry.get(name)
+            lookups += 1
+    elapsed = time.perf_counter() - start
+    running = False
+    writer.join()
+    print(f"{lookups} lookups during broadcast iteration in {elapsed:.2f}s "
+          f"({lookups / elapsed:,.0f}/s)")
+
+
+def udp_receiver():
+    """Receive-path throughput: the previous recvfrom(1024) loop vs UdpReceiver."""
+    from udpReceiver import UdpReceiver, RECV_BUFFER, message_type_of
+
+    MESSAGES = 200_000
+    payload = b"OFFER 12 seller lamp 30 accept_above=25"
+
+    def blast(address, stop):
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        while not stop.is_set():
+            sender.sendto(payload, address)
+
+    def legacy(sock):
+        count = 0
+        start = time.perf_counter()
+        while count < MESSAGES:
+            sock.settimeout(1.0)
+            message, address = sock.recvfrom(1024)
+            f"Received UDP message from {address}: {message.decode('utf-8')}"
+            message.decode("utf-8").split()[0]
+            count += 1
+        return time.perf_counter() - start
+
+    def batched(sock):
+        sock.settimeout(None)
+        receiver = UdpReceiver(sock)
+        count = 0
+        start = time.perf_counter()
+        while count < MESSAGES:
+            for view, address in receiver.receive(1.0):
+                message_type_of(view)
+                str(view, "utf-8").split()
+                count += 1
+        receiver.close()
+        return time.perf_counter() - start
+
+    for name, loop in (("recvfrom(1024) loop", legacy), ("UdpReceiver", batched)):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        sock.bind(("127.0.0.1", 0))
+        stop = threading.Event()
+        sender = threading.Thread(target=blast, args=(sock.getsockname(), stop), daemon=True)
+        sender.start()
+        elapsed = loop(sock)
+        stop.set()
+        sender.join()
+        sock.close()
+        print(f"{name}: {MESSAGES / elapsed:,.0f} packets/s")
+
+
+def settlement():
+    """Checkout throughput: paying inline per BUY vs submitting to the settlement queue."""
+    from settlement import Payment, SettlementQueue, SimulatedProcessor, format_cents
+
+    CHECKOUTS = 200
+    LATENCY = 0.02
+    processor = SimulatedProcessor(latency=LATENCY)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for i in range(CHECKOUTS):
+            processor.settle([Payment(i, "4111", "5500", "29.99")])
+        inline = time.perf_counter() - start
+
+        done = threading.Semaphore(0)
+        queue = SettlementQueue(processor, interval=0.01).start()
+        start = time.perf_counter()
+        for i in range(CHECKOUTS):
+            queue.submit(Payment(i, "4111", "5500", "29.99", lambda payment, ok: done.release()))
+        submitted = time.perf_counter() - start
+        for _ in range(CHECKOUTS):
+            done.acquire()
+        settled = time.perf_counter() - start
+        queue.stop()
+
+    print(f"inline: {CHECKOUTS / inline:,.0f} checkouts/s")
+    print(f"queued: {CHECKOUTS / submitted:,.0f} checkouts/s submitted, "
+          f"all settled after {settled:.2f}s in {queue.batches} batches")
+    payment = Payment(0, "4111", "5500", "29.99")
+    print(f"29.99 -> fee {format_cents(payment.fee)}, seller {format_cents(payment.seller_amount)}")
+
+
+def transaction_table():
+    """BUY lookup: scanning every search's offers vs the (buyer address, RQ#) index."""
+    from transactionTable import TransactionTable, OFFERED, RESERVED
+
+    SEARCHES = 5_000
+    OFFERS = 5
+    LOOKUPS = 1_000
+
+    table = TransactionTable()
+    offers_by_rq = {}
+    for rq in range(SEARCHES):
+        offers_by_rq[rq] = [(f"seller{i}", f"item{rq}", 10 + i) for i in range(OFFERS)]
+        table.open(rq, str(rq // 500), f"buyer{rq % 500}", ("127.0.0.1", 20000 + rq % 500), f"item{rq}")
+        table.transition(rq, OFFERED)
+        table.transition(rq, RESERVED, seller="seller0", price=10)
+
+    start = time.perf_counter()
+    for n in range(LOOKUPS):
+        item = f"item{n * 7 % SEARCHES}"
+        found = next(rq for rq, offers in offers_by_rq.items()
+                     for seller, item_name, price in offers if item_name == item and price == 10)
+    scan = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for n in range(LOOKUPS):
+        rq = n * 7 % SEARCHES
+        found = table.for_buyer(("127.0.0.1", 20000 + rq % 500), str(rq // 500), f"item{rq}")
+    indexed = time.perf_counter() - start
+
+    print(f"scan:    {LOOKUPS / scan:,.0f} BUY lookups/s")
+    print(f"indexed: {LOOKUPS / indexed:,.0f} BUY lookups/s")
+
+
+def coalescer():
+    """SEARCH fan-out at a high search rate: one datagram per message vs coalesced per client."""
+    from coalescer import NotificationCoalescer
+
+    CLIENTS = 20
+    SEARCHES = 2000
+
+    receivers = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(CLIENTS)]
+    for receiver in receivers:
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        receiver.bind(("127.0.0.1", 0))
+    addresses = [receiver.getsockname() for receiver in receivers]
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def fan_out(send):
+        start = time.perf_counter()
+        for rq in range(SEARCHES):
+            message = f"SEARCH {rq} lamp-{rq % 50} desk_lamp buyer{rq % 7}"
+            for address in addresses:
+                send(message, address)
+        return time.perf_counter() - start
+
+    syscalls = 0
+
+    def direct(message, address):
+        nonlocal syscalls
+        syscalls += 1
+        sender.sendto(message.encode("utf-8"), address)
+
+    elapsed = fan_out(direct)
+    print(f"direct:    {SEARCHES * CLIENTS / elapsed:,.0f} notifications/s, {syscalls:,} datagrams")
+
+    coalescer = NotificationCoalescer(sender.sendto)
+    elapsed = fan_out(coalescer.send)
+    coalescer.close()
+    print(f"coalesced: {SEARCHES * CLIENTS / elapsed:,.0f} notifications/s, {coalescer.datagrams:,} datagrams")
+
+
+def outbound_stage():
+    """Handler-side cost of a BUY's network writes: blocking calls vs the outbound stage."""
+    from outboundStage import OutboundStage, TCP_TIMEOUT
+
+    SLOW_CLIENT_DELAY = 0.05  # The client takes this long to answer INFORM_REQ
+    BUYS = 40
+
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(64)
+
+    def slow_client():
+        while True:
+            connection, _ = listener.accept()
+
+            def answer(connection=connection):
+                with connection:
+                    connection.recv(1024)
+                    time.sleep(SLOW_CLIENT_DELAY)
+                    connection.sendall(b"INFORM_RES 1 c 4111 12/25 Main")
+            threading.Thread(target=answer, daemon=True).start()
+
+    threading.Thread(target=slow_client, daemon=True).start()
+    address = listener.getsockname()
+    logging.disable(logging.INFO)
+
+    def blocking_exchange(message):
+        with socket.create_connection(address, timeout=TCP_TIMEOUT) as tcp_socket:
+            tcp_socket.sendall(message.encode('utf-8'))
+            return tcp_socket.recv(1024)
+
+    start = time.perf_counter()
+    for _ in range(BUYS):
+        blocking_exchange("INFORM_REQ lamp 30")  # buyer
+        blocking_exchange("INFORM_REQ lamp 30")  # seller
+        blocking_exchange("SHIPPING_INFO 1 buyer Main")
+    blocking = (time.perf_counter() - start) / BUYS
+
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    stage = OutboundStage(udp_socket)
+    start = time.perf_counter()
+    for _ in range(BUYS):
+        buyer = stage.request_tcp(address, "INFORM_REQ lamp 30")
+        seller = stage.request_tcp(address, "INFORM_REQ lamp 30")
+        buyer.result(), seller.result()
+        stage.send_tcp(address, "SHIPPING_INFO 1 buyer Main")
+    staged = (time.perf_counter() - start) / BUYS
+    stage.close()
+
+    print(f"blocking sends: {blocking * 1000:.1f} ms of handler time per BUY")
+    print(f"outbound stage: {staged * 1000:.1f} ms of handler time per BUY")
+    print("\n".join(stage.describe()))
+
+
+def reservation_table():
+    """Hot offers bought by many threads at once: per-offer CAS vs one lock around a claimed set."""
+    from reservationTable import ReservationTable
+
+    THREADS = 8
+    OFFERS = 2000  # Every thread tries to buy every offer
+
+    def buy_all_cas(table, results):
+        won = 0
+        for offer_id in range(OFFERS):
+            if table.claim(offer_id) is not None:
+                won += 1
+        results.append(won)
+
+    def buy_all_locked(state, results):
+        lock, claimed = state
+        won = 0
+        for offer_id in range(OFFERS):
+            with lock:
+                if offer_id not in claimed:
+                    claimed.add(offer_id)
+                    won += 1
+        results.append(won)
+
+    for name, target, state in (("global lock", buy_all_locked, (threading.Lock(), set())),
+                                ("per-offer CAS", buy_all_cas, ReservationTable())):
+        results = []
+        threads = [threading.Thread(target=target, args=(state, results)) for _ in range(THREADS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {THREADS * OFFERS / elapsed:,.0f} claim attempts/s, "
+              f"{sum(results)} winners for {OFFERS} offers")
+
+
+def liveness():
+    """SEARCH fan-out with stale registrations: sending to everyone vs skipping dead clients."""
+    from liveness import LivenessIndex
+
+    LIVE = 50
+    STALE = 450  # Crashed without DE-REGISTER
+    SEARCHES = 200
+
+    receivers = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(LIVE)]
+    for receiver in receivers:
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        receiver.bind(("127.0.0.1", 0))
+    clients = {f"live{i}": receiver.getsockname() for i, receiver in enumerate(receivers)}
+    for i in range(STALE):
+        dead = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        dead.bind(("127.0.0.1", 0))
+        clients[f"stale{i}"] = dead.getsockname()
+        dead.close()  # Nobody listens there any more
+
+    index = LivenessIndex()
+    start = time.monotonic()
+    for name in clients:
+        index.touch(name, start - (index.timeout if name.startswith("stale") else 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def broadcast(skip_dead):
+        sent = 0
+        begin = time.perf_counter()
+        for rq in range(SEARCHES):
+            message = f"SEARCH {rq} lamp desk_lamp buyer".encode("utf-8")
+            for name, address in clients.items():
+                if skip_dead and not index.alive(name):
+                    continue
+                try:
+                    sender.sendto(message, address)
+                except OSError:
+                    pass  # ICMP port unreachable from an earlier datagram
+                sent += 1
+        return (time.perf_counter() - begin) / SEARCHES, sent // SEARCHES
+
+    for label, skip_dead in (("all registered", False), ("live only", True)):
+        elapsed, recipients = broadcast(skip_dead)
+        print(f"{label:15s} {elapsed * 1000:.2f} ms per SEARCH broadcast, {recipients} recipients")
+
+    # Per-tick cost with many healthy clients and a few dying: timer wheel vs scanning every heartbeat
+    CLIENTS = 100_000
+    DYING = 1_000  # Stopped sending heartbeats half a timeout ago
+    wheel = LivenessIndex()
+    now = time.monotonic()
+    last_seen = {}
+    for i in range(CLIENTS):
+        last_seen[f"client{i}"] = now - (wheel.timeout / 2 if i < DYING else 0)
+        wheel.touch(f"client{i}", last_seen[f"client{i}"])
+    ticks = int(wheel.timeout / 2 / wheel.tick) + 2  # Expiry may come one tick late
+    begin = time.perf_counter()
+    for step in range(1, ticks + 1):
+        wheel.advance(now + step * wheel.tick)
+    wheel_time = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    for step in range(1, ticks + 1):
+        deadline = now + step * wheel.tick - wheel.timeout
+        for name in [name for name, seen in last_seen.items() if seen <= deadline]:
+            del last_seen[name]
+    scan_time = time.perf_counter() - begin
+    print(f"timer wheel: {wheel_time * 1000 / ticks:.3f} ms per tick, {wheel.expired} expired")
+    print(f"full scan:   {scan_time * 1000 / ticks:.3f} ms per tick, {CLIENTS - len(last_seen)} expired")
+
+
+def search_pool():
+    """A burst of searches for a few popular items: one broadcast per search vs pooled."""
+    from classes.searching import Offer
+    from searchPool import SearchPools, allocate_offers
+
+    SELLERS = 100
+    SEARCHES = 400
+    ITEMS = 8
+    STOCK = 40  # Units of each item on offer, one per seller, answering every SEARCH for it
+
+    random.seed(1)
+    searches = [(rq, f"item{random.randrange(ITEMS)}", random.randint(20, 60)) for rq in range(SEARCHES)]
+    stock = {f"item{i}": [Offer("0", f"seller{n}", f"item{i}", random.randint(15, 60)) for n in range(STOCK)]
+             for i in range(ITEMS)}
+
+    # Unpooled: every search is broadcast, sees the same offers and reserves the cheapest it can afford
+    reserved = set()
+    for rq, item_name, max_price in searches:
+        affordable = [o for o in stock[item_name] if int(o.price) <= max_price]
+        if affordable:
+            reserved.add(id(min(affordable, key=lambda o: int(o.price))))
+    print(f"one broadcast per search: {SEARCHES * (SELLERS - 1):,} SEARCH datagrams, "
+          f"{SEARCHES * STOCK:,} OFFERs, {len(reserved)} distinct units reserved")
+
+    pools = SearchPools()
+    for rq, item_name, max_price in searches:
+        pools.join(rq, f"buyer{rq}", item_name, max_price, window=60)
+    filled = 0
+    start = time.perf_counter()
+    for pool in list(pools._open.values()):
+        members = pools.close(pool)
+        allocation = allocate_offers(members, stock[pool.key])
+        filled += sum(1 for search_rq, _, max_price in members
+                      if len(allocation[search_rq]) == 1 and int(allocation[search_rq][0].price) <= max_price)
+    elapsed = time.perf_counter() - start
+    print(f"pooled:                   {pools.broadcasts * (SELLERS - 1):,} SEARCH datagrams, "
+          f"{pools.broadcasts * STOCK:,} OFFERs, {filled} distinct units reserved "
+          f"({pools.pooled} searches pooled, allocation {elapsed * 1000:.1f} ms)")
+
+
+def offer_cache():
+    """Repeat searches for popular items: hit rate and buyer waiting time with and without the cache."""
+    from offerCache import OfferCache
+
+    SEARCHES = 20_000
+    ITEMS = 500
+    SEARCH_RATE = 20  # Searches per second
+    OFFER_WINDOW = 60
+    OFFERS_PER_SEARCH = 3  # Offers a broadcast SEARCH gets; the cheapest is taken
+
+    class _Offer:
+        def __init__(self, name, item_name, price, offer_id):
+            self.name, self.item_name, self.price, self.offer_id = name, item_name, price, offer_id
+
+    random.seed(1)
+    popularity = [1 / (rank + 1) for rank in range(ITEMS)]  # Zipf-like
+    items = random.choices([f"item{i}" for i in range(ITEMS)], popularity, k=SEARCHES)
+    cache = OfferCache()
+    pending = []  # (window end, offers) of broadcast searches still collecting
+    waited = 0.0
+    start = time.perf_counter()
+    for n, item_name in enumerate(items):
+        now = n / SEARCH_RATE
+        while pending and pending[0][0] <= now:
+            _, offers = pending.pop(0)
+            for offer in offers[1:]:  # The cheapest was reserved by its own search
+                cache.add(offer, now)
+        if cache.match(item_name, 60, now=now):
+            cache.record_saved(OFFER_WINDOW)
+        else:
+            offers = sorted((_Offer(f"seller{random.randrange(50)}", item_name, random.randint(20, 60), n)
+                             for _ in range(OFFERS_PER_SEARCH)), key=lambda o: o.price)
+            pending.append((now + OFFER_WINDOW, offers))
+            waited += OFFER_WINDOW
+    elapsed = time.perf_counter() - start
+    print(f"without cache: {OFFER_WINDOW:.1f} s mean wait for FOUND / NOT_AVAILABLE")
+    print(f"with cache:    {waited / SEARCHES:.1f} s mean wait, "
+          f"{elapsed / SEARCHES * 1e6:.1f} us per search in the cache")
+    print("\n".join(cache.describe()))
+
+
+def trace_report(path=None):
+    """Per-stage latency report of a trace file: which stage dominates the tail."""
+    from tracing import TRACE_FILE
+    from collections import defaultdict
+
+    durations = defaultdict(list)
+    with open(path or TRACE_FILE) as traces:
+        for line in traces:
+            record = json.loads(line)
+            stage = record["stage"]
+            if stage == "trace":
+                stage = f"trace[{record['outcome']}]"
+            durations[stage].append(record["duration_ms"])
+
+    def percentile(values, p):
+        return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+    print(f"{'stage':32} {'count':>7} {'p50_ms':>10} {'p95_ms':>10} {'p99_ms':>10} {'max_ms':>10}")
+    for stage, values in sorted(durations.items(), key=lambda item: -max(item[1])):
+        values.sort()
+        print(f"{stage:32} {len(values):>7} {percentile(values, 50):>10.1f} {percentile(values, 95):>10.1f} "
+              f"{percentile(values, 99):>10.1f} {values[-1]:>10.1f}")
+
+
+BENCHMARKS = {
+    "item_index": item_index,
+    "matching_engine": matching_engine,
+    "price_stats": price_stats,
+    "client_registry": client_registry,
+    "udp_receiver": udp_receiver,
+    "settlement": settlement,
+    "transaction_table": transaction_table,
+    "coalescer": coalescer,
+    "outbound_stage": outbound_stage,
+    "reservation_table": reservation_table,
+    "liveness": liveness,
+    "search_pool": search_pool,
+    "offer_cache": offer_cache,
+}
+
+
+def main(args):
+    if args and args[0] == "trace_report":
+        trace_report(args[1] if len(args) > 1 else None)
+        return
+    unknown = [name for name in args if name not in BENCHMARKS]
+    if unknown:
+        sys.exit(f"Unknown benchmarks: {' '.join(unknown)}. Choose from: {' '.join(BENCHMARKS)} trace_report")
+    for name in args or BENCHMARKS:
+        print(f"== {name}")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
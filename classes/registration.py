@@ -38,3 +38,23 @@ class DeRegister:
 
     def __str__(self):
         return f"{self.TYPE} {self.rq} {self.name}"
+
+
+class Ping:
+    def __init__(self, rq, name):
+        self.TYPE = "PING"
+        self.rq = rq
+        self.name = name
+
+    def __str__(self):
+        return f"{self.TYPE} {self.rq} {self.name}"
+
+
+class Pong:
+    def __init__(self, rq, status):
+        self.TYPE = "PONG"
+        self.rq = rq
+        self.status = status  # ALIVE, or UNKNOWN when the name is not registered (e.g. it expired)
+
+    def __str__(self):
+        return f"{self.TYPE} {self.rq} {self.status}"
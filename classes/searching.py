@@ -12,15 +12,18 @@ class LookingFor:
 
 
 class Offer:
-    def __init__(self, rq, name, item_name, price):
+    def __init__(self, rq, name, item_name, price, *terms):
         self.TYPE = "OFFER"
         self.rq = rq
         self.name = name
         self.item_name = item_name
         self.price = price
+        # Optional hidden negotiation terms, e.g. "accept_above=80" "counter=90"
+        self.terms = list(terms)
 
     def __str__(self):
-        return f"{self.TYPE} {self.rq} {self.name} {self.item_name} {self.price}"
+        terms = ''.join(f" {term}" for term in self.terms)
+        return f"{self.TYPE} {self.rq} {self.name} {self.item_name} {self.price}{terms}"
 
 
 class Found:
@@ -108,3 +111,74 @@ class Buy:
 
     def __str__(self):
         return f"{self.TYPE} {self.rq} {self.item_name} {self.price}"
+
+
+class LookingForBatch:
+    def __init__(self, rq, name, *entries):
+        self.TYPE = "LOOKING_FOR_BATCH"
+        self.rq = rq
+        self.name = name
+        # Each entry is "item_name:item_description:max_price"
+        self.entries = [entry.split(":") for entry in entries]
+
+    def __str__(self):
+        entries = ' '.join(':'.join(str(field) for field in entry) for entry in self.entries)
+        return f"{self.TYPE} {self.rq} {self.name} {entries}"
+
+
+class OfferBatch:
+    def __init__(self, rq, name, *entries):
+        self.TYPE = "OFFER_BATCH"
+        self.rq = rq
+        self.name = name
+        # Each entry is "search_rq:item_name:price" or "search_rq:item_name:price:accept_above"
+        self.entries = [entry.split(":") for entry in entries]
+
+    def __str__(self):
+        entries = ' '.join(':'.join(str(field) for field in entry) for entry in self.entries)
+        return f"{self.TYPE} {self.rq} {self.name} {entries}"
+
+
+class BatchResult:
+    def __init__(self, rq, *results):
+        self.TYPE = "BATCH_RESULT"
+        self.rq = rq
+        # One result per batch entry, in order
+        self.results = list(results)
+
+    def __str__(self):
+        return f"{self.TYPE} {self.rq} {' '.join(self.results)}"
+
+
+class Inventory:
+    def __init__(self, rq, name, *entries):
+        self.TYPE = "INVENTORY"
+        self.rq = rq
+        self.name = name
+        # Each entry is "item_name:price:quantity" or "item_name:price:quantity:min_price"
+        self.entries = [entry.split(":") for entry in entries]
+
+    def __str__(self):
+        entries = ' '.join(':'.join(str(field) for field in entry) for entry in self.entries)
+        return f"{self.TYPE} {self.rq} {self.name} {entries}"
+
+
+class Quote:
+    def __init__(self, rq, *item_names):
+        self.TYPE = "QUOTE"
+        self.rq = rq
+        self.item_names = list(item_names)
+
+    def __str__(self):
+        return f"{self.TYPE} {self.rq} {' '.join(self.item_names)}"
+
+
+class QuoteRes:
+    def __init__(self, rq, *quotes):
+        self.TYPE = "QUOTE_RES"
+        self.rq = rq
+        # One "item:offers:p25:p50:p75:trades:vwap" entry per requested item
+        self.quotes = list(quotes)
+
+    def __str__(self):
+        return f"{self.TYPE} {self.rq} {' '.join(self.quotes)}"
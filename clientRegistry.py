@@ -0,0 +1,60 @@
+from threading import Lock
+from types import MappingProxyType
+
+
+class ClientRegistry:
+    """
+    Registered clients, published as immutable snapshots. REGISTER, DE-REGISTER
+    and RESET copy the current mapping, change the copy and swap it in under a
+    write lock; readers (SEARCH broadcast, notification address lookups) take
+    no lock and always see one consistent version, even while it is replaced.
+    Membership changes cost a copy of the registry, lookups cost a dict access.
+    """
+
+    def __init__(self):
+        self._clients = MappingProxyType({})  # name -> read-only client info
+        self._write_lock = Lock()
+        self.version = 0
+
+    def snapshot(self):
+        """The current read-only name -> client info mapping; iterate this rather than the registry."""
+        return self._clients
+
+    def get(self, name, default=None):
+        return self._clients.get(name, default)
+
+    def __contains__(self, name):
+        return name in self._clients
+
+    def __len__(self):
+        return len(self._clients)
+
+    def register(self, name, info):
+        """Publish a new client. Returns False if the name is already in use."""
+        with self._write_lock:
+            if name in self._clients:
+                return False
+            clients = dict(self._clients)
+            clients[name] = MappingProxyType(dict(info))
+            self._publish(clients)
+            return True
+
+    def deregister(self, name):
+        """Remove a client. Returns its info, or None if it was not registered."""
+        with self._write_lock:
+            info = self._clients.get(name)
+            if info is None:
+                return None
+            clients = dict(self._clients)
+            del clients[name]
+            self._publish(clients)
+            return info
+
+    def clear(self):
+        with self._write_lock:
+            self._publish({})
+
+    def _publish(self, clients):
+        # Rebinding one attribute is atomic, so readers see the old or the new mapping
+        self._clients = MappingProxyType(clients)
+        self.version += 1
@@ -0,0 +1,144 @@
+import logging
+import queue
+from concurrent.futures import Future, InvalidStateError
+
+INFORM_TIMEOUT = 110  # Server gives up on INFORM_REQ after serverRequest.INFORM_TIMEOUT (120) seconds
+BUY_TIMEOUT = 180  # A BUY waits for both INFORM_REQ answers and the payment
+
+
+class Decision:
+    """
+    A notification that needs an answer: FOUND (buy?), NEGOTIATE (accept the
+    price?) or INFORM_REQ (payment and shipping details).
+    """
+
+    def __init__(self, kind, parts):
+        self.kind = kind
+        self.parts = parts
+        self.future = Future()
+
+    def __str__(self):
+        return ' '.join(self.parts)
+
+
+class DecisionPolicy:
+    """
+    Decides pending notifications without user interaction.
+    decide() runs on the network thread, so it must not block; returning None
+    defers the decision to the runtime's queue.
+    """
+
+    def decide(self, decision):
+        return None
+
+
+class InteractivePolicy(DecisionPolicy):
+    """Defer every decision to whoever drains the runtime's queue (e.g. the menu)."""
+
+
+class AutoPolicy(DecisionPolicy):
+    """
+    Answer decisions automatically: buy found items up to max_buy_price,
+    accept negotiations down to min_sell_price and hand out fixed
+    payment details. Anything outside the limits is declined.
+    """
+
+    def __init__(self, max_buy_price=None, min_sell_price=None, details=None):
+        self.max_buy_price = max_buy_price
+        self.min_sell_price = min_sell_price
+        self.details = details
+
+    def decide(self, decision):
+        if decision.kind == "FOUND":
+            price = int(decision.parts[3])
+            return self.max_buy_price is None or price <= self.max_buy_price
+        if decision.kind == "NEGOTIATE":
+            price = int(decision.parts[3])
+            return self.min_sell_price is None or price >= self.min_sell_price
+        if decision.kind == "INFORM_REQ":
+            return self.details
+        return None
+
+
+class ClientRuntime:
+    """
+    Keeps user interaction off the client's network threads. FOUND, NEGOTIATE
+    and INFORM_REQ notifications become Decisions: the policy answers them
+    immediately or they are queued until someone calls resolve().
+    """
+
+    def __init__(self, client, policy=None, on_pending=None, on_reply=None):
+        self.client = client
+        self.policy = policy or InteractivePolicy()
+        self.on_pending = on_pending  # Called with each decision that was queued
+        self.on_reply = on_reply  # Called with the future of each BUY / CANCEL sent for a decision
+        self.decisions = queue.Queue()
+        client.on("FOUND", lambda parts: self.submit("FOUND", parts))
+        client.on("NEGOTIATE", lambda parts: self.submit("NEGOTIATE", parts))
+        client.inform_handler = self.inform_details
+
+    def submit(self, kind, parts):
+        """Create a decision, answering it through the policy or queueing it."""
+        decision = Decision(kind, parts)
+        decision.future.add_done_callback(lambda future: self._apply(decision))
+        try:
+            answer = self.policy.decide(decision)
+        except Exception as e:
+            logging.error(f"Decision policy failed for {decision}: {e}")
+            answer = None
+        if answer is not None:
+            decision.future.set_result(answer)
+        else:
+            self.decisions.put(decision)
+            if self.on_pending:
+                self.on_pending(decision)
+        return decision
+
+    def next_decision(self, timeout=None):
+        """Return the oldest undecided notification, or None if there is none."""
+        while True:
+            try:
+                decision = self.decisions.get(block=timeout is not None, timeout=timeout)
+            except queue.Empty:
+                return None
+            if not decision.future.done():  # Skip decisions that expired while queued
+                return decision
+
+    def pending_count(self):
+        return self.decisions.qsize()
+
+    def resolve(self, decision, answer):
+        """Answer a queued decision."""
+        try:
+            decision.future.set_result(answer)
+        except InvalidStateError:
+            pass  # Already answered or expired
+
+    def inform_details(self, parts):
+        """INFORM_REQ handler: waits (on the TCP thread only) for the payment details."""
+        decision = self.submit("INFORM_REQ", parts)
+        try:
+            return decision.future.result(timeout=INFORM_TIMEOUT)
+        except Exception:
+            decision.future.cancel()
+            logging.warning(f"No payment details provided in time for {decision}")
+            return None
+
+    def _apply(self, decision):
+        """Send the command that carries out an answered decision."""
+        if decision.future.cancelled() or decision.kind == "INFORM_REQ":
+            return
+        rq, item_name, price = decision.parts[1], decision.parts[2], decision.parts[3]
+        answer = decision.future.result()
+        if decision.kind == "FOUND":
+            if answer:
+                reply = self.client.buy(rq, item_name, price, timeout=BUY_TIMEOUT)
+            else:
+                reply = self.client.cancel(rq, item_name, price)
+            if self.on_reply:
+                reply.add_done_callback(self.on_reply)
+        elif decision.kind == "NEGOTIATE":
+            if answer:
+                self.client.accept(rq, item_name, price)
+            else:
+                self.client.refuse(rq, item_name, price)
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import deque
+
+COALESCE_WINDOW = 0.002  # Seconds a notification may wait for others to the same client
+MAX_PACKET = 1472  # UDP payload that fits a 1500-byte Ethernet MTU
+# Sent at once, after anything still waiting for the same client
+URGENT_TYPES = frozenset({"FOUND", "NOT_AVAILABLE", "CANCEL", "CANCELED", "RESERVE", "NEGOTIATE",
+                          "TRANSACTION_SUCCESS", "ERROR"})
+
+
+class _Pending:
+    __slots__ = ("messages", "size")
+
+    def __init__(self):
+        self.messages = []
+        self.size = 0
+
+
+class NotificationCoalescer:
+    """
+    Outbound notifications to clients, merged per address. A notification
+    waits up to `window` seconds for others to the same client and they go
+    out as one datagram, one message per line, up to max_packet bytes.
+    Urgent message types are sent immediately, after flushing what is
+    already waiting for that client so the order is kept.
+
+    `send(data, address)` does the actual socket write.
+    """
+
+    def __init__(self, send, window=COALESCE_WINDOW, max_packet=MAX_PACKET, urgent_types=URGENT_TYPES):
+        self._send = send
+        self.window = window
+        self.max_packet = max_packet
+        self.urgent_types = urgent_types
+        self._pending = {}  # address -> _Pending
+        self._deadlines = deque()  # (deadline, address, _Pending), in deadline order since the window is fixed
+        self._cond = threading.Condition()
+        self._running = True
+        self.messages = 0
+        self.datagrams = 0
+        self._thread = threading.Thread(target=self._flush_expired, name="coalescer", daemon=True)
+        self._thread.start()
+
+    def send(self, message, address):
+        message = str(message)
+        data = message.encode("utf-8")
+        urgent = message.split(" ", 1)[0] in self.urgent_types
+        ready = []
+        with self._cond:
+            self.messages += 1
+            pending = self._pending.get(address)
+            if pending and (urgent or pending.size + 1 + len(data) > self.max_packet):
+                ready.append(self._pop(address))
+                pending = None
+            if urgent or not self._running or len(data) >= self.max_packet:
+                ready.append([data])
+            else:
+                if pending is None:
+                    pending = self._pending[address] = _Pending()
+                    self._deadlines.append((time.monotonic() + self.window, address, pending))
+                    self._cond.notify()
+                pending.messages.append(data)
+                pending.size += len(data) + (1 if pending.size else 0)
+        for messages in ready:
+            self._write(messages, address)
+
+    def _pop(self, address):
+        return self._pending.pop(address).messages
+
+    def _write(self, messages, address):
+        self.datagrams += 1
+        self._send(b"\n".join(messages), address)
+
+    def _flush_expired(self):
+        while True:
+            with self._cond:
+                while self._running and not self._deadlines:
+                    self._cond.wait()
+                if not self._running and not self._deadlines:
+                    return
+                now = time.monotonic()
+                if self._deadlines[0][0] > now and self._running:
+                    self._cond.wait(self._deadlines[0][0] - now)
+                    continue
+                ready = []
+                while self._deadlines and (self._deadlines[0][0] <= now or not self._running):
+                    _, address, pending = self._deadlines.popleft()
+                    if self._pending.get(address) is pending:  # Not flushed early
+                        ready.append((self._pop(address), address))
+            for messages, address in ready:
+                try:
+                    self._write(messages, address)
+                except OSError:
+                    pass  # The client is unreachable; like a lost datagram
+
+    def close(self):
+        """Send what is still waiting and stop the flusher thread."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=2)
+
+    def describe(self):
+        return [f"notifications {self.messages}", f"notification_datagrams {self.datagrams}"]
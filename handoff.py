@@ -0,0 +1,45 @@
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import tempfile
+
+HANDOFF_FLAG = "--handoff"
+STATE_VERSION = 3
+
+
+def save_state(state):
+    """Write the server state for a successor process. Returns the file path (readable by the owner only)."""
+    fd, path = tempfile.mkstemp(prefix="marketplace-handoff-", suffix=".pickle")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(dict(state, version=STATE_VERSION), f)
+    return path
+
+
+def load_state(path):
+    """Read and delete a state file written by save_state."""
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    os.remove(path)
+    if state.get("version") != STATE_VERSION:
+        raise ValueError(f"Unsupported handoff state version {state.get('version')}")
+    return state
+
+
+def spawn_successor(script, state_path, sockets, args=()):
+    """
+    Start a new server process that inherits the listening sockets (POSIX only):
+    `python <script> <args> --handoff <state file> <fd>...`.
+    """
+    if os.name != "posix":
+        raise OSError("Hot restart needs file descriptor passing (POSIX only)")
+    fds = [sock.fileno() for sock in sockets]
+    return subprocess.Popen([sys.executable, script, *args, HANDOFF_FLAG, state_path, *map(str, fds)],
+                            pass_fds=fds)
+
+
+def adopt(values):
+    """(state, sockets) from the `--handoff <state file> <fd>...` values given to a successor."""
+    state_path, *fds = values
+    return load_state(state_path), [socket.socket(fileno=int(fd)) for fd in fds]
@@ -0,0 +1,58 @@
+import itertools
+import sys
+from threading import Lock
+
+MAX_ID = (1 << 63) - 1  # IDs must fit in a signed 64-bit integer
+
+
+class IdAllocator:
+    """
+    Hands out monotonic, collision-free integer IDs for searches, offers,
+    transactions and registrations. IDs are only turned into strings at the
+    wire edge (see format_id / parse_id).
+    """
+
+    def __init__(self, start=1):
+        if not 0 < start <= MAX_ID:
+            raise ValueError(f"start must be between 1 and {MAX_ID}")
+        self._counter = itertools.count(start)
+        self._next = start
+        self._lock = Lock()
+
+    def next_id(self):
+        """Return the next unused ID."""
+        with self._lock:
+            new_id = next(self._counter)
+            self._next = new_id + 1
+        if new_id > MAX_ID:
+            raise OverflowError("ID space exhausted")
+        return new_id
+
+    def peek(self):
+        """The ID the next call will return, e.g. to start a successor's allocator."""
+        with self._lock:
+            return self._next
+
+
+def format_id(value):
+    """Render an integer ID for an outgoing message."""
+    return str(value)
+
+
+def parse_id(text):
+    """
+    Parse an ID received from a client.
+    Returns None if the text is not a valid ID so callers can reply with an error.
+    """
+    try:
+        value = int(text)
+    except (TypeError, ValueError):
+        return None
+    if not 0 < value <= MAX_ID:
+        return None
+    return value
+
+
+def intern_name(name):
+    """Intern a client name so every map keyed by it shares one string object."""
+    return sys.intern(name)
@@ -0,0 +1,108 @@
+from threading import Lock
+from itemIndex import ItemIndex, item_key
+from negotiationPolicy import NegotiationPolicy
+
+
+class CatalogEntry:
+    __slots__ = ("seller", "item_name", "price", "quantity", "policy")
+
+    def __init__(self, seller, item_name, price, quantity, min_price=None):
+        self.seller = seller
+        self.item_name = item_name
+        self.price = price
+        self.quantity = quantity
+        # A minimum price lets the server accept lower max prices without asking the seller
+        self.policy = NegotiationPolicy(accept_above=min_price) if min_price is not None else None
+
+
+class InventoryCatalog:
+    """
+    Standing seller inventory indexed by normalised item name, so searches can be
+    answered from memory instead of broadcasting SEARCH and waiting for offers.
+    Names that do not match exactly fall back to a fuzzy lookup of the listed items.
+    """
+
+    def __init__(self):
+        self._entries = {}  # item key -> {seller: CatalogEntry}
+        self._index = ItemIndex()  # Fuzzy lookup over the item keys listed
+        self._lock = Lock()
+
+    def update(self, seller, item_name, price, quantity, min_price=None):
+        """Add or replace a seller's listing; a quantity of 0 removes it."""
+        key = item_key(item_name)
+        with self._lock:
+            listings = self._entries.get(key)
+            if quantity > 0:
+                if listings is None:
+                    listings = self._entries[key] = {}
+                    self._index.add(key, item_name)
+                listings[seller] = CatalogEntry(seller, item_name, price, quantity, min_price)
+            elif listings is not None:
+                listings.pop(seller, None)
+                if not listings:
+                    self._drop(key)
+
+    def remove_seller(self, seller):
+        """Drop every listing of a seller (e.g. on DE-REGISTER)."""
+        with self._lock:
+            for key in list(self._entries):
+                listings = self._entries[key]
+                listings.pop(seller, None)
+                if not listings:
+                    self._drop(key)
+
+    def _drop(self, key):
+        del self._entries[key]
+        self._index.remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def match(self, item_name, exclude=None):
+        """
+        Return every listing of the item with stock left, cheapest first, skipping
+        the seller named exclude (the buyer). When no listing has the exact item,
+        the best-ranked similar item with stock is used.
+        """
+        with self._lock:
+            matches = self._available(item_key(item_name), exclude)
+            if not matches:
+                for key, _ in self._index.search(item_name, limit=5):
+                    matches = self._available(key, exclude)
+                    if matches:
+                        break
+        matches.sort(key=lambda entry: entry.price)
+        return matches
+
+    def _available(self, key, exclude):
+        return [entry for entry in self._entries.get(key, {}).values()
+                if entry.quantity > 0 and entry.seller != exclude]
+
+    def consume(self, seller, item_name, quantity=1):
+        """Take sold units out of stock. Returns False if the seller no longer has them."""
+        with self._lock:
+            entry = self._entries.get(item_key(item_name), {}).get(seller)
+            if not entry or entry.quantity < quantity:
+                return False
+            entry.quantity -= quantity
+            return True
+
+    def release(self, seller, item_name, quantity=1):
+        """Put units taken by consume() back in stock after a failed transaction."""
+        with self._lock:
+            entry = self._entries.get(item_key(item_name), {}).get(seller)
+            if entry:
+                entry.quantity += quantity
+
+    def listings(self):
+        """Every listing as (seller, item_name, price, quantity, min_price), for a state handoff."""
+        with self._lock:
+            return [(entry.seller, entry.item_name, entry.price, entry.quantity,
+                     entry.policy.accept_above if entry.policy else None)
+                    for listings in self._entries.values() for entry in listings.values()]
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(listings) for listings in self._entries.values())
@@ -0,0 +1,148 @@
+import math
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+from threading import Lock
+
+_SEPARATORS = re.compile(r"[^0-9a-z]+")
+_LETTER_DIGIT = re.compile(r"(?<=[a-z])(?=[0-9])|(?<=[0-9])(?=[a-z])")
+
+MAX_POSTINGS = 50000  # Tokens shared by more items than this are too common to propose candidates
+MIN_OVERLAP = 0.25  # Candidates must share at least this fraction of the query's trigrams
+SHORTLIST = 200  # Candidates with the most posting hits that get an exact similarity score
+RERANK = 50  # Best trigram candidates re-scored with edit-distance similarity
+
+
+def normalize(text):
+    """Lowercase, drop punctuation and split letters from digits: "iPhone13-Pro" -> "iphone 13 pro"."""
+    text = _SEPARATORS.sub(" ", text.lower())
+    return _LETTER_DIGIT.sub(" ", text).strip()
+
+
+def tokenize(text):
+    return normalize(text).split()
+
+
+def item_key(text):
+    """Canonical key for exact matching: "iPhone 13", "iphone13" and "IPHONE_13" share one key."""
+    return "".join(tokenize(text))
+
+
+def trigrams(text):
+    """Character trigrams of the item key, padded so short names still get some."""
+    padded = f"${item_key(text)}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ItemIndex:
+    """
+    Inverted index over item names (and optional descriptions) for fuzzy lookup.
+    Exact keys are answered from a dict; otherwise candidates come from token and
+    trigram postings (prefix-filtered, rarest trigrams first), the ones with the
+    most hits are scored by trigram similarity plus token overlap and the best
+    re-ranked by edit distance so transpositions such as "iphnoe" still match.
+    """
+
+    def __init__(self):
+        self._docs = {}  # doc_id -> (key, trigrams, tokens)
+        self._by_key = {}  # key -> set of doc_ids
+        self._token_postings = {}  # token -> set of doc_ids
+        self._trigram_postings = {}  # trigram -> set of doc_ids
+        self._lock = Lock()
+
+    def add(self, doc_id, name, description=""):
+        """Index a document under its item name; description tokens only help ranking."""
+        key = item_key(name)
+        grams = trigrams(name)
+        tokens = set(tokenize(name)) | set(tokenize(description))
+        with self._lock:
+            if doc_id in self._docs:
+                self._remove(doc_id)
+            self._docs[doc_id] = (key, grams, tokens)
+            self._by_key.setdefault(key, set()).add(doc_id)
+            for token in tokens:
+                self._token_postings.setdefault(token, set()).add(doc_id)
+            for gram in grams:
+                self._trigram_postings.setdefault(gram, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        entry = self._docs.pop(doc_id, None)
+        if not entry:
+            return
+        key, grams, tokens = entry
+        self._discard(self._by_key, key, doc_id)
+        for token in tokens:
+            self._discard(self._token_postings, token, doc_id)
+        for gram in grams:
+            self._discard(self._trigram_postings, gram, doc_id)
+
+    @staticmethod
+    def _discard(postings, term, doc_id):
+        docs = postings.get(term)
+        if docs is not None:
+            docs.discard(doc_id)
+            if not docs:
+                del postings[term]
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._by_key.clear()
+            self._token_postings.clear()
+            self._trigram_postings.clear()
+
+    def exact(self, name):
+        """Doc ids whose item key equals the key of name."""
+        with self._lock:
+            return set(self._by_key.get(item_key(name), ()))
+
+    def search(self, query, limit=10, min_score=0.6):
+        """
+        Return up to limit (doc_id, score) pairs ranked best first. Exact key
+        matches score 1.0 and short-circuit the fuzzy lookup.
+        """
+        with self._lock:
+            exact = self._by_key.get(item_key(query))
+            if exact:
+                return [(doc_id, 1.0) for doc_id in list(exact)[:limit]]
+
+            query_key = item_key(query)
+            query_grams = trigrams(query)
+            query_tokens = set(tokenize(query))
+
+            # Any doc sharing min_shared trigrams appears in one of the rarest
+            # len - min_shared + 1 posting lists, so the common ones can be skipped
+            min_shared = max(1, math.ceil(MIN_OVERLAP * len(query_grams)))
+            postings = sorted((self._trigram_postings.get(gram, ()) for gram in query_grams), key=len)
+            hits = Counter()
+            for docs in postings[:len(postings) - min_shared + 1]:
+                hits.update(docs)
+            for token in query_tokens:
+                docs = self._token_postings.get(token, ())
+                if len(docs) <= MAX_POSTINGS:
+                    hits.update(docs)
+
+            scored = []
+            for doc_id, _ in hits.most_common(SHORTLIST):
+                key, grams, tokens = self._docs[doc_id]
+                shared = len(query_grams & grams)
+                score = shared / (len(query_grams) + len(grams) - shared)
+                if query_tokens:
+                    score = 0.8 * score + 0.2 * len(query_tokens & tokens) / len(query_tokens)
+                scored.append((score, doc_id, key))
+
+        scored.sort(reverse=True)
+        ranked = []
+        for score, doc_id, key in scored[:RERANK]:
+            score = max(score, SequenceMatcher(None, query_key, key).ratio())
+            if score >= min_score:
+                ranked.append((doc_id, score))
+        ranked.sort(key=lambda hit: hit[1], reverse=True)
+        return ranked[:limit]
+
+    def __len__(self):
+        return len(self._docs)
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from threading import Lock
+
+HEARTBEAT_INTERVAL = 5  # Seconds between a client's PINGs
+HEARTBEAT_TIMEOUT = 15  # Seconds without a PING before a client is dead: three missed heartbeats
+WHEEL_TICK = 1.0  # Seconds per timer wheel slot; expiry happens up to one tick late
+
+
+class LivenessIndex:
+    """
+    Last heartbeat of every registered client, expired with a timer wheel.
+
+    The wheel has one slot per tick of the timeout (plus slack); a client sits
+    in the slot of the tick its deadline falls in, and a heartbeat moves it to
+    the slot `timeout` ahead. Heartbeats and expiry are O(1) per client: every
+    tick the wheel thread empties one slot instead of scanning every client.
+    Expired clients are dropped and reported to on_expire(name).
+
+    alive() checks the heartbeat time itself, so a dead client is skipped as
+    soon as its deadline passes, even before the wheel reaches its slot.
+    """
+
+    def __init__(self, timeout=HEARTBEAT_TIMEOUT, tick=WHEEL_TICK, on_expire=None):
+        self.timeout = timeout
+        self.tick = tick
+        self.on_expire = on_expire
+        self._slots = [set() for _ in range(int(timeout / tick) + 2)]
+        self._slot_of = {}  # name -> index of the slot holding it
+        self._last_seen = {}  # name -> monotonic time of its last heartbeat
+        self._lock = Lock()
+        self._cursor = int(time.monotonic() / tick)  # Next tick to empty
+        self._stopped = threading.Event()
+        self._thread = None
+        self.heartbeats = 0
+        self.expired = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._turn, name="liveness", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def touch(self, name, now=None):
+        """Record a heartbeat (or a registration) from name."""
+        now = time.monotonic() if now is None else now
+        slot = int((now + self.timeout) / self.tick) % len(self._slots)
+        with self._lock:
+            old = self._slot_of.get(name)
+            if old != slot:
+                if old is not None:
+                    self._slots[old].discard(name)
+                self._slots[slot].add(name)
+                self._slot_of[name] = slot
+            self._last_seen[name] = now
+            self.heartbeats += 1
+
+    def forget(self, name):
+        """Stop tracking a client that de-registered."""
+        with self._lock:
+            slot = self._slot_of.pop(name, None)
+            if slot is not None:
+                self._slots[slot].discard(name)
+                del self._last_seen[name]
+
+    def alive(self, name, now=None):
+        seen = self._last_seen.get(name)
+        return seen is not None and (time.monotonic() if now is None else now) - seen < self.timeout
+
+    def advance(self, now=None):
+        """Empty the slots of every tick that has fully passed. Returns the expired names."""
+        now = time.monotonic() if now is None else now
+        end = int(now / self.tick)
+        expired = []
+        with self._lock:
+            # Slots repeat every len(self._slots) ticks, so a long pause empties each slot once
+            for tick in range(max(self._cursor, end - len(self._slots)), end):
+                slot = self._slots[tick % len(self._slots)]
+                for name in list(slot):
+                    if now - self._last_seen[name] >= self.timeout:
+                        slot.discard(name)
+                        del self._slot_of[name]
+                        del self._last_seen[name]
+                        expired.append(name)
+            self._cursor = max(self._cursor, end)
+            self.expired += len(expired)
+        for name in expired:
+            if self.on_expire:
+                try:
+                    self.on_expire(name)
+                except Exception as e:
+                    logging.error(f"Error expiring client {name}: {e}")
+        return expired
+
+    def _turn(self):
+        while not self._stopped.wait(self.tick):
+            self.advance()
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def clear(self):
+        with self._lock:
+            for slot in self._slots:
+                slot.clear()
+            self._slot_of.clear()
+            self._last_seen.clear()
+
+    def describe(self):
+        return [f"clients_tracked {len(self)}", f"heartbeats {self.heartbeats}", f"clients_expired {self.expired}"]
@@ -0,0 +1,562 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from threading import Lock
+from classes.registration import Register, DeRegister, Ping
+from classes.searching import (
+    LookingFor, Offer, Accept, Refuse, Cancel, Buy, LookingForBatch, OfferBatch, Inventory, Quote,
+)
+from classes.finalize import InformRes
+
+SERVER_IP = '127.0.0.1'
+SERVER_PORT = 5005
+SERVER_MAX_DATAGRAM = 65507  # Largest message the server accepts in one datagram (server2.MAX_DATAGRAM)
+MAX_DATAGRAM = 65507  # Largest UDP payload over IPv4
+HEARTBEAT_INTERVAL = 5  # Seconds between PINGs; the server expires clients after liveness.HEARTBEAT_TIMEOUT
+
+# Replies each command can be answered with
+RESPONSE_TYPES = {
+    "REGISTER": ("REGISTERED", "REGISTER-DENIED", "ERROR"),
+    "DE-REGISTER": ("DE-REGISTERED", "DE-REGISTER-DENIED", "ERROR"),
+    "LOOKING_FOR": ("FOUND", "NOT_AVAILABLE", "ERROR"),
+    "LOOKING_FOR_BATCH": ("BATCH_RESULT", "ERROR"),
+    "OFFER_BATCH": ("BATCH_RESULT", "ERROR"),
+    "INVENTORY": ("BATCH_RESULT", "ERROR"),
+    "QUOTE": ("QUOTE_RES", "ERROR"),
+    "BUY": ("TRANSACTION_SUCCESS", "CANCEL", "ERROR"),
+    "CANCEL": ("CANCELED", "ERROR"),
+    "RESET": ("SERVER", "ERROR"),
+    "PING": ("PONG",),
+}
+
+# Replies that do not echo the client's RQ#; they resolve the oldest request expecting them.
+# ERROR echoes the RQ# of the failed request, except for OFFER / ACCEPT / REFUSE, which nothing waits on.
+UNCORRELATED_TYPES = {"REGISTERED", "SERVER"}
+
+
+def message_type(parts):
+    """Return the message type of a split message ("ERROR:" is reported as "ERROR")."""
+    return parts[0].rstrip(":") if parts else ""
+
+
+class _PendingRequest:
+    __slots__ = ("rq", "expects", "future", "deadline")
+
+    def __init__(self, rq, expects, future, deadline):
+        self.rq = rq
+        self.expects = expects
+        self.future = future
+        self.deadline = deadline
+
+
+class _ClientCore:
+    """
+    Protocol logic shared by the sync and asyncio clients: request building,
+    correlation of replies by RQ# and notification callbacks.
+    Subclasses provide the transport and the future implementation.
+    """
+
+    def __init__(self, name=None, server_ip=SERVER_IP, server_port=SERVER_PORT,
+                 host='127.0.0.1', default_timeout=60, server_max_datagram=SERVER_MAX_DATAGRAM,
+                 heartbeat_interval=HEARTBEAT_INTERVAL):
+        self.name = name
+        self.server_address = (server_ip, server_port)
+        self.host = host
+        self.default_timeout = default_timeout
+        self.server_max_datagram = server_max_datagram
+        self.heartbeat_interval = heartbeat_interval  # Seconds between PINGs while registered, None to disable
+        self.registered = False  # Set by REGISTERED, cleared by DE-REGISTERED and RESET
+        self.udp_port = None
+        self.tcp_port = None
+        self.inform_handler = None  # Returns (cc_number, cc_exp_date, address) for INFORM_REQ
+        self._callbacks = {}
+        self._pending = {}  # token -> _PendingRequest, oldest first
+        self._pending_by_rq = {}  # rq -> [token, ...]
+        self._pending_lock = Lock()
+        self._tokens = itertools.count()
+        self._rq_counter = itertools.count(1)
+
+    def next_rq(self):
+        """Allocate a client-side RQ#."""
+        return str(next(self._rq_counter))
+
+    def on(self, message_type, callback):
+        """Register a callback invoked with the split message for every notification of a type."""
+        self._callbacks.setdefault(message_type, []).append(callback)
+
+    # Requests
+
+    def register(self, name=None, rq=None, timeout=None):
+        """Send REGISTER; the future resolves with REGISTERED or REGISTER-DENIED."""
+        if name:
+            self.name = name
+        rq = rq or self.next_rq()
+        request = Register(rq, self.name, self.host, self.udp_port, self.tcp_port)
+        future = self._request(request, rq, timeout)
+        future.add_done_callback(lambda f: self._set_registered(f, "REGISTERED", True))
+        return future
+
+    def deregister(self, rq=None, timeout=None):
+        """Send DE-REGISTER; the future resolves with DE-REGISTERED or DE-REGISTER-DENIED."""
+        rq = rq or self.next_rq()
+        future = self._request(DeRegister(rq, self.name), rq, timeout)
+        future.add_done_callback(lambda f: self._set_registered(f, "DE-REGISTERED", False))
+        return future
+
+    def ping(self, rq=None, timeout=None):
+        """Send PING; the future resolves with PONG ALIVE, or PONG UNKNOWN if the server dropped this client."""
+        rq = rq or self.next_rq()
+        return self._request(Ping(rq, self.name), rq, timeout)
+
+    def look_for(self, item_name, item_description, max_price, rq=None, timeout=None):
+        """Send LOOKING_FOR; the future resolves with the FOUND or NOT_AVAILABLE that ends the search."""
+        rq = rq or self.next_rq()
+        request = LookingFor(rq, self.name, item_name, item_description, max_price)
+        return self._request(request, rq, timeout)
+
+    def look_for_batch(self, entries, rq=None, timeout=None):
+        """
+        Send LOOKING_FOR_BATCH for (item_name, item_description, max_price) entries.
+        Returns the future for the BATCH_RESULT (search RQ# per entry) and one future
+        per entry resolving with that entry's FOUND or NOT_AVAILABLE.
+        """
+        rq = rq or self.next_rq()
+        request = LookingForBatch(rq, self.name, *(':'.join(str(f) for f in entry) for entry in entries))
+        self._check_size(str(request))
+        expected = [self._expect(f"{rq}.{index}", "LOOKING_FOR", timeout, with_token=True)
+                    for index in range(len(entries))]
+        batch_future = self._request(request, rq, timeout)
+        batch_future.add_done_callback(lambda future: self._fail_rejected_entries(future, expected))
+        return batch_future, [future for future, _ in expected]
+
+    def offer_batch(self, entries, rq=None, timeout=None):
+        """
+        Send OFFER_BATCH for (search_rq, item_name, price) or
+        (search_rq, item_name, price, accept_above) entries.
+        The future resolves with the BATCH_RESULT holding one result per entry.
+        """
+        rq = rq or self.next_rq()
+        request = OfferBatch(rq, self.name, *(':'.join(str(f) for f in entry) for entry in entries))
+        return self._request(request, rq, timeout)
+
+    def inventory(self, entries, rq=None, timeout=None):
+        """
+        Upload standing inventory as (item_name, price, quantity) or
+        (item_name, price, quantity, min_price) entries; quantity 0 withdraws a listing.
+        The future resolves with the BATCH_RESULT holding one result per entry.
+        """
+        rq = rq or self.next_rq()
+        request = Inventory(rq, self.name, *(':'.join(str(f) for f in entry) for entry in entries))
+        return self._request(request, rq, timeout)
+
+    def quote(self, item_names, rq=None, timeout=None):
+        """
+        Send QUOTE for one or more items; the future resolves with the QUOTE_RES
+        (item:offers:p25:p50:p75:trades:vwap per item).
+        """
+        rq = rq or self.next_rq()
+        return self._request(Quote(rq, *item_names), rq, timeout)
+
+    def offer(self, search_rq, item_name, price, accept_above=None, counter=None):
+        """
+        Send an OFFER for a SEARCH. accept_above / counter attach a hidden negotiation
+        policy the server applies instead of sending NEGOTIATE. The server only
+        replies on error, so nothing is awaited.
+        """
+        terms = []
+        if accept_above is not None:
+            terms.append(f"accept_above={accept_above}")
+        if counter is not None:
+            terms.append(f"counter={counter}")
+        self._send(str(Offer(search_rq, self.name, item_name, price, *terms)))
+
+    def accept(self, rq, item_name, max_price):
+        """Accept a NEGOTIATE request (fire and forget)."""
+        self._send(str(Accept(rq, item_name, max_price)))
+
+    def refuse(self, rq, item_name, max_price):
+        """Refuse a NEGOTIATE request (fire and forget)."""
+        self._send(str(Refuse(rq, item_name, max_price)))
+
+    def buy(self, rq, item_name, price, timeout=None):
+        """Send BUY; the future resolves with TRANSACTION_SUCCESS or CANCEL."""
+        return self._request(Buy(rq, item_name, price), rq, timeout)
+
+    def cancel(self, rq, item_name, price, timeout=None):
+        """Send CANCEL; the future resolves with the server's reply."""
+        return self._request(Cancel(rq, item_name, price), rq, timeout)
+
+    def reset(self, timeout=None):
+        """Send RESET; the future resolves with SERVER RESET SUCCESS."""
+        future = self._request("RESET", None, timeout, command="RESET")
+        future.add_done_callback(lambda f: self._set_registered(f, "SERVER", False))
+        return future
+
+    def _set_registered(self, future, reply, registered):
+        if not future.cancelled() and not future.exception() and future.result().startswith(reply):
+            self.registered = registered
+
+    # Heartbeats
+
+    def _heartbeat(self):
+        """Send one PING while registered, so the server does not expire this client."""
+        if self.registered:
+            self.ping(timeout=self.heartbeat_interval).add_done_callback(self._heartbeat_done)
+
+    def _heartbeat_done(self, future):
+        if future.cancelled() or future.exception() or not self.registered:
+            return  # A lost PING is covered by the next ones
+        if future.result().split()[-1] == "UNKNOWN":
+            # Expired, e.g. after a network outage longer than the heartbeat timeout
+            logging.warning(f"The server no longer knows {self.name}; registering again")
+            self.registered = False
+            self.register()
+
+    def _request(self, request, rq, timeout, command=None):
+        """Send a command and return a future for its reply."""
+        message = str(request)
+        self._check_size(message)
+        future, token = self._expect(rq, command or request.TYPE, timeout, with_token=True)
+        try:
+            self._send(message)
+        except Exception as e:
+            self._fail(token, e)
+        return future
+
+    def _fail_rejected_entries(self, batch_future, expected):
+        """Fail the futures of batch entries the server rejected (or of every entry if the batch failed)."""
+        if (batch_future.cancelled() or batch_future.exception()
+                or not batch_future.result().startswith("BATCH_RESULT")):
+            results = ["ERROR:batch_failed"] * len(expected)
+        else:
+            results = batch_future.result().split()[2:]
+        for (_, token), result in zip(expected, results):
+            if result.startswith("ERROR"):
+                self._fail(token, RuntimeError(result))
+
+    def _check_size(self, message):
+        if len(message.encode('utf-8')) > self.server_max_datagram:
+            raise ValueError(f"Message exceeds the server's {self.server_max_datagram}-byte datagram limit")
+
+    def _expect(self, rq, command, timeout, with_token=False):
+        """Register a future for a reply to command carrying rq."""
+        timeout = self.default_timeout if timeout is None else timeout
+        future = self._new_future()
+        pending = _PendingRequest(rq, RESPONSE_TYPES[command], future, time.monotonic() + timeout)
+        token = next(self._tokens)
+        with self._pending_lock:
+            self._pending[token] = pending
+            self._pending_by_rq.setdefault(rq, []).append(token)
+        self._schedule_timeout(token, timeout)
+        return (future, token) if with_token else future
+
+    # Incoming messages
+
+    def _route_datagram(self, data):
+        """The server may coalesce several notifications into one datagram, one per line."""
+        for message in data.decode('utf-8').split("\n"):
+            self._route(message)
+
+    def _route(self, message):
+        """Resolve the request a message answers and dispatch it to the notification callbacks."""
+        parts = message.split()
+        if not parts:
+            return
+        kind = message_type(parts)
+        pending = self._match(kind, parts)
+        if pending:
+            self._set_result(pending.future, message)
+        for callback in self._callbacks.get(kind, ()):
+            try:
+                callback(parts)
+            except Exception as e:
+                logging.error(f"Error in {kind} callback: {e}")
+
+    def _match(self, kind, parts):
+        """Pop the pending request answered by a message, if any."""
+        with self._pending_lock:
+            token = None
+            if len(parts) > 1:
+                for candidate in self._pending_by_rq.get(parts[1], ()):
+                    if kind in self._pending[candidate].expects:
+                        token = candidate
+                        break
+            if token is None and kind in UNCORRELATED_TYPES:
+                for candidate, pending in self._pending.items():
+                    if kind in pending.expects:
+                        token = candidate
+                        break
+            if token is None:
+                return None
+            return self._pop(token)
+
+    def _pop(self, token):
+        pending = self._pending.pop(token, None)
+        if pending:
+            tokens = self._pending_by_rq[pending.rq]
+            tokens.remove(token)
+            if not tokens:
+                del self._pending_by_rq[pending.rq]
+        return pending
+
+    def _fail(self, token, error):
+        with self._pending_lock:
+            pending = self._pop(token)
+        if pending:
+            self._set_exception(pending.future, error)
+
+    def _expire(self, token):
+        self._fail(token, TimeoutError("No response from server"))
+
+    def _inform_response(self, parts):
+        """Build the INFORM_RES reply for an INFORM_REQ using the inform handler."""
+        if not self.inform_handler:
+            logging.warning("INFORM_REQ received but no inform handler is set.")
+            return None
+        details = self.inform_handler(parts)
+        if not details:
+            return None
+        rq = parts[1] if len(parts) > 3 and parts[1].isdigit() else "1"
+        cc_number, cc_exp_date, address = details
+        return str(InformRes(rq, self.name, cc_number, cc_exp_date, address))
+
+
+class MarketClient(_ClientCore):
+    """
+    Thread-based marketplace client. One UDP socket carries requests, replies
+    and notifications; many requests can be in flight at once, each with its
+    own concurrent.futures.Future and timeout.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.udp_socket = None
+        self.tcp_server_socket = None
+        self.running = False
+        self._timeouts = []  # heap of (deadline, token)
+        self._timeouts_cond = threading.Condition()
+        self._threads = []
+        self._closing = threading.Event()  # Wakes the heartbeat thread on close()
+
+    def start(self):
+        """Bind the UDP and TCP sockets and start the receiver threads."""
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_socket.bind((self.host, 0))  # OS chooses an available port
+        self.udp_port = self.udp_socket.getsockname()[1]
+
+        self.tcp_server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp_server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.tcp_server_socket.bind((self.host, 0))
+        self.tcp_port = self.tcp_server_socket.getsockname()[1]
+        self.tcp_server_socket.listen(5)
+
+        self.running = True
+        targets = [self._receive_udp, self._accept_tcp, self._expire_requests]
+        if self.heartbeat_interval:
+            targets.append(self._send_heartbeats)
+        for target in targets:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def close(self):
+        """Stop the receiver threads and close the sockets."""
+        if not self.running:
+            return
+        self.running = False
+        self._closing.set()
+        try:
+            # Wake the blocking recvfrom with an empty datagram
+            self.udp_socket.sendto(b"", (self.host, self.udp_port))
+        except OSError:
+            pass
+        try:
+            self.tcp_server_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        with self._timeouts_cond:
+            self._timeouts_cond.notify()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self.udp_socket.close()
+        self.tcp_server_socket.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _new_future(self):
+        return Future()
+
+    def _set_result(self, future, result):
+        if not future.done():
+            future.set_result(result)
+
+    def _set_exception(self, future, error):
+        if not future.done():
+            future.set_exception(error)
+
+    def _send(self, message):
+        self.udp_socket.sendto(message.encode('utf-8'), self.server_address)
+
+    def _schedule_timeout(self, token, timeout):
+        with self._timeouts_cond:
+            heapq.heappush(self._timeouts, (time.monotonic() + timeout, token))
+            self._timeouts_cond.notify()
+
+    def _expire_requests(self):
+        """Fail requests whose deadline passed; sleeps until the next deadline."""
+        with self._timeouts_cond:
+            while self.running:
+                now = time.monotonic()
+                while self._timeouts and self._timeouts[0][0] <= now:
+                    _, token = heapq.heappop(self._timeouts)
+                    self._expire(token)
+                wait = self._timeouts[0][0] - now if self._timeouts else None
+                self._timeouts_cond.wait(wait)
+
+    def _send_heartbeats(self):
+        while not self._closing.wait(self.heartbeat_interval):
+            self._heartbeat()
+
+    def _receive_udp(self):
+        while self.running:
+            try:
+                message, _ = self.udp_socket.recvfrom(MAX_DATAGRAM)
+            except OSError as e:
+                if self.running:
+                    logging.error(f"Error receiving UDP message: {e}")
+                break
+            if message:
+                self._route_datagram(message)
+
+    def _accept_tcp(self):
+        while self.running:
+            try:
+                conn, addr = self.tcp_server_socket.accept()
+            except OSError as e:
+                if self.running:
+                    logging.error(f"Error accepting TCP connection: {e}")
+                break
+            threading.Thread(target=self._handle_tcp, args=(conn,), daemon=True).start()
+
+    def _handle_tcp(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv(MAX_DATAGRAM).decode('utf-8')
+                except OSError:
+                    break
+                if not message:
+                    break
+                parts = message.split()
+                if parts and parts[0] == "INFORM_REQ":
+                    response = self._inform_response(parts)
+                    if response:
+                        conn.sendall(response.encode('utf-8'))
+                else:
+                    self._route(message)
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        if data:
+            self.client._route_datagram(data)
+
+    def error_received(self, exc):
+        logging.error(f"Error receiving UDP message: {exc}")
+
+
+class AsyncMarketClient(_ClientCore):
+    """
+    asyncio marketplace client with the same API as MarketClient; request
+    methods return asyncio futures that can be awaited or gathered.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop = None
+        self.transport = None
+        self.tcp_server = None
+        self._heartbeats = None  # Task sending PINGs
+
+    async def start(self):
+        """Open the UDP endpoint and the TCP listener."""
+        self.loop = asyncio.get_running_loop()
+        self.transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self), local_addr=(self.host, 0)
+        )
+        self.udp_port = self.transport.get_extra_info('sockname')[1]
+        self.tcp_server = await asyncio.start_server(self._handle_tcp, self.host, 0)
+        self.tcp_port = self.tcp_server.sockets[0].getsockname()[1]
+        if self.heartbeat_interval:
+            self._heartbeats = self.loop.create_task(self._send_heartbeats())
+        return self
+
+    async def close(self):
+        """Close the transports."""
+        if self._heartbeats:
+            self._heartbeats.cancel()
+        if self.transport:
+            self.transport.close()
+        if self.tcp_server:
+            self.tcp_server.close()
+            await self.tcp_server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _new_future(self):
+        return self.loop.create_future()
+
+    def _set_result(self, future, result):
+        if not future.done():
+            future.set_result(result)
+
+    def _set_exception(self, future, error):
+        if not future.done():
+            future.set_exception(error)
+
+    def _send(self, message):
+        self.transport.sendto(message.encode('utf-8'), self.server_address)
+
+    def _schedule_timeout(self, token, timeout):
+        self.loop.call_later(timeout, self._expire, token)
+
+    async def _send_heartbeats(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            self._heartbeat()
+
+    async def _handle_tcp(self, reader, writer):
+        try:
+            while True:
+                data = await reader.read(MAX_DATAGRAM)
+                if not data:
+                    break
+                message = data.decode('utf-8')
+                parts = message.split()
+                if parts and parts[0] == "INFORM_REQ":
+                    # The inform handler may prompt the user, so keep it off the event loop
+                    response = await self.loop.run_in_executor(None, self._inform_response, parts)
+                    if response:
+                        writer.write(response.encode('utf-8'))
+                        await writer.drain()
+                else:
+                    self._route(message)
+        finally:
+            writer.close()
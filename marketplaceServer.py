@@ -0,0 +1,495 @@
+import logging
+import os
+import socket
+import threading
+import time
+from threading import Lock, Event
+from serverRequest import ServerRequestHandler, OFFER_WINDOW, error_reply
+from idAllocator import IdAllocator
+from inventoryCatalog import InventoryCatalog
+from matchingEngine import MatchingEngine
+from clientRegistry import ClientRegistry
+from adminServer import AdminServer
+from profiler import Profiler
+from tracing import Tracer, TRACE_FILE
+from rateLimiter import RateLimiter, RATE_LIMITS_FILE
+from udpReceiver import UdpReceiver, message_type_of, MAX_DATAGRAM
+from settlement import SettlementQueue, SETTLEMENT_INTERVAL
+from transactionTable import TransactionTable
+from reservationTable import ReservationTable
+from searchPool import SearchPools
+from offerCache import OfferCache, OFFER_TTL
+from coalescer import NotificationCoalescer, COALESCE_WINDOW
+from outboundStage import OutboundStage, MAX_BACKLOG, DROP_OLDEST
+from liveness import LivenessIndex, HEARTBEAT_TIMEOUT
+from classes.registration import Ping, Pong
+import priceStats
+import handoff
+
+SEARCH_TYPES = ("LOOKING_FOR", "LOOKING_FOR_BATCH")
+ERROR_HEAD_BYTES = 64  # Bytes of a rejected datagram decoded to find its RQ#
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server2.py")
+
+
+class MarketplaceServer:
+    """
+    One marketplace server: its sockets, state stores, locks and threads.
+    Several can run in one process on different ports (port 0 picks a free
+    one; the bound ports are available after start()).
+
+        server = MarketplaceServer(udp_port=0, tcp_port=0, admin_port=None).start()
+        ...
+        server.stop()
+    """
+
+    def __init__(self, host="127.0.0.1", udp_port=5005, tcp_port=5006, admin_port=5007,
+                 market_mode="search", offer_window=OFFER_WINDOW, max_datagram=MAX_DATAGRAM,
+                 max_handlers=None, drain_deadline=150, restart_deadline=30,
+                 trace_path=TRACE_FILE, rate_limits_path=RATE_LIMITS_FILE,
+                 payment_processor=None, settlement_interval=SETTLEMENT_INTERVAL,
+                 coalesce_window=COALESCE_WINDOW, max_backlog=MAX_BACKLOG, outbound_policy=DROP_OLDEST,
+                 heartbeat_timeout=HEARTBEAT_TIMEOUT, offer_cache_ttl=OFFER_TTL, handoff_state=None, sockets=None):
+        if market_mode not in ("search", "continuous"):
+            raise ValueError("market_mode must be 'search' or 'continuous'")
+        self.host = host
+        self.udp_port = udp_port
+        self.tcp_port = tcp_port  # Dedicated TCP port for TCP connections
+        self.admin_port = admin_port  # Admin/introspection channel, None to disable
+        self.market_mode = market_mode  # "search": SEARCH broadcast and offer window, "continuous": double auction
+        self.offer_window = offer_window
+        self.max_datagram = max_datagram  # Largest UDP message accepted; longer ones are rejected, not truncated
+        self.max_handlers = max_handlers  # Concurrent request handler threads, None for no limit
+        self.drain_deadline = drain_deadline  # Seconds open offer windows and transactions get to finish
+        self.restart_deadline = restart_deadline  # Seconds in-flight transactions get before a hot restart
+        self.coalesce_window = coalesce_window  # Seconds notifications wait to share a datagram, 0 to disable
+        self.max_backlog = max_backlog  # Datagrams queued per client before outbound_policy applies
+        self.outbound_policy = outbound_policy  # "drop_oldest", or "disconnect" to evict the client
+        self.heartbeat_timeout = heartbeat_timeout  # Seconds without a PING before a client is evicted, None to disable
+        self.successor_args = []  # Command line options a hot-restarted successor is started with
+
+        self.running = False
+        self.draining = Event()  # New searches are refused while open ones finish
+        self.intake_paused = Event()  # Hot restart in progress: leave datagrams queued for the successor
+        self.handed_off = Event()  # A successor process owns the open searches
+        self.stopped = Event()
+
+        # In-memory data storage with locks
+        self.registered_clients = ClientRegistry()  # Copy-on-write snapshots of registered clients
+        self.ongoing_requests = {}  # Tracks ongoing item requests
+        self.offers_by_rq = {}  # Tracks offers by request number
+        self.transactions = TransactionTable()  # Open searches and their transaction states
+        # Offers claimed by a BUY in progress, and sold ones for as long as a cached copy may be served
+        self.reservations = ReservationTable(offer_cache_ttl or OFFER_TTL)
+        self.search_pools = SearchPools()  # Concurrent searches for one item sharing a SEARCH broadcast
+        # Recent offers nobody took, answering repeat searches at once; not handed over on a hot restart
+        self.offer_cache = OfferCache(offer_cache_ttl) if offer_cache_ttl else None
+        # Last heartbeat per client; silent clients are skipped, then evicted
+        self.liveness = LivenessIndex(heartbeat_timeout, on_expire=self.expire_client) if heartbeat_timeout else None
+        self.requests_lock = Lock()
+        self.offers_lock = Lock()
+
+        # Shared source of search, offer, transaction and registration IDs
+        self.id_allocator = IdAllocator(handoff_state["next_id"] if handoff_state else 1)
+        self.catalog = InventoryCatalog()  # Standing seller inventory used to answer searches immediately
+        self.engine = MatchingEngine(self.id_allocator) if market_mode == "continuous" else None
+        self.price_stats = priceStats.PriceStats() if priceStats.AVAILABLE else None  # Needs numpy
+        if not self.price_stats:
+            logging.warning("numpy is not installed; QUOTE is disabled.")
+        self.profiler = Profiler(ServerRequestHandler)  # Idle until PROFILE START on the admin channel
+        self.tracer = Tracer(trace_path, enabled=trace_path is not None)  # Per-search timelines
+        self.rate_limiter = RateLimiter(rate_limits_path)  # Per-client and global token buckets
+        # Batched payment stage; defaults to the local SimulatedProcessor
+        self.settlement = SettlementQueue(payment_processor, settlement_interval)
+
+        self._handlers = set()  # Running ServerRequestHandler threads
+        self._handlers_lock = Lock()
+        self._threads = []
+        self._stop_lock = Lock()
+        self._handoff_state = handoff_state
+        self.udp_socket = self.tcp_socket = self.admin_socket = None
+        if sockets:
+            self.udp_socket, self.tcp_socket, *rest = sockets
+            self.admin_socket = rest[0] if rest else None
+        self.udp_receiver = None
+        self.coalescer = None
+        self.outbound = None
+        self.admin = None
+
+    def start(self):
+        """Bind (or adopt) the sockets and start the UDP, TCP and admin threads."""
+        if self.udp_socket is None:
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.bind((self.host, self.udp_port))
+
+            self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Allow port reuse
+            self.tcp_socket.bind((self.host, self.tcp_port))
+            self.tcp_socket.listen(5)  # Maximum 5 simultaneous TCP connections
+
+            if self.admin_port is not None:
+                self.admin_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.admin_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                self.admin_socket.bind((self.host, self.admin_port))
+                self.admin_socket.listen(5)
+        else:
+            logging.info("Took over the listening sockets of the previous server process")
+
+        # Ports given as 0 are now known
+        self.udp_port = self.udp_socket.getsockname()[1]
+        self.tcp_port = self.tcp_socket.getsockname()[1]
+        if self.admin_socket:
+            self.admin_port = self.admin_socket.getsockname()[1]
+
+        self.udp_receiver = UdpReceiver(self.udp_socket, self.max_datagram)
+        self.outbound = OutboundStage(self.udp_socket, max_backlog=self.max_backlog, policy=self.outbound_policy,
+                                      on_disconnect=self.evict_client)
+        if self.coalesce_window:
+            self.coalescer = NotificationCoalescer(self.outbound.send_udp, self.coalesce_window)
+        logging.info(f"UDP Server started at {self.host}:{self.udp_port}")
+        logging.info(f"TCP Server listening on {self.host}:{self.tcp_port}")
+
+        if self._handoff_state:
+            self.restore_state(self._handoff_state)
+            self._handoff_state = None
+
+        self.running = True
+        self.settlement.start()
+        if self.liveness is not None:
+            self.liveness.start()
+        self._threads = [threading.Thread(target=self.handle_udp_messages, daemon=True),
+                         threading.Thread(target=self.handle_tcp_connections, daemon=True)]
+        if self.admin_socket:
+            self.admin = AdminServer(self.registered_clients, self.ongoing_requests, self.offers_by_rq,
+                                     self.transactions, self.requests_lock, self.offers_lock,
+                                     self.profiler, self.rate_limiter, self.drain, self.hot_restart,
+                                     settlement=self.settlement, coalescer=self.coalescer, outbound=self.outbound,
+                                     liveness=self.liveness, search_pools=self.search_pools,
+                                     offer_cache=self.offer_cache)
+            self._threads.append(threading.Thread(target=self.admin.serve,
+                                                  args=(self.admin_socket, lambda: self.running), daemon=True))
+            logging.info(f"Admin channel listening on {self.host}:{self.admin_port}")
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop accepting messages, settle queued payments and close the sockets.
+        Running handlers are not waited for.
+        """
+        with self._stop_lock:
+            if self.stopped.is_set():
+                return
+            self.stopped.set()
+        self.running = False
+        if self.liveness is not None:
+            self.liveness.stop()
+        self.settlement.stop()  # Settles what is still queued
+        if self.coalescer:
+            self.coalescer.close()
+        if self.outbound:
+            self.outbound.close()  # Sends what is still queued
+        if self.admin:
+            self.admin.stop()
+        for sock in (self.udp_socket, self.tcp_socket, self.admin_socket):
+            if sock:
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=2)
+        logging.info("Server shutdown initiated.")
+
+    def healthy(self):
+        """False once the UDP or TCP thread has died while the server should be running."""
+        return not self.running or all(thread.is_alive() for thread in self._threads[:2])
+
+    def new_handler(self, message, client_address):
+        """A request handler wired to this server's shared state."""
+        return ServerRequestHandler(
+            message,
+            client_address,
+            self.registered_clients,
+            self.ongoing_requests,
+            self.offers_by_rq,
+            self.udp_socket,
+            self.tcp_port,
+            self.requests_lock,
+            self.offers_lock,
+            id_allocator=self.id_allocator,
+            catalog=self.catalog,
+            engine=self.engine,
+            price_stats=self.price_stats,
+            transactions=self.transactions,
+            profiler=self.profiler,
+            tracer=self.tracer,
+            handed_off=self.handed_off,
+            offer_window=self.offer_window,
+            on_done=self._handler_done,
+            settlement=self.settlement,
+            coalescer=self.coalescer,
+            outbound=self.outbound,
+            reservations=self.reservations,
+            liveness=self.liveness,
+            search_pools=self.search_pools,
+            offer_cache=self.offer_cache,
+        )
+
+    def _handler_done(self, handler):
+        with self._handlers_lock:
+            self._handlers.discard(handler)
+
+    def busy_handlers(self, ignore_types=()):
+        """Request handler threads still running, except those handling ignore_types."""
+        with self._handlers_lock:
+            return [handler for handler in self._handlers
+                    if getattr(handler, "message_type", None) not in ignore_types]
+
+    def handle_tcp_client(self, tcp_client, tcp_address):
+        """Handle individual TCP client connection."""
+        try:
+            handler = self.new_handler(None, tcp_address)  # No UDP message for TCP connections
+            handler.handle_tcp_connection(tcp_client, tcp_address)
+        except Exception as e:
+            logging.error(f"Error handling TCP client {tcp_address}: {e}")
+        finally:
+            tcp_client.close()
+
+    def handle_tcp_connections(self):
+        """Accept and handle incoming TCP connections."""
+        try:
+            while self.running:
+                try:
+                    tcp_client, tcp_address = self.tcp_socket.accept()
+                    logging.info(f"New TCP connection from {tcp_address}")
+
+                    # Create a thread to handle the TCP connection
+                    tcp_thread = threading.Thread(
+                        target=self.handle_tcp_client,
+                        args=(tcp_client, tcp_address),
+                        daemon=True
+                    )
+                    tcp_thread.start()
+
+                except Exception as e:
+                    if self.running:  # Only log if server is supposed to be running
+                        logging.error(f"Error accepting TCP connection: {e}")
+                    break
+        except Exception as e:
+            logging.error(f"TCP server error: {e}")
+        finally:
+            self.tcp_socket.close()
+            logging.info("TCP socket closed.")
+
+    def handle_udp_messages(self):
+        """Handle incoming UDP messages."""
+        try:
+            while self.running:
+                if self.intake_paused.is_set():
+                    time.sleep(0.05)  # Leave datagrams queued for the successor
+                    continue
+                # Wake up at least once a second to check running
+                for view, client_address in self.udp_receiver.receive(timeout=1.0):
+                    try:
+                        self.dispatch_udp_message(view, client_address)
+                    except Exception as e:
+                        if self.running:
+                            logging.error(f"Error handling UDP message: {e}")
+        except Exception as e:
+            if self.running:
+                logging.error(f"UDP server error: {e}")
+        finally:
+            self.udp_receiver.close()
+            self.udp_socket.close()
+            logging.info("UDP socket closed.")
+
+    def dispatch_udp_message(self, view, client_address):
+        """Admit one datagram and start its handler; the view is only valid during this call."""
+        if len(view) > self.max_datagram:
+            self.reply_error(view, f"message too large (max {self.max_datagram} bytes)", client_address)
+            return
+        message_type = message_type_of(view)
+        if not self.rate_limiter.allow(message_type, client_address):
+            # Rejected before a handler thread exists; counted, not logged
+            self.reply_error(view, f"rate_limited {message_type}", client_address)
+            return
+        if message_type == "PING":
+            self.answer_ping(str(view, "utf-8", "replace"), client_address)  # Too cheap for a handler thread
+            return
+        if self.draining.is_set() and message_type in SEARCH_TYPES:
+            self.reply_error(view, "server draining, not accepting new searches", client_address)
+            return
+
+        message = str(view, "utf-8", "replace")  # The only copy of the datagram
+        handler = self.new_handler(message, client_address)
+        with self._handlers_lock:
+            if self.max_handlers is not None and len(self._handlers) >= self.max_handlers:
+                handler = None
+            else:
+                self._handlers.add(handler)
+        if handler is None:
+            self.reply_error(view, "server busy, try again later", client_address)
+            return
+        logging.info(f"Received UDP message from {client_address}: {message}")
+        handler.start()
+
+    def reply(self, message, client_address):
+        self.outbound.send_udp(message.encode("utf-8"), client_address)
+
+    def reply_error(self, view, text, client_address):
+        """Reject a datagram with an ERROR carrying its RQ#; only its first bytes are decoded."""
+        self.reply(error_reply(str(view[:ERROR_HEAD_BYTES], "utf-8", "replace"), text), client_address)
+
+    def answer_ping(self, message, client_address):
+        """
+        Answer a heartbeat: PONG ALIVE if the name is registered at the sending
+        address, PONG UNKNOWN otherwise (e.g. it expired), so the client registers again.
+        """
+        parts = message.split()
+        if len(parts) < 3:
+            self.reply("ERROR: Invalid PING message format.", client_address)
+            return
+        ping = Ping(*parts[1:3])
+        info = self.registered_clients.get(ping.name)
+        known = info is not None and (info["ip"], int(info["udp_socket"])) == client_address
+        if known and self.liveness is not None:
+            self.liveness.touch(ping.name)
+        self.reply(str(Pong(ping.rq, "ALIVE" if known else "UNKNOWN")), client_address)
+
+    def evict_client(self, address):
+        """De-register the client at a UDP address whose outbound backlog overflowed."""
+        for name, info in self.registered_clients.snapshot().items():
+            if (info["ip"], int(info["udp_socket"])) == address:
+                self.remove_client(name, "it is not keeping up with its messages")
+                return
+
+    def expire_client(self, name):
+        """De-register a client whose heartbeats stopped, e.g. one that crashed without DE-REGISTER."""
+        self.remove_client(name, f"no heartbeat for {self.heartbeat_timeout}s")
+
+    def remove_client(self, name, reason):
+        if self.registered_clients.deregister(name):
+            self.catalog.remove_seller(name)
+            self.new_handler(None, None).cancel_participant(name)
+            if self.engine:
+                self.engine.cancel_owner(name)
+            if self.liveness is not None:
+                self.liveness.forget(name)
+            if self.offer_cache is not None:
+                self.offer_cache.remove_seller(name)
+            logging.warning(f"Evicted client {name}: {reason}")
+
+    def capture_state(self):
+        """Everything a successor process needs so clients do not have to register or search again."""
+        with self.requests_lock, self.offers_lock:
+            searches = dict(self.ongoing_requests)
+            offers = {rq: list(rq_offers) for rq, rq_offers in self.offers_by_rq.items()}
+        return {
+            "next_id": self.id_allocator.peek(),
+            "clients": {name: dict(info) for name, info in self.registered_clients.snapshot().items()},
+            "searches": searches,
+            "offers": offers,
+            "transactions": self.transactions.export(),
+            "sold_offers": self.reservations.export(),
+            "catalog": self.catalog.listings(),
+            "orders": self.engine.export_orders() if self.engine else [],
+        }
+
+    def restore_state(self, state):
+        """Load a predecessor's state and resume the searches whose offer window is still open."""
+        for name, info in state["clients"].items():
+            self.registered_clients.register(name, info)
+            if self.liveness is not None:
+                self.liveness.touch(name)  # A full timeout to send the first PING to this process
+        for listing in state["catalog"]:
+            self.catalog.update(*listing)
+        with self.requests_lock, self.offers_lock:
+            self.ongoing_requests.update(state["searches"])
+            self.offers_by_rq.update(state["offers"])
+            self.transactions.restore(state["transactions"])
+        self.reservations.restore(state["sold_offers"])
+        if self.engine:
+            for side, owner, rq, item_name, price, quantity in state["orders"]:
+                submit = self.engine.submit_bid if side == "BID" else self.engine.submit_ask
+                submit(owner, rq, item_name, price, quantity)
+
+        now = time.time()
+        for search_rq, search_request in state["searches"].items():
+            if getattr(search_request, "window_ends", 0) > now and hasattr(search_request, "pool_rq"):
+                self.search_pools.restore(search_rq, search_request.name, search_request.item_name,
+                                          search_request.max_price, search_request.pool_rq, search_request.window_ends)
+        resumed = 0
+        for search_rq, search_request in state["searches"].items():
+            if getattr(search_request, "window_ends", 0) > now:
+                handler = self.new_handler(None, None)
+                handler.message_type = "LOOKING_FOR"  # An open search for drain and hot restart
+                with self._handlers_lock:
+                    self._handlers.add(handler)
+                threading.Thread(target=self._resume_search, args=(handler, search_rq, search_request),
+                                 daemon=True).start()
+                resumed += 1
+        logging.info(f"Restored {len(state['clients'])} clients, {len(state['searches'])} searches "
+                     f"({resumed} still collecting offers) and {len(state['catalog'])} listings")
+
+    def _resume_search(self, handler, search_rq, search_request):
+        try:
+            handler.resume_search(search_rq, search_request)
+        finally:
+            self._handler_done(handler)
+
+    @staticmethod
+    def wait_until(done, deadline):
+        """Poll done() until it is true or deadline seconds pass. Returns done()."""
+        end = time.time() + deadline
+        while not done() and time.time() < end:
+            time.sleep(0.2)
+        return done()
+
+    def drain(self, deadline=None):
+        """Refuse new searches, let open offer windows and transactions finish, then stop."""
+        deadline = self.drain_deadline if deadline is None else deadline
+        if self.draining.is_set():
+            return "ERROR: The server is already draining."
+        self.draining.set()
+        logging.warning(f"Draining: refusing new searches, waiting up to {deadline}s for open requests")
+        if self.wait_until(lambda: not self.busy_handlers() and not self.transactions.in_flight(), deadline):
+            logging.warning("Drained: no open searches or transactions left.")
+        else:
+            logging.warning(f"Drain deadline passed with {len(self.busy_handlers())} handlers and "
+                            f"{len(self.transactions.in_flight())} transactions still running.")
+        self.stop()
+        return "OK drained"
+
+    def hot_restart(self, deadline=None):
+        """
+        Hand the listening sockets and the server state to a new process. Reading
+        stops first, so datagrams and connections queue in the kernel until the
+        successor picks them up. Open searches move to the successor; in-flight
+        transactions and other requests finish here first.
+        """
+        deadline = self.restart_deadline if deadline is None else deadline
+        if self.intake_paused.is_set() or self.draining.is_set():
+            return "ERROR: A restart or drain is already in progress."
+        self.intake_paused.set()
+        logging.warning(f"Hot restart: intake paused, waiting up to {deadline}s for in-flight requests")
+        if not self.wait_until(lambda: not self.busy_handlers(SEARCH_TYPES) and not self.transactions.in_flight(),
+                               deadline):
+            self.intake_paused.clear()
+            return "ERROR: In-flight requests did not finish before the deadline; restart aborted."
+
+        sockets = [sock for sock in (self.udp_socket, self.tcp_socket, self.admin_socket) if sock]
+        try:
+            state_path = handoff.save_state(self.capture_state())
+            successor = handoff.spawn_successor(SERVER_SCRIPT, state_path, sockets, self.successor_args)
+        except Exception as e:
+            self.intake_paused.clear()
+            logging.error(f"Hot restart failed: {e}")
+            return f"ERROR: Hot restart failed: {e}"
+
+        # The successor owns the searches and the sockets from here on
+        self.handed_off.set()
+        logging.warning(f"Hot restart: handed over to process {successor.pid}")
+        threading.Thread(target=self.stop, daemon=True).start()
+        return f"OK handed over to process {successor.pid}"
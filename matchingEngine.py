@@ -0,0 +1,165 @@
+import heapq
+import itertools
+from threading import Lock
+from itemIndex import item_key
+
+BID = "BID"
+ASK = "ASK"
+
+
+class Order:
+    __slots__ = ("order_id", "side", "owner", "rq", "item_name", "price", "quantity", "seq", "active")
+
+    def __init__(self, order_id, side, owner, rq, item_name, price, quantity, seq):
+        self.order_id = order_id
+        self.side = side
+        self.owner = owner
+        self.rq = rq
+        self.item_name = item_name
+        self.price = price
+        self.quantity = quantity
+        self.seq = seq
+        self.active = True
+
+
+class Fill:
+    __slots__ = ("bid", "ask", "price", "quantity")
+
+    def __init__(self, bid, ask, price, quantity):
+        self.bid = bid
+        self.ask = ask
+        self.price = price
+        self.quantity = quantity
+
+
+class OrderBook:
+    """
+    Price-time priority book for one item. Bids are kept in a max-heap and asks
+    in a min-heap; cancelled orders are dropped lazily when they reach the top.
+    Trades execute at the resting order's price.
+    """
+
+    def __init__(self):
+        self.bids = []  # (-price, seq, order)
+        self.asks = []  # (price, seq, order)
+        self.lock = Lock()
+
+    def add(self, order):
+        """Match an incoming order against the opposite side and rest any remainder."""
+        fills = []
+        is_bid = order.side == BID
+        opposite = self.asks if is_bid else self.bids
+
+        while order.quantity and opposite:
+            resting = opposite[0][2]
+            if not resting.active:
+                heapq.heappop(opposite)
+                continue
+            if (resting.price > order.price) if is_bid else (resting.price < order.price):
+                break
+            quantity = min(order.quantity, resting.quantity)
+            order.quantity -= quantity
+            resting.quantity -= quantity
+            if is_bid:
+                fills.append(Fill(order, resting, resting.price, quantity))
+            else:
+                fills.append(Fill(resting, order, resting.price, quantity))
+            if not resting.quantity:
+                resting.active = False
+                heapq.heappop(opposite)
+
+        if order.quantity:
+            if is_bid:
+                heapq.heappush(self.bids, (-order.price, order.seq, order))
+            else:
+                heapq.heappush(self.asks, (order.price, order.seq, order))
+        else:
+            order.active = False
+        return fills
+
+    def best_bid(self):
+        while self.bids and not self.bids[0][2].active:
+            heapq.heappop(self.bids)
+        return self.bids[0][2] if self.bids else None
+
+    def best_ask(self):
+        while self.asks and not self.asks[0][2].active:
+            heapq.heappop(self.asks)
+        return self.asks[0][2] if self.asks else None
+
+
+class MatchingEngine:
+    """
+    Continuous double auction: buyers post bids (LOOKING_FOR with max_price) and
+    sellers post asks (OFFER) into per-item books that match immediately.
+    Each book has its own lock, so different items match in parallel.
+    """
+
+    def __init__(self, id_allocator):
+        self.id_allocator = id_allocator
+        self._books = {}  # item key -> OrderBook
+        self._books_by_name = {}  # raw item name -> OrderBook, skips normalising known names
+        self._orders = {}  # order_id -> Order
+        self._books_lock = Lock()
+        self._seq = itertools.count()
+
+    def _book(self, item_name):
+        book = self._books_by_name.get(item_name)
+        if book is None:
+            with self._books_lock:
+                book = self._books.setdefault(item_key(item_name), OrderBook())
+                self._books_by_name[item_name] = book
+        return book
+
+    def submit_bid(self, owner, rq, item_name, price, quantity=1):
+        return self._submit(BID, owner, rq, item_name, price, quantity)
+
+    def submit_ask(self, owner, rq, item_name, price, quantity=1):
+        return self._submit(ASK, owner, rq, item_name, price, quantity)
+
+    def _submit(self, side, owner, rq, item_name, price, quantity):
+        """Submit an order; returns (order, fills)."""
+        order = Order(self.id_allocator.next_id(), side, owner, rq, item_name,
+                      int(price), int(quantity), next(self._seq))
+        book = self._book(item_name)
+        with book.lock:
+            fills = book.add(order)
+            # Index and unindex with the book change, so cancel never sees one without the other
+            if order.active:
+                self._orders[order.order_id] = order
+            for fill in fills:
+                resting = fill.ask if side == BID else fill.bid
+                if not resting.active:
+                    self._orders.pop(resting.order_id, None)
+        return order, fills
+
+    def cancel(self, order_id):
+        """Withdraw a resting order. Returns False if it already traded or was cancelled."""
+        order = self._orders.pop(order_id, None)
+        if not order:
+            return False
+        with self._book(order.item_name).lock:
+            was_active = order.active
+            order.active = False
+        return was_active
+
+    def cancel_owner(self, owner):
+        """Withdraw every resting order of a client (e.g. on DE-REGISTER)."""
+        for order in [order for order in list(self._orders.values()) if order.owner == owner]:
+            self.cancel(order.order_id)
+
+    def clear(self):
+        with self._books_lock:
+            self._books.clear()
+            self._books_by_name.clear()
+        self._orders.clear()
+
+    def export_orders(self):
+        """Resting orders as (side, owner, rq, item_name, price, quantity), oldest first."""
+        orders = sorted((order for order in list(self._orders.values()) if order.active),
+                        key=lambda order: order.seq)
+        return [(order.side, order.owner, order.rq, order.item_name, order.price, order.quantity)
+                for order in orders]
+
+    def resting_orders(self):
+        return len(self._orders)
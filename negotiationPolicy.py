@@ -0,0 +1,45 @@
+ACCEPT = "ACCEPT"
+COUNTER = "COUNTER"
+REFUSE = "REFUSE"
+
+
+class NegotiationPolicy:
+    """
+    A seller's hidden negotiation rules, attached to an OFFER as key=value terms:
+      accept_above=X (alias floor=X)  accept any buyer max_price >= X
+      counter=Y                       otherwise counter-offer at Y
+    Without a counter price, max prices below the floor are refused.
+    """
+
+    def __init__(self, accept_above=None, counter=None):
+        self.accept_above = accept_above
+        self.counter = counter
+
+    @classmethod
+    def parse(cls, terms):
+        """Build a policy from OFFER terms; returns None when the offer carries none."""
+        values = {}
+        for term in terms:
+            key, _, value = term.partition("=")
+            if key == "floor":
+                key = "accept_above"
+            if key not in ("accept_above", "counter") or not value.isdigit():
+                raise ValueError(f"Invalid negotiation term: {term}")
+            values[key] = int(value)
+        return cls(**values) if values else None
+
+    def respond(self, max_price):
+        """Decide a NEGOTIATE for the buyer's max_price: (ACCEPT|COUNTER|REFUSE, price)."""
+        if self.accept_above is not None and max_price >= self.accept_above:
+            return ACCEPT, max_price
+        if self.counter is not None:
+            return COUNTER, self.counter
+        return REFUSE, None
+
+    def terms(self):
+        terms = []
+        if self.accept_above is not None:
+            terms.append(f"accept_above={self.accept_above}")
+        if self.counter is not None:
+            terms.append(f"counter={self.counter}")
+        return terms
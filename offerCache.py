@@ -0,0 +1,124 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from itemIndex import item_key
+
+OFFER_TTL = 30  # Seconds a seller's offer is assumed to still stand
+MAX_ITEMS = 1000  # Items with cached offers; the least recently used is dropped beyond this
+MAX_OFFERS_PER_ITEM = 8  # Cheapest offers kept per item
+
+
+class CachedOffer:
+    __slots__ = ("seller", "item_name", "price", "offer_id", "expires")
+
+    def __init__(self, seller, item_name, price, offer_id, expires):
+        self.seller = seller
+        self.item_name = item_name
+        self.price = price
+        self.offer_id = offer_id  # The original offer's id, so a BUY claims the same unit
+        self.expires = expires
+
+
+class OfferCache:
+    """
+    Recent offers that were not taken, per item key, so a repeat search can be
+    answered at once instead of broadcasting SEARCH and waiting out an offer
+    window. Entries expire after ttl seconds, items are evicted least recently
+    used first, and an offer leaves the cache as soon as a search takes it or
+    its seller goes away. Hits, misses and the waiting time saved are counted.
+    """
+
+    def __init__(self, ttl=OFFER_TTL, max_items=MAX_ITEMS, max_offers=MAX_OFFERS_PER_ITEM):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_offers = max_offers
+        self._items = OrderedDict()  # item key -> {seller: CachedOffer}, least recently used first
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0  # Seconds of offer window buyers did not have to wait
+
+    def add(self, offer, now=None):
+        """Remember an OFFER received for a search."""
+        now = time.time() if now is None else now
+        key = item_key(offer.item_name)
+        entry = CachedOffer(offer.name, offer.item_name, int(offer.price), offer.offer_id, now + self.ttl)
+        with self._lock:
+            offers = self._items.get(key)
+            if offers is None:
+                offers = self._items[key] = {}
+            else:
+                self._items.move_to_end(key)
+            offers[offer.name] = entry
+            if len(offers) > self.max_offers:
+                del offers[max(offers.values(), key=lambda o: o.price).seller]
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def match(self, item_name, max_price, exclude=None, usable=None, limit=1, now=None):
+        """
+        Take up to limit fresh cached offers for item_name at or below
+        max_price, cheapest first, leaving out the seller exclude and sellers
+        for which usable(seller) is false. The offers taken leave the cache in
+        the same critical section, so two searches never get the same one.
+        Counts a hit or a miss.
+        """
+        now = time.time() if now is None else now
+        key = item_key(item_name)
+        found = []
+        with self._lock:
+            offers = self._items.get(key)
+            if offers:
+                self._items.move_to_end(key)
+                for seller, entry in list(offers.items()):
+                    if entry.expires <= now:
+                        del offers[seller]
+                    elif entry.price <= int(max_price) and seller != exclude and (usable is None or usable(seller)):
+                        found.append(entry)
+                found = sorted(found, key=lambda o: o.price)[:limit]
+                for entry in found:
+                    del offers[entry.seller]
+                if not offers:
+                    del self._items[key]
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def discard(self, seller, item_name, offer_id=None):
+        """Forget a seller's offer for an item (only offer_id, if given), e.g. once it is reserved."""
+        key = item_key(item_name)
+        with self._lock:
+            offers = self._items.get(key)
+            entry = offers.get(seller) if offers else None
+            if entry and (offer_id is None or entry.offer_id == offer_id):
+                del offers[seller]
+                if not offers:
+                    del self._items[key]
+
+    def remove_seller(self, seller):
+        with self._lock:
+            for key in [key for key, offers in self._items.items() if seller in offers]:
+                offers = self._items[key]
+                del offers[seller]
+                if not offers:
+                    del self._items[key]
+
+    def record_saved(self, seconds):
+        with self._lock:
+            self.saved += max(0.0, seconds)
+
+    def __len__(self):
+        return sum(len(offers) for offers in self._items.values())
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def describe(self):
+        lookups = self.hits + self.misses
+        return [f"offer_cache_offers {len(self)}", f"offer_cache_hits {self.hits}",
+                f"offer_cache_misses {self.misses}",
+                f"offer_cache_hit_rate {self.hits / lookups if lookups else 0.0:.2f}",
+                f"offer_cache_saved_s {self.saved:.1f}"]
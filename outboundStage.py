@@ -0,0 +1,164 @@
+import logging
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+UDP_SENDERS = 2  # Threads draining the per-destination datagram queues
+TCP_WORKERS = 32  # Concurrent INFORM_REQ / SHIPPING_INFO exchanges; INFORM_REQ may wait minutes for a user
+MAX_BACKLOG = 256  # Datagrams queued per destination before the overflow policy applies
+TCP_TIMEOUT = 10  # Seconds a TCP exchange with a client may take
+LATENCY_SAMPLES = 1000  # Recent send latencies kept for the percentiles in STATS
+DROP_OLDEST = "drop_oldest"  # Overflow: drop the oldest queued datagram
+DISCONNECT = "disconnect"  # Overflow: drop the whole backlog and report the destination
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class OutboundStage:
+    """
+    All network writes to clients, done off the request handler threads.
+
+    Datagrams go into a bounded queue per destination; sender threads drain
+    one destination at a time, so messages to a client keep their order and
+    a client whose queue backs up only delays itself. When a queue is full,
+    the overflow policy either drops the oldest datagram or drops the whole
+    backlog and calls on_disconnect(address) so the server can evict the client.
+
+    TCP exchanges run on a worker pool and return futures with the client's
+    reply, so BUY contacts buyer and seller in parallel. One-way messages such
+    as SHIPPING_INFO are only sent, so they hold a worker just for the write.
+    """
+
+    def __init__(self, udp_socket, senders=UDP_SENDERS, tcp_workers=TCP_WORKERS,
+                 max_backlog=MAX_BACKLOG, policy=DROP_OLDEST, on_disconnect=None):
+        if policy not in (DROP_OLDEST, DISCONNECT):
+            raise ValueError(f"policy must be {DROP_OLDEST!r} or {DISCONNECT!r}")
+        self.udp_socket = udp_socket
+        self.max_backlog = max_backlog
+        self.policy = policy
+        self.on_disconnect = on_disconnect
+        self._queues = {}  # address -> deque of (data, enqueued)
+        self._ready = deque()  # Destinations with queued datagrams and no sender working on them
+        self._cond = threading.Condition()
+        self._running = True
+        self._tcp = ThreadPoolExecutor(max_workers=tcp_workers, thread_name_prefix="outbound-tcp")
+        self.sent = 0
+        self.dropped = 0
+        self.disconnected = 0
+        self.udp_latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.tcp_latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._senders = [threading.Thread(target=self._drain, name=f"outbound-udp-{i}", daemon=True)
+                         for i in range(senders)]
+        for sender in self._senders:
+            sender.start()
+
+    def send_udp(self, data, address):
+        """Queue a datagram for address; returns at once."""
+        overflowed = False
+        with self._cond:
+            queue = self._queues.get(address)
+            if queue is None:
+                queue = self._queues[address] = deque()
+                self._ready.append(address)
+                self._cond.notify()
+            if len(queue) >= self.max_backlog:
+                if self.policy == DROP_OLDEST:
+                    queue.popleft()
+                    self.dropped += 1
+                else:
+                    self.dropped += len(queue)
+                    self.disconnected += 1
+                    queue.clear()
+                    overflowed = True
+            if not overflowed:
+                queue.append((data, time.monotonic()))
+        if overflowed:
+            logging.warning(f"Outbound backlog to {address} overflowed; dropped it")
+            if self.on_disconnect:
+                self.on_disconnect(address)
+
+    def _drain(self):
+        while True:
+            with self._cond:
+                while self._running and not self._ready:
+                    self._cond.wait()
+                if not self._ready:
+                    return  # Closed and nothing left
+                address = self._ready.popleft()
+                queue = self._queues[address]
+                batch = list(queue)
+                queue.clear()
+            for data, enqueued in batch:
+                try:
+                    self.udp_socket.sendto(data, address)
+                except OSError as e:
+                    logging.error(f"Error sending UDP message to {address}: {e}")
+                    continue
+                self.sent += 1
+                self.udp_latencies.append(time.monotonic() - enqueued)
+            with self._cond:
+                # More may have been queued meanwhile; otherwise forget the destination
+                if self._queues[address]:
+                    self._ready.append(address)
+                    self._cond.notify()
+                else:
+                    del self._queues[address]
+
+    def request_tcp(self, address, message, timeout=TCP_TIMEOUT):
+        """Send message over a new TCP connection; the future resolves with the reply (None on error)."""
+        return self._tcp.submit(self._exchange, address, message, timeout, time.monotonic())
+
+    def send_tcp(self, address, message, timeout=TCP_TIMEOUT):
+        """Deliver a one-way message (e.g. SHIPPING_INFO) over a new TCP connection without awaiting a reply."""
+        return self._tcp.submit(self._deliver, address, message, timeout, time.monotonic())
+
+    def _deliver(self, address, message, timeout, submitted):
+        try:
+            with socket.create_connection(address, timeout=timeout) as tcp_socket:
+                tcp_socket.sendall(message.encode('utf-8'))
+                return True
+        except Exception as e:
+            logging.error(f"Error sending TCP message to {address[0]}:{address[1]} - {e}")
+            return False
+        finally:
+            self.tcp_latencies.append(time.monotonic() - submitted)
+
+    def _exchange(self, address, message, timeout, submitted):
+        try:
+            with socket.create_connection(address, timeout=timeout) as tcp_socket:
+                tcp_socket.sendall(message.encode('utf-8'))
+                response = tcp_socket.recv(1024).decode('utf-8')
+                logging.info(f"TCP Response from {address[0]}:{address[1]} - {response}")
+                return response
+        except Exception as e:
+            logging.error(f"Error during TCP communication with {address[0]}:{address[1]} - {e}")
+            return None
+        finally:
+            self.tcp_latencies.append(time.monotonic() - submitted)
+
+    def backlog(self):
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def describe(self):
+        udp, tcp = list(self.udp_latencies), list(self.tcp_latencies)
+        return [f"outbound_backlog {self.backlog()}", f"outbound_sent {self.sent}",
+                f"outbound_dropped {self.dropped}", f"outbound_disconnected {self.disconnected}",
+                f"udp_send_ms p50={percentile(udp, 0.5) * 1000:.2f} p99={percentile(udp, 0.99) * 1000:.2f}",
+                f"tcp_exchange_ms p50={percentile(tcp, 0.5) * 1000:.1f} p99={percentile(tcp, 0.99) * 1000:.1f}"]
+
+    def close(self, timeout=5):
+        """Send the queued datagrams, wait for running TCP exchanges and stop the senders."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for sender in self._senders:
+            sender.join(timeout)
+        self._tcp.shutdown(wait=True)
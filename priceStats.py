@@ -0,0 +1,122 @@
+from threading import Lock
+from itemIndex import item_key
+
+try:
+    import numpy as np
+except ImportError:  # Price statistics are optional; the server runs without them
+    np = None
+
+AVAILABLE = np is not None
+DEFAULT_CAPACITY = 256  # Observations kept per item and series
+
+
+class _Ring:
+    """Fixed-size ring of (price, volume) observations backed by NumPy arrays."""
+
+    __slots__ = ("prices", "volumes", "size", "next")
+
+    def __init__(self, capacity):
+        self.prices = np.full(capacity, np.nan)
+        self.volumes = np.zeros(capacity)
+        self.size = 0
+        self.next = 0
+
+    def append(self, price, volume):
+        self.prices[self.next] = price
+        self.volumes[self.next] = volume
+        self.next = (self.next + 1) % len(self.prices)
+        self.size = min(self.size + 1, len(self.prices))
+
+    def nbytes(self):
+        return self.prices.nbytes + self.volumes.nbytes
+
+
+class PriceStats:
+    """
+    Rolling per-item price statistics: the last `capacity` offer prices and trades
+    of every item. Quotes for many items are computed in one vectorised pass.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if np is None:
+            raise RuntimeError("Price statistics require numpy")
+        self.capacity = capacity
+        self._offers = {}  # item key -> _Ring of offer prices
+        self._trades = {}  # item key -> _Ring of (price, quantity)
+        self._lock = Lock()
+
+    def record_offer(self, item_name, price):
+        self._record(self._offers, item_name, price, 1)
+
+    def record_trade(self, item_name, price, quantity=1):
+        self._record(self._trades, item_name, price, quantity)
+
+    def _record(self, series, item_name, price, volume):
+        key = item_key(item_name)
+        with self._lock:
+            ring = series.get(key)
+            if ring is None:
+                ring = series[key] = _Ring(self.capacity)
+            ring.append(float(price), float(volume))
+
+    def quotes(self, item_names):
+        """
+        Return one quote per item: offer count, 25th/50th/75th offer price percentiles,
+        trade count and trade VWAP (None where there is no data).
+        """
+        keys = [item_key(name) for name in item_names]
+        with self._lock:
+            offer_prices = self._stack(self._offers, keys)
+            trades = [self._trades.get(key) for key in keys]
+            trade_prices = self._stack(self._trades, keys)
+            trade_volumes = np.stack([ring.volumes.copy() if ring else np.zeros(self.capacity)
+                                      for ring in trades])
+
+        offer_counts = np.count_nonzero(~np.isnan(offer_prices), axis=1)
+        trade_counts = np.count_nonzero(~np.isnan(trade_prices), axis=1)
+        quantiles = np.full((len(keys), 3), np.nan)
+        has_offers = offer_counts > 0
+        if has_offers.any():
+            quantiles[has_offers] = np.nanpercentile(offer_prices[has_offers], [25, 50, 75], axis=1).T
+        volume = trade_volumes.sum(axis=1)
+        notional = np.nansum(trade_prices * trade_volumes, axis=1)
+        vwap = np.divide(notional, volume, out=np.full(len(keys), np.nan), where=volume > 0)
+
+        results = []
+        for i, name in enumerate(item_names):
+            results.append({
+                "item_name": name,
+                "offers": int(offer_counts[i]),
+                "p25": self._value(quantiles[i, 0]),
+                "p50": self._value(quantiles[i, 1]),
+                "p75": self._value(quantiles[i, 2]),
+                "trades": int(trade_counts[i]),
+                "vwap": self._value(vwap[i]),
+            })
+        return results
+
+    def _stack(self, series, keys):
+        """Matrix of one row per key (NaN where a ring has no observation yet)."""
+        empty = np.full(self.capacity, np.nan)
+        return np.stack([series[key].prices.copy() if key in series else empty for key in keys])
+
+    @staticmethod
+    def _value(value):
+        return None if np.isnan(value) else round(float(value), 2)
+
+    def memory_per_item(self):
+        """Bytes held by the offer and trade rings of one item."""
+        ring = _Ring(self.capacity)
+        return 2 * ring.nbytes()
+
+    def clear(self):
+        with self._lock:
+            self._offers.clear()
+            self._trades.clear()
+
+
+def format_quote(quote):
+    """Render a quote as item:offers:p25:p50:p75:trades:vwap ("-" for missing values)."""
+    fields = [quote["item_name"], quote["offers"], quote["p25"], quote["p50"], quote["p75"],
+              quote["trades"], quote["vwap"]]
+    return ':'.join("-" if field is None else str(field) for field in fields)
@@ -0,0 +1,162 @@
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_DIR = "profiles"  # Where profiling sessions are written
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples in sampling mode
+MAX_PROFILE_SECONDS = 600
+MODES = ("cprofile", "sample")
+
+
+class Profiler:
+    """
+    Time-limited profiling of request handlers, started from the admin channel.
+
+      cprofile  every handler that starts during the session runs under its own
+                cProfile.Profile; finished profiles are merged into a .pstats file
+      sample    a background thread samples the stacks of all handler threads
+                and writes collapsed stacks (flamegraph.pl / speedscope input)
+
+    Both modes also record per-request-type wall and CPU time. While no session
+    runs, handlers only check the `active` flag.
+    """
+
+    def __init__(self, thread_class, output_dir=PROFILE_DIR):
+        self.thread_class = thread_class  # Threads of this class are sampled
+        self.output_dir = output_dir
+        self.active = False
+        self.mode = None
+        self._lock = threading.Lock()
+        self._timer = None
+        self._started = None
+        self._timings = {}  # request type -> [count, wall seconds, cpu seconds]
+        self._stats = None  # Merged pstats.Stats of finished handlers
+        self._skipped = 0  # Handlers that could not be profiled (another profiler active)
+        self._stacks = Counter()  # Collapsed stack -> samples
+        self._sampler = None
+
+    def start(self, mode, seconds):
+        """Start a session that stops itself after seconds. Returns False if one is running."""
+        if mode not in MODES:
+            raise ValueError(f"profiling mode must be one of {' '.join(MODES)}")
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            raise ValueError(f"profiling time must be between 0 and {MAX_PROFILE_SECONDS} seconds")
+        with self._lock:
+            if self.active:
+                return False
+            self.mode = mode
+            self._started = time.time()
+            self._timings = {}
+            self._stats = None
+            self._skipped = 0
+            self._stacks = Counter()
+            self.active = True
+            if mode == "sample":
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+            self._timer = threading.Timer(seconds, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+        logging.warning(f"Profiling started: {mode} for {seconds}s")
+        return True
+
+    def stop(self):
+        """End the session and write its files. Returns the written paths (empty if none ran)."""
+        with self._lock:
+            if not self.active:
+                return []
+            self.active = False
+            self._timer.cancel()
+        if self._sampler:
+            self._sampler.join()
+            self._sampler = None
+        paths = self._write()
+        logging.warning(f"Profiling stopped, wrote {' '.join(paths)}")
+        return paths
+
+    def status(self):
+        if not self.active:
+            return "profiling off"
+        with self._lock:
+            handled = sum(count for count, _, _ in self._timings.values())
+            samples = sum(self._stacks.values())
+        return (f"profiling {self.mode} for {time.time() - self._started:.1f}s, "
+                f"{handled} requests timed, {samples} samples")
+
+    def run(self, request_type, method):
+        """Run a handler method with timing (and cProfile in cprofile mode)."""
+        profile = None
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:  # Python 3.12+ allows one cProfile at a time
+                profile = None
+                with self._lock:
+                    self._skipped += 1
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            method()
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            if profile:
+                profile.disable()
+            self._record(request_type, wall, cpu, profile)
+
+    def _record(self, request_type, wall, cpu, profile):
+        with self._lock:
+            if not self.active:
+                return  # Finished after the session ended
+            timing = self._timings.setdefault(request_type, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += wall
+            timing[2] += cpu
+            if profile:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+
+    def _sample(self):
+        while self.active:
+            handlers = {thread.ident: thread for thread in threading.enumerate()
+                        if isinstance(thread, self.thread_class)}
+            for ident, frame in sys._current_frames().items():
+                thread = handlers.get(ident)
+                if thread is None:
+                    continue
+                stack = []
+                while frame:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(getattr(thread, "message_type", "handler"))
+                with self._lock:
+                    self._stacks[";".join(reversed(stack))] += 1
+            time.sleep(SAMPLE_INTERVAL)
+
+    def _write(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, time.strftime("profile-%Y%m%d-%H%M%S", time.localtime(self._started)) + f"-{self.mode}")
+        paths = []
+        if self._stats is not None:
+            self._stats.dump_stats(f"{base}.pstats")
+            paths.append(f"{base}.pstats")
+        if self._stacks:
+            with open(f"{base}.collapsed", "w") as out:
+                for stack, samples in self._stacks.most_common():
+                    out.write(f"{stack} {samples}\n")
+            paths.append(f"{base}.collapsed")
+        with open(f"{base}.timings.txt", "w") as out:
+            out.write(f"# {self.mode} session, {self._skipped} handlers not profiled\n")
+            out.write("request_type count wall_total_s wall_avg_ms cpu_total_s cpu_avg_ms\n")
+            for request_type, (count, wall, cpu) in sorted(self._timings.items()):
+                out.write(f"{request_type} {count} {wall:.4f} {wall / count * 1000:.3f} "
+                          f"{cpu:.4f} {cpu / count * 1000:.3f}\n")
+        paths.append(f"{base}.timings.txt")
+        return paths
@@ -0,0 +1,121 @@
+import json
+import os
+import time
+from collections import Counter
+from threading import Lock
+
+RATE_LIMITS_FILE = "rate_limits.json"  # Optional overrides, reloaded with RATE_LIMITS RELOAD
+PRUNE_INTERVAL = 60  # Seconds between sweeps of idle client buckets
+
+# message type -> (client rate/s, client burst, global rate/s, global burst); "*" covers the rest
+DEFAULT_LIMITS = {
+    "LOOKING_FOR": (1, 5, 20, 50),
+    "LOOKING_FOR_BATCH": (0.2, 2, 5, 10),
+    "*": (20, 40, 500, 1000),
+}
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        """Add the tokens earned since the last refill, up to the burst size."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        """Refill for the time elapsed and take one token. Returns False when empty."""
+        self.refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def idle(self, now):
+        """True once the bucket would be full again, i.e. it can be dropped."""
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class RateLimiter:
+    """
+    Admission control for UDP messages, checked before a handler thread is
+    started. Every message type has a token bucket per client address and one
+    shared by all clients; a message is admitted only if both have a token.
+    """
+
+    def __init__(self, path=RATE_LIMITS_FILE):
+        self.path = path
+        self._lock = Lock()
+        self._limits = dict(DEFAULT_LIMITS)
+        self._client_buckets = {}  # (message type, address) -> TokenBucket
+        self._global_buckets = {}  # message type -> TokenBucket
+        self._last_prune = time.monotonic()
+        self.allowed = Counter()  # message type -> admitted messages
+        self.limited = Counter()  # message type -> rejected messages
+        if os.path.exists(path):
+            self.reload()
+
+    def allow(self, message_type, client_address):
+        now = time.monotonic()
+        limit_type = message_type if message_type in self._limits else "*"
+        with self._lock:
+            client_rate, client_burst, global_rate, global_burst = self._limits[limit_type]
+            client_bucket = self._client_buckets.get((limit_type, client_address))
+            if client_bucket is None:
+                client_bucket = self._client_buckets[(limit_type, client_address)] = \
+                    TokenBucket(client_rate, client_burst, now)
+            global_bucket = self._global_buckets.get(limit_type)
+            if global_bucket is None:
+                global_bucket = self._global_buckets[limit_type] = TokenBucket(global_rate, global_burst, now)
+
+            # Take a token from both buckets or from neither: a client over its own limit must not
+            # drain the shared bucket, and a global overload must not spend the client's budget
+            client_bucket.refill(now)
+            admitted = client_bucket.tokens >= 1 and global_bucket.take(now)
+            if admitted:
+                client_bucket.tokens -= 1
+            (self.allowed if admitted else self.limited)[limit_type] += 1
+            if now - self._last_prune > PRUNE_INTERVAL:
+                self._prune(now)
+        return admitted
+
+    def _prune(self, now):
+        self._last_prune = now
+        for key in [key for key, bucket in self._client_buckets.items() if bucket.idle(now)]:
+            del self._client_buckets[key]
+
+    def reload(self):
+        """
+        Load limits from the JSON file, e.g.
+        {"LOOKING_FOR": {"client_rate": 1, "client_burst": 5, "global_rate": 20, "global_burst": 50}}.
+        Types not in the file keep their defaults; all buckets start full again.
+        """
+        with open(self.path) as f:
+            overrides = json.load(f)
+        limits = dict(DEFAULT_LIMITS)
+        for message_type, limit in overrides.items():
+            try:
+                limits[message_type] = (float(limit["client_rate"]), float(limit["client_burst"]),
+                                        float(limit["global_rate"]), float(limit["global_burst"]))
+            except KeyError as e:
+                raise ValueError(f"Rate limit for {message_type} is missing {e}")
+        with self._lock:
+            self._limits = limits
+            self._client_buckets.clear()
+            self._global_buckets.clear()
+        return limits
+
+    def describe(self):
+        """One line per limited message type: limits and admitted/rejected counts."""
+        with self._lock:
+            return [f"{message_type} client={client_rate}/s burst={client_burst} "
+                    f"global={global_rate}/s burst={global_burst} "
+                    f"allowed={self.allowed[message_type]} limited={self.limited[message_type]}"
+                    for message_type, (client_rate, client_burst, global_rate, global_burst)
+                    in sorted(self._limits.items())]
@@ -0,0 +1,91 @@
+import itertools
+import time
+from collections import deque
+from threading import Lock
+
+from offerCache import OFFER_TTL
+
+SOLD = 0  # Held by an offer that was paid for; tokens start at 1, so no BUY can ever hold or release it
+
+
+class ReservationTable:
+    """
+    Per-offer claims taken by BUY before the INFORM / payment phase. A claim
+    is a compare-and-set on one dict slot: dict.setdefault either stores the
+    caller's fresh token or returns the token already there, atomically under
+    the interpreter lock. Concurrent BUYs for one offer therefore get exactly
+    one winner in O(1), without a lock shared by all offers, and the losers
+    can be answered at once. Only the holder of a token can release it.
+
+    A claim whose purchase completes is settled instead of released: the
+    offer stays claimed as SOLD, so a copy of it still held by a pooled
+    search or the offer cache cannot be paid for a second time. Copies are
+    only assumed to stand for sold_ttl seconds, so the SOLD marker is
+    dropped after that, the next time an offer is settled.
+    """
+
+    def __init__(self, sold_ttl=OFFER_TTL):
+        self.sold_ttl = sold_ttl
+        self._claims = {}  # offer_id -> token of the BUY holding it, or SOLD
+        self._tokens = itertools.count(1)  # next() on a count is atomic as well
+        self._sold = deque()  # (expires, offer_id), in expiry order since the TTL is fixed
+        self._sold_lock = Lock()
+
+    def claim(self, offer_id):
+        """Claim an offer. Returns a token, or None if another BUY holds it or it was sold."""
+        token = next(self._tokens)
+        return token if self._claims.setdefault(offer_id, token) == token else None
+
+    def release(self, offer_id, token):
+        """Give up a claim, e.g. when the payment failed. Returns False if token does not hold it."""
+        if self._claims.get(offer_id) != token:
+            return False
+        # Nobody else can change a held slot, so the check and the delete cannot interleave
+        del self._claims[offer_id]
+        return True
+
+    def settle(self, offer_id, token):
+        """Mark a claimed offer as sold once its purchase completed. Returns False if token does not hold it."""
+        if self._claims.get(offer_id) != token:
+            return False
+        now = time.monotonic()
+        with self._sold_lock:
+            self._claims[offer_id] = SOLD
+            self._sold.append((now + self.sold_ttl, offer_id))
+            self._expire(now)
+        return True
+
+    def _expire(self, now):
+        while self._sold and self._sold[0][0] <= now:
+            _, offer_id = self._sold.popleft()
+            # A SOLD slot is never claimed or released, so nothing changes it between the check and the delete
+            if self._claims.get(offer_id) == SOLD:
+                del self._claims[offer_id]
+
+    def holder(self, offer_id):
+        return self._claims.get(offer_id)
+
+    def sold(self, offer_id):
+        return self._claims.get(offer_id) == SOLD
+
+    def __len__(self):
+        return len(self._claims)
+
+    def clear(self):
+        with self._sold_lock:
+            self._claims.clear()
+            self._sold.clear()
+
+    def export(self):
+        """(offer_id, seconds left) of the sold offers, for a hot restart; claims in progress end with their process."""
+        now = time.monotonic()
+        with self._sold_lock:
+            return [(offer_id, expires - now) for expires, offer_id in self._sold
+                    if self._claims.get(offer_id) == SOLD]
+
+    def restore(self, sold):
+        now = time.monotonic()
+        with self._sold_lock:
+            for offer_id, remaining in sold:
+                self._claims[offer_id] = SOLD
+                self._sold.append((now + remaining, offer_id))
@@ -0,0 +1,127 @@
+import threading
+import time
+from threading import Lock
+from itemIndex import item_key
+
+MIN_SHARED_WINDOW = 0.25  # A search joins a pool only while this fraction of the offer window is left
+
+
+class SearchPool:
+    """Concurrent searches for one item, answered by a single SEARCH broadcast and its offers."""
+    __slots__ = ("key", "leader_rq", "closes_at", "members", "allocation", "done")
+
+    def __init__(self, key, leader_rq, closes_at):
+        self.key = key
+        self.leader_rq = leader_rq  # The search whose RQ# went out in SEARCH and collects the offers
+        self.closes_at = closes_at
+        self.members = []  # (search_rq, buyer, max_price) in arrival order, the leader first
+        self.allocation = {}  # search_rq -> offers, set when the window closes
+        self.done = threading.Event()
+
+    def finish(self, allocation):
+        self.allocation = allocation
+        self.done.set()
+
+
+def allocate_offers(members, offers):
+    """
+    Share a pool's offers among its searches: search_rq -> offers. Every offer
+    goes to one search at most, so one unit is never reserved for two buyers.
+
+    Searches are served from the tightest max_price up, each taking the
+    cheapest offer still free within its budget, which fills as many of them
+    as possible and gives the cheap offers to the buyers who need them. The
+    offers nobody could afford are then dealt out, cheapest first, to the
+    searches left without one, the highest budget first, so each can be
+    negotiated by a single search. A search that gets nothing is answered
+    NOT_AVAILABLE. A pool of one search therefore gets exactly what it would
+    have got on its own. Nobody is given their own offer.
+    """
+    free = sorted(offers, key=lambda o: int(o.price))
+    allocation = {}
+    unfilled = []
+    for search_rq, buyer, max_price in sorted(members, key=lambda m: int(m[2])):
+        index = next((i for i, offer in enumerate(free) if offer.name != buyer), None)
+        if index is not None and int(free[index].price) <= int(max_price):
+            allocation[search_rq] = [free.pop(index)]
+        else:
+            allocation[search_rq] = []
+            unfilled.append((search_rq, buyer, max_price))
+    unfilled.sort(key=lambda m: -int(m[2]))
+    turn = 0
+    for offer in free if unfilled else ():
+        for step in range(len(unfilled)):
+            search_rq, buyer, _ = unfilled[(turn + step) % len(unfilled)]
+            if offer.name != buyer:
+                allocation[search_rq].append(offer)
+                turn = (turn + step + 1) % len(unfilled)
+                break
+    return allocation
+
+
+class SearchPools:
+    """
+    Open search pools by item key. The first LOOKING_FOR for an item leads a
+    pool: it broadcasts SEARCH and collects the offers. LOOKING_FORs for the
+    same item that arrive while enough of its offer window is left join the
+    pool instead of broadcasting again, and are answered from its offers when
+    the window closes.
+    """
+
+    def __init__(self, min_shared_window=MIN_SHARED_WINDOW):
+        self.min_shared_window = min_shared_window
+        self._open = {}  # item key -> SearchPool still accepting searches
+        self._by_search = {}  # search_rq -> its SearchPool, until the pool closes
+        self._lock = Lock()
+        self.broadcasts = 0  # Pools opened, i.e. SEARCH broadcasts sent
+        self.pooled = 0  # Searches answered from another search's broadcast
+
+    def join(self, search_rq, buyer, item_name, max_price, window):
+        """Add a search to the open pool for its item, or open one. Returns (pool, leading)."""
+        key = item_key(item_name)
+        now = time.time()
+        with self._lock:
+            pool = self._open.get(key)
+            leading = pool is None or pool.closes_at - now < window * self.min_shared_window
+            if leading:
+                pool = self._open[key] = SearchPool(key, search_rq, now + window)
+                self.broadcasts += 1
+            else:
+                self.pooled += 1
+            pool.members.append((search_rq, buyer, max_price))
+            self._by_search[search_rq] = pool
+        return pool, leading
+
+    def restore(self, search_rq, buyer, item_name, max_price, leader_rq, closes_at):
+        """Rebuild the pool of a search handed over by a previous server process."""
+        key = item_key(item_name)
+        with self._lock:
+            pool = self._by_search.get(leader_rq)
+            if pool is None:
+                pool = SearchPool(key, leader_rq, closes_at)
+                if closes_at > time.time():
+                    self._open.setdefault(key, pool)
+            pool.members.append((search_rq, buyer, max_price))
+            self._by_search[search_rq] = pool
+        return pool
+
+    def pool_of(self, search_rq):
+        return self._by_search.get(search_rq)
+
+    def close(self, pool):
+        """Stop a pool taking searches. Returns its members."""
+        with self._lock:
+            if self._open.get(pool.key) is pool:
+                del self._open[pool.key]
+            for search_rq, _, _ in pool.members:
+                self._by_search.pop(search_rq, None)
+            return list(pool.members)
+
+    def clear(self):
+        with self._lock:
+            self._open.clear()
+            self._by_search.clear()
+
+    def describe(self):
+        return [f"search_pools_open {len(self._open)}", f"search_broadcasts {self.broadcasts}",
+                f"searches_pooled {self.pooled}"]
@@ -1,8 +1,11 @@
-import socket
+import argparse
+import signal
+import sys
 import threading
 import time
-from threading import Lock
-from serverRequest import ServerRequestHandler  # Import the handler
+from marketplaceServer import MarketplaceServer
+from settlement import SimulatedProcessor
+import handoff
 import logging
 
 # Configure logging
@@ -15,163 +18,87 @@ logging.basicConfig(
     ]
 )
 
-# Global flag to stop threads
-server_running = True
-
 # Server Configuration
 SERVER_IP = "127.0.0.1"
 SERVER_PORT = 5005
 TCP_PORT = 5006  # Dedicated TCP port for TCP connections
+ADMIN_PORT = 5007  # Admin/introspection channel, see adminServer.py
+MARKET_MODE = "search"  # "search": SEARCH broadcast and offer window, "continuous": double auction
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run the marketplace server.")
+    parser.add_argument("--host", default=SERVER_IP)
+    parser.add_argument("--udp-port", type=int, default=SERVER_PORT)
+    parser.add_argument("--tcp-port", type=int, default=TCP_PORT)
+    parser.add_argument("--admin-port", type=int, default=ADMIN_PORT, help="-1 disables the admin channel")
+    parser.add_argument("--mode", choices=("search", "continuous"), default=MARKET_MODE)
+    parser.add_argument("--offer-window", type=float, help="seconds offers are collected for a search")
+    parser.add_argument("--max-handlers", type=int, help="concurrent request handlers before replying busy")
+    parser.add_argument("--payment-latency", type=float, default=0.05,
+                        help="seconds the simulated payment processor takes per batch")
+    parser.add_argument("--payment-failure-rate", type=float, default=0.0,
+                        help="fraction of simulated payments that are declined")
+    parser.add_argument("--coalesce-window", type=float,
+                        help="seconds notifications to one client wait to share a datagram, 0 disables")
+    parser.add_argument("--max-backlog", type=int, help="datagrams queued per client before the overflow policy")
+    parser.add_argument("--outbound-policy", choices=("drop_oldest", "disconnect"), default="drop_oldest",
+                        help="drop a slow client's oldest queued datagram, or drop its backlog and evict it")
+    parser.add_argument("--heartbeat-timeout", type=float,
+                        help="seconds without a PING before a client is evicted, 0 disables")
+    parser.add_argument("--offer-cache-ttl", type=float,
+                        help="seconds an offer nobody took can answer a new search, 0 disables")
+    parser.add_argument(handoff.HANDOFF_FLAG, nargs="+", metavar="VALUE", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
 
-# In-memory data storage with locks
-registered_clients = {}  # Stores registered clients
-ongoing_requests = {}  # Tracks ongoing item requests
-offers_by_rq = {}  # Tracks offers by request number
-
-clients_lock = Lock()
-requests_lock = Lock()
-offers_lock = Lock()
-
-# UDP Server Socket Setup
-udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-udp_socket.bind((SERVER_IP, SERVER_PORT))
-logging.info(f"UDP Server started at {SERVER_IP}:{SERVER_PORT}")
-
-# TCP Server Socket Setup
-tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Allow port reuse
-tcp_socket.bind((SERVER_IP, TCP_PORT))
-tcp_socket.listen(5)  # Maximum 5 simultaneous TCP connections
-logging.info(f"TCP Server listening on {SERVER_IP}:{TCP_PORT}")
-
-def handle_tcp_client(tcp_client, tcp_address):
-    """Handle individual TCP client connection."""
-    try:
-        handler = ServerRequestHandler(
-            message=None,  # No UDP message for TCP connections
-            client_address=tcp_address,
-            registered_clients=registered_clients,
-            ongoing_requests=ongoing_requests,
-            offers_by_rq=offers_by_rq,
-            udp_socket=udp_socket,  # Pass UDP socket for sending responses
-            tcp_port=TCP_PORT,
-            clients_lock=clients_lock,
-            requests_lock=requests_lock,
-            offers_lock=offers_lock,
-        )
-        handler.handle_tcp_connection(tcp_client, tcp_address)
-    except Exception as e:
-        logging.error(f"Error handling TCP client {tcp_address}: {e}")
-    finally:
-        tcp_client.close()
-
-def handle_tcp_connections():
-    """Accept and handle incoming TCP connections."""
-    try:
-        while server_running:
-            try:
-                tcp_client, tcp_address = tcp_socket.accept()
-                logging.info(f"New TCP connection from {tcp_address}")
-
-                # Create a thread to handle the TCP connection
-                tcp_thread = threading.Thread(
-                    target=handle_tcp_client,
-                    args=(tcp_client, tcp_address),
-                    daemon=True
-                )
-                tcp_thread.start()
-                
-            except Exception as e:
-                if server_running:  # Only log if server is supposed to be running
-                    logging.error(f"Error accepting TCP connection: {e}")
-                break
-    except Exception as e:
-        logging.error(f"TCP server error: {e}")
-    finally:
-        tcp_socket.close()
-        logging.info("TCP socket closed.")
-
-def handle_udp_messages():
-    """Handle incoming UDP messages."""
-    try:
-        while server_running:
-            try:
-                udp_socket.settimeout(1.0)  # Set timeout to allow periodic checks
-                message, client_address = udp_socket.recvfrom(1024)
-                logging.info(f"Received UDP message from {client_address}: {message.decode('utf-8')}")
-                
-                # Create handler for UDP message
-                handler = ServerRequestHandler(
-                    message.decode("utf-8"),
-                    client_address,
-                    registered_clients,
-                    ongoing_requests,
-                    offers_by_rq,
-                    udp_socket,
-                    TCP_PORT,
-                    clients_lock,
-                    requests_lock,
-                    offers_lock,
-                )
-                handler.start()
-                
-            except socket.timeout:
-                # Timeout is normal, continue loop
-                continue
-            except Exception as e:
-                if server_running:
-                    logging.error(f"Error handling UDP message: {e}")
-    except Exception as e:
-        logging.error(f"UDP server error: {e}")
-    finally:
-        udp_socket.close()
-        logging.info("UDP socket closed.")
-
-def shutdown_server():
-    """Gracefully shutdown the server."""
-    global server_running
-    server_running = False
-    
-    # Close sockets
-    try:
-        udp_socket.close()
-    except:
-        pass
-    
-    try:
-        tcp_socket.close()
-    except:
-        pass
-    
-    logging.info("Server shutdown initiated.")
 
 # Main server entry point
 if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    options = {"host": args.host, "udp_port": args.udp_port, "tcp_port": args.tcp_port,
+               "admin_port": None if args.admin_port < 0 else args.admin_port,
+               "market_mode": args.mode, "max_handlers": args.max_handlers,
+               "outbound_policy": args.outbound_policy,
+               "payment_processor": SimulatedProcessor(args.payment_latency, args.payment_failure_rate)}
+    if args.offer_window is not None:
+        options["offer_window"] = args.offer_window
+    if args.max_backlog is not None:
+        options["max_backlog"] = args.max_backlog
+    if args.coalesce_window is not None:
+        options["coalesce_window"] = args.coalesce_window
+    if args.heartbeat_timeout is not None:
+        options["heartbeat_timeout"] = args.heartbeat_timeout
+    if args.offer_cache_ttl is not None:
+        options["offer_cache_ttl"] = args.offer_cache_ttl
+    if args.handoff:
+        # A hot restart passes the listening sockets and the previous process's state
+        options["handoff_state"], options["sockets"] = handoff.adopt(args.handoff)
+
+    server = MarketplaceServer(**options)
+    # A successor is started with the same options
+    server.successor_args = sys.argv[1:sys.argv.index(handoff.HANDOFF_FLAG)] if args.handoff else sys.argv[1:]
     try:
-        # Start UDP and TCP handling threads
-        udp_thread = threading.Thread(target=handle_udp_messages, daemon=True)
-        tcp_thread = threading.Thread(target=handle_tcp_connections, daemon=True)
+        server.start()
 
-        udp_thread.start()
-        tcp_thread.start()
+        # SIGTERM drains before exiting, SIGHUP hands over to a new process
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.drain, daemon=True).start())
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda *_: threading.Thread(target=server.hot_restart, daemon=True).start())
 
         logging.info("Server threads started. UDP and TCP handlers are running.")
         logging.info("Press Ctrl+C to stop the server.")
 
         # Keep main thread alive
-        try:
-            while server_running:
-                time.sleep(1)  # Simple sleep instead of join with timeout
-                if not udp_thread.is_alive() or not tcp_thread.is_alive():
-                    logging.warning("One of the server threads has stopped unexpectedly.")
-                    break
-        except KeyboardInterrupt:
-            logging.info("Keyboard interrupt received.")
-            
+        while server.running:
+            time.sleep(1)  # Simple sleep instead of join with timeout
+            if not server.healthy():
+                logging.warning("One of the server threads has stopped unexpectedly.")
+                break
+
     except KeyboardInterrupt:
         logging.info("\nServer shutting down...")
     except Exception as e:
         logging.error(f"Server startup error: {e}")
     finally:
-        shutdown_server()
-        logging.info("Server shutdown complete.")
\ No newline at end of file
+        server.stop()
+        logging.info("Server shutdown complete.")
@@ -1,3 +1,5 @@
+import copy
+import functools
 import threading
 import time
 import socket
@@ -15,25 +17,79 @@ from classes.searching import (
     Reserve,
     Cancel,
     Buy,
+    LookingForBatch,
+    OfferBatch,
+    BatchResult,
+    Inventory,
+    Quote,
+    QuoteRes,
 )
-from classes.finalize import InformReq, InformRes, Cancel, ShippingInfo
+from classes.finalize import InformReq, InformRes, ShippingInfo
+from idAllocator import format_id, parse_id, intern_name
+from itemIndex import item_key
+from negotiationPolicy import NegotiationPolicy, ACCEPT, REFUSE
+from priceStats import format_quote
+from settlement import Payment, format_cents
+from tracing import NULL_TRACER
+from reservationTable import ReservationTable
+from searchPool import SearchPools, allocate_offers
+from transactionTable import TransactionTable, InvalidTransition, SEARCHING, OFFERED, NEGOTIATING, RESERVED, \
+    PAYING, SHIPPED, CANCELLED, CANCELLABLE
+
+OFFER_WINDOW = 60  # Seconds during which offers are collected for a search
+INFORM_TIMEOUT = 120  # Seconds buyer and seller get to answer INFORM_REQ; an interactive client asks its user
+UNANSWERED_TYPES = frozenset({"OFFER", "ACCEPT", "REFUSE"})  # Commands the client does not wait on
+
+
+def error_reply(message, text):
+    """
+    ERROR reply to a request, echoing its RQ# so the client can tell which request
+    failed. Errors for OFFER / ACCEPT / REFUSE carry no RQ#: theirs is a search RQ#,
+    which could collide with one of the client's own.
+    """
+    parts = message.split(maxsplit=2)
+    if len(parts) > 1 and parts[0] not in UNANSWERED_TYPES:
+        return f"ERROR {parts[1]} {text}"
+    return f"ERROR: {text}"
 
 
 class ServerRequestHandler(threading.Thread):
     def __init__(self, message, client_address, registered_clients, ongoing_requests,
-                offers_by_rq, udp_socket, tcp_port, clients_lock, requests_lock, offers_lock):
+                offers_by_rq, udp_socket, tcp_port, requests_lock, offers_lock,
+                id_allocator=None, catalog=None, engine=None,
+                price_stats=None, transactions=None, profiler=None, tracer=None, handed_off=None,
+                offer_window=OFFER_WINDOW, on_done=None, settlement=None, coalescer=None, outbound=None,
+                reservations=None, liveness=None, search_pools=None, offer_cache=None):
         super().__init__()
         self.message = message
         self.client_address = client_address
-        self.registered_clients = registered_clients
+        self.registered_clients = registered_clients  # ClientRegistry; reads need no lock
         self.ongoing_requests = ongoing_requests
         self.offers_by_rq = offers_by_rq
         self.udp_socket = udp_socket
         self.tcp_port = tcp_port
-        self.clients_lock = clients_lock
         self.requests_lock = requests_lock
         self.offers_lock = offers_lock
-        self.buyer_rq_map = {}  #  for tracking buyer RQs
+        self.id_allocator = id_allocator
+        self.catalog = catalog
+        self.engine = engine  # MatchingEngine when the server runs the continuous market mode
+        self.price_stats = price_stats  # PriceStats, or None when numpy is not installed
+        # Shared TransactionTable: state of every open search, by search RQ#, buyer RQ# and participant
+        self.transactions = transactions if transactions is not None else TransactionTable()
+        self.profiler = profiler  # Profiler, times and profiles handlers while a session is active
+        self.tracer = tracer or NULL_TRACER  # Per-search timelines, keyed by search RQ#
+        self.handed_off = handed_off or threading.Event()  # Set when a successor process took over the searches
+        self.offer_window = offer_window
+        self.on_done = on_done  # Called with the handler when run() returns
+        self.settlement = settlement  # SettlementQueue; BUY pays inline when None
+        self.coalescer = coalescer  # NotificationCoalescer merging notifications per client, or None
+        self.outbound = outbound  # OutboundStage doing the socket writes off this thread, or None
+        # Shared ReservationTable: per-offer claims that let only one BUY pay for an offer
+        self.reservations = reservations if reservations is not None else ReservationTable()
+        self.liveness = liveness  # LivenessIndex of client heartbeats, or None to treat every client as alive
+        # Shared SearchPools: concurrent LOOKING_FORs for one item share a SEARCH broadcast
+        self.search_pools = search_pools if search_pools is not None else SearchPools()
+        self.offer_cache = offer_cache  # OfferCache of recent offers nobody took, or None
         if message:  # Only set message_type if message exists (for UDP)
             self.message_type = self.get_message_type()
         self.request_types = {
@@ -41,6 +97,10 @@ class ServerRequestHandler(threading.Thread):
             "DE-REGISTER": self.deregister,
             "LOOKING_FOR": self.search_item,
             "OFFER": self.handle_offer,
+            "LOOKING_FOR_BATCH": self.search_items_batch,
+            "OFFER_BATCH": self.handle_offer_batch,
+            "INVENTORY": self.update_inventory,
+            "QUOTE": self.quote,
             "NEGOTIATE": self.negotiate,
             "ACCEPT": self.accept,
             "REFUSE": self.refuse,
@@ -100,27 +160,86 @@ class ServerRequestHandler(threading.Thread):
         """Process the request based on its type."""
         try:
             if self.message_type in self.request_types:
-                self.request_types[self.message_type]()
+                if self.profiler and self.profiler.active:
+                    self.profiler.run(self.message_type, self.request_types[self.message_type])
+                else:
+                    self.request_types[self.message_type]()
             else:
                 print(f"Unknown message type: {self.message_type}")
-                self.send_response(f"ERROR: Unknown message type: {self.message_type}")
+                self.send_error(f"Unknown message type: {self.message_type}")
         except Exception as e:
             print(f"Error processing request: {e}")
-            self.send_response(f"ERROR: {e}")
+            self.send_error(f"{e}")
+        finally:
+            if self.on_done:
+                self.on_done(self)
 
     def send_response(self, response):
         """Send a response back to the client."""
         try:
-            self.udp_socket.sendto(str(response).encode('utf-8'), self.client_address)
+            self.send_datagram(self.client_address, response)
         except Exception as e:
             print(f"Error sending UDP response: {e}")
 
+    def send_error(self, text):
+        """Send an ERROR reply to the request being handled."""
+        self.send_response(error_reply(self.message, text))
+
+    def notify(self, client_name, message):
+        """Send a message to a registered client's UDP port. Returns False if the client is unknown."""
+        client_info = self.registered_clients.get(client_name)
+        if not client_info:
+            return False
+        self.send_to((client_info["ip"], int(client_info["udp_socket"])), message)
+        return True
+
+    def address_of(self, name):
+        """The UDP address a client registered, or None if it is not registered."""
+        client_info = self.registered_clients.get(name)
+        return (client_info["ip"], int(client_info["udp_socket"])) if client_info else None
+
+    def sent_by(self, name):
+        """True when the message came from the UDP address the client registered."""
+        address = self.address_of(name)
+        return address is not None and address == tuple(self.client_address)
+
+    def reachable(self, name):
+        """False for a client whose heartbeats stopped; it is skipped until it is evicted."""
+        return self.liveness is None or self.liveness.alive(name)
+
+    def send_to(self, address, message):
+        """Send a notification to a client, coalesced with others to the same address when enabled."""
+        if self.coalescer:
+            self.coalescer.send(message, address)
+        else:
+            self.send_datagram(address, message)
+
+    def send_datagram(self, address, message):
+        """Queue a datagram on the outbound stage, or write it to the socket when there is none."""
+        if self.outbound:
+            self.outbound.send_udp(str(message).encode('utf-8'), address)
+        else:
+            self.udp_socket.sendto(str(message).encode('utf-8'), address)
+
     def reset(self):
         """Handle RESET command."""
-        with self.clients_lock, self.requests_lock, self.offers_lock:
-            self.registered_clients.clear()
+        self.registered_clients.clear()
+        if self.liveness is not None:
+            self.liveness.clear()
+        with self.requests_lock, self.offers_lock:
             self.ongoing_requests.clear()
             self.offers_by_rq.clear()
+        self.transactions.clear()
+        self.reservations.clear()
+        self.search_pools.clear()
+        if self.offer_cache is not None:
+            self.offer_cache.clear()
+        self.catalog.clear()
+        if self.engine:
+            self.engine.clear()
+        if self.price_stats:
+            self.price_stats.clear()
+        self.tracer.clear()
         response = "SERVER RESET SUCCESS"
         print(response)
         self.send_response(response)
@@ -129,7 +248,7 @@ class ServerRequestHandler(threading.Thread):
         """Validate the incoming message format."""
         parts = self.message.split()
         if len(parts) < expected_args_count:
-            self.send_response(f"ERROR: Invalid message format. Expected {expected_args_count} arguments.")
+            self.send_error(f"Invalid message format. Expected {expected_args_count} arguments.")
             return False
         return True
 
@@ -137,25 +256,27 @@ class ServerRequestHandler(threading.Thread):
         """Handle REGISTER requests."""
         data = self.message.split()
         register_request = Register(*data[1:])
+        name = intern_name(register_request.name)
     
-        with self.clients_lock:
-            if register_request.name in self.registered_clients:
-                response = RegisterDenied(register_request.rq, "Name already in use")
-            else:
-                # Generate a unique RQ# on the server
-                server_rq = len(self.registered_clients) + 1
-            
-                # Store client details
-                self.registered_clients[register_request.name] = {
-                "ip": register_request.ip_address,
-                "udp_socket": register_request.udp_socket,
-                "tcp_socket": register_request.tcp_socket,
-                "rq": server_rq,  # Track the RQ# for this registration
-                "address": ""  # Initialize empty address, will be filled during transaction
-                }
-            
-                # Respond with a unique RQ#
-                response = Registered(server_rq)
+        # Generate a unique RQ# on the server (never reused after de-registration)
+        server_rq = self.id_allocator.next_id()
+
+        # Store client details
+        registered = self.registered_clients.register(name, {
+            "ip": register_request.ip_address,
+            "udp_socket": register_request.udp_socket,
+            "tcp_socket": register_request.tcp_socket,
+            "rq": server_rq,  # Track the RQ# for this registration
+            "address": ""  # Initialize empty address, will be filled during transaction
+        })
+
+        if registered:
+            if self.liveness is not None:
+                self.liveness.touch(name)  # Heartbeats are due from now on
+            # Respond with a unique RQ#
+            response = Registered(format_id(server_rq))
+        else:
+            response = RegisterDenied(register_request.rq, "Name already in use")
     
         self.send_response(response)
 
@@ -163,12 +284,18 @@ class ServerRequestHandler(threading.Thread):
             """Handle DE-REGISTER requests."""
             data = self.message.split()
             deregister_request = DeRegister(*data[1:])
-            with self.clients_lock:
-                if deregister_request.name in self.registered_clients:
-                    del self.registered_clients[deregister_request.name]
-                    response = f"DE-REGISTERED {deregister_request.rq}"
-                else:
-                    response = f"DE-REGISTER-DENIED {deregister_request.rq} Name not registered"
+            if self.registered_clients.deregister(deregister_request.name):
+                self.catalog.remove_seller(deregister_request.name)
+                self.cancel_participant(deregister_request.name)
+                if self.engine:
+                    self.engine.cancel_owner(deregister_request.name)
+                if self.liveness is not None:
+                    self.liveness.forget(deregister_request.name)
+                if self.offer_cache is not None:
+                    self.offer_cache.remove_seller(deregister_request.name)
+                response = f"DE-REGISTERED {deregister_request.rq}"
+            else:
+                response = f"DE-REGISTER-DENIED {deregister_request.rq} Name not registered"
             self.send_response(response)
 
     def search_item(self):
@@ -180,44 +307,312 @@ class ServerRequestHandler(threading.Thread):
         buyer_rq = data[1]  # Extract the original buyer RQ
         search_request = LookingFor(*data[1:])
 
-        # Generate a unique RQ# for the SEARCH message
-        search_rq = f"SEARCH-{int(time.time() * 1000)}"
+        if self.engine:
+            # Continuous mode: the search is a bid that matches or rests in the book
+            self.post_bid(search_request)
+            return
+
+        # Allocate a unique integer RQ# for the SEARCH message
+        search_rq = self.id_allocator.next_id()
 
         # Store the search request and its mapping
         with self.requests_lock:
             self.ongoing_requests[search_rq] = search_request
         with self.offers_lock:
             self.offers_by_rq[search_rq] = []
+        self.tracer.start(search_rq, search_request.name, search_request.item_name)
 
-        # Map buyer_rq to the generated search_rq
-        self.buyer_rq_map[search_rq] = buyer_rq
+        # Open its transaction; the buyer's RQ# maps to the generated search_rq
+        self.transactions.open(search_rq, buyer_rq, search_request.name, self.client_address,
+                               search_request.item_name)
         logging.info(f"Mapped buyer_rq {buyer_rq} to search_rq {search_rq}")
 
-        # Broadcast SEARCH to other clients
-        with self.clients_lock:
-            for client_name, client_info in self.registered_clients.items():
-                if client_name != search_request.name:
-                    search_message = f"SEARCH {search_rq} {search_request.item_name} {search_request.item_description} {search_request.name}"
-                    self.udp_socket.sendto(search_message.encode("utf-8"), (client_info["ip"], int(client_info["udp_socket"])))
+        # Answer from the seller inventory catalog when possible
+        with self.tracer.span(search_rq, "catalog_match"):
+            offers = self.catalog_offers(search_rq, search_request)
+        if offers:
+            logging.info(f"Search {search_rq} matched {len(offers)} catalog listings.")
+            self.finish_search(buyer_rq, search_rq, search_request, offers)
+            return
+
+        # Answer from a recent offer nobody took; RESERVE asks the seller to confirm it still stands
+        if self.offer_cache is not None:
+            lookup_start = time.time()
+            with self.tracer.span(search_rq, "offer_cache"):
+                offers = self.cached_offers(search_rq, search_request)
+            if offers:
+                logging.info(f"Search {search_rq} answered from {len(offers)} cached offers.")
+                self.finish_search(buyer_rq, search_rq, search_request, offers)
+                # The buyer would otherwise have waited out a whole offer window
+                self.offer_cache.record_saved(self.offer_window - (time.time() - lookup_start))
+                return
 
-        logging.info(f"SEARCH request {search_rq} sent to clients.")
+        # Share the broadcast of a concurrent search for the same item, or lead a new pool
+        pool, leading = self.search_pools.join(search_rq, search_request.name, search_request.item_name,
+                                               search_request.max_price, self.offer_window)
+        search_request.pool_rq = pool.leader_rq
+        search_request.window_ends = pool.closes_at
+        if leading:
+            # Broadcast SEARCH to other clients that are alive
+            recipients = [client_info for client_name, client_info in self.registered_clients.snapshot().items()
+                          if client_name != search_request.name and self.reachable(client_name)]
+            with self.tracer.span(search_rq, "search_broadcast", recipients=len(recipients)):
+                search_message = f"SEARCH {format_id(search_rq)} {search_request.item_name} {search_request.item_description} {search_request.name}"
+                for client_info in recipients:
+                    self.send_to((client_info["ip"], int(client_info["udp_socket"])), search_message)
+            logging.info(f"SEARCH request {search_rq} sent to clients.")
+        else:
+            self.tracer.event(search_rq, "search_pooled", leader=pool.leader_rq)
+            logging.info(f"Search {search_rq} joined the SEARCH broadcast of search {pool.leader_rq}.")
 
         # Collect offers after a timeout
         print("Waiting for offers...")
-        offers = self.collect_responses(search_rq, timeout=60)  
+        offers = self.pooled_offers(search_rq, pool)
+        if offers is None:
+            return  # Handed off or cancelled; nothing to answer here
+        self.finish_search(buyer_rq, search_rq, search_request, offers)
+
+    def pooled_offers(self, search_rq, pool):
+        """
+        This search's share of its pool's offers once the offer window closes.
+        The leader collects the offers sent for its SEARCH and allocates them to
+        the members that are still searching; the others wait for that. Returns
+        None when the searches were handed off or the search was cancelled.
+        """
+        if pool.leader_rq != search_rq:
+            while not pool.done.wait(1):
+                if self.handed_off.is_set():
+                    return None
+            return None if self.handed_off.is_set() else pool.allocation.get(search_rq)
+
+        offers = None
+        allocation = {}
+        try:
+            with self.tracer.span(search_rq, "offer_collection"):
+                offers = self.collect_responses(search_rq, timeout=max(0, pool.closes_at - time.time()))
+            members = self.search_pools.close(pool)
+            if offers is not None:
+                allocation = self.allocate_pool(search_rq, members, offers)
+        finally:
+            pool.finish(allocation)  # Also wakes the members if collection failed
+        if offers is not None and self.transactions.get(search_rq) is None:
+            self.forget_search(search_rq)  # Cancelled while it collected offers for the pool
+        return allocation.get(search_rq)
+
+    def allocate_pool(self, leader_rq, members, offers):
+        """
+        Allocate the offers a pool collected to its members still searching.
+        Members get copies carrying their own search RQ#, so RESERVE, NEGOTIATE
+        and the seller's answers refer to their own transaction.
+        """
+        searching = []
+        for member in members:
+            record = self.transactions.get(member[0])
+            if record and record.state == SEARCHING:
+                searching.append(member)
+        allocation = allocate_offers(searching, offers)
+        if self.offer_cache is not None:
+            # Offers allocated to no search stay available to the next search for the item;
+            # the others are being reserved or negotiated
+            allocated = {id(offer) for offers_of_search in allocation.values() for offer in offers_of_search}
+            for offer in offers:
+                if id(offer) not in allocated and not getattr(offer, "from_catalog", False):
+                    self.offer_cache.add(offer)
+        with self.offers_lock:
+            for search_rq, allocated in allocation.items():
+                if search_rq == leader_rq:
+                    continue
+                allocated[:] = [copy.copy(offer) for offer in allocated]
+                for offer in allocated:
+                    offer.rq = format_id(search_rq)
+                if search_rq in self.offers_by_rq:
+                    self.offers_by_rq[search_rq].extend(allocated)
+        if len(members) > 1:
+            logging.info(f"Search pool {leader_rq}: {len(offers)} offers allocated to {len(searching)} searches")
+        return allocation
+
+    def collecting_offers(self, search_rq):
+        """
+        True while OFFERs for a SEARCH RQ# are wanted: its search is still SEARCHING,
+        or it was cancelled but its pool's other searches still collect under its RQ#.
+        """
+        record = self.transactions.get(search_rq)
+        if record is not None:
+            return record.state == SEARCHING
+        pool = self.search_pools.pool_of(search_rq)
+        return pool is not None and pool.leader_rq == search_rq
+
+    def forget_cancelled(self, search_rq):
+        """
+        Forget a cancelled search, unless it leads a pool whose other searches
+        still collect offers under its RQ#; the leader drops it afterwards.
+        """
+        pool = self.search_pools.pool_of(search_rq)
+        if not pool or pool.leader_rq != search_rq:
+            self.forget_search(search_rq)
 
+    def cancel_participant(self, name):
+        """Cancel the open transactions of a client that left, and forget their searches."""
+        for record in self.transactions.cancel_participant(name):
+            self.forget_cancelled(record.search_rq)
+
+    def forget_search(self, search_rq):
+        """Drop an ended search and its offers."""
+        with self.requests_lock:
+            self.ongoing_requests.pop(search_rq, None)
+        with self.offers_lock:
+            self.offers_by_rq.pop(search_rq, None)
+
+    def search_items_batch(self):
+        """
+        Handle LOOKING_FOR_BATCH requests: many searches from one buyer in one message.
+        All searches are registered under a single lock acquisition, broadcast in one
+        pass over the clients and share one offer collection window.
+        Entry i is answered with FOUND / NOT_AVAILABLE using the buyer RQ "<rq>.<i>".
+        """
+        data = self.message.split()
+        batch = LookingForBatch(*data[1:])
+
+        if self.engine:
+            results = []
+            for index, entry in enumerate(batch.entries):
+                if len(entry) != 3 or not entry[2].isdigit():
+                    results.append("ERROR:invalid_entry")
+                    continue
+                order = self.post_bid(LookingFor(f"{batch.rq}.{index}", batch.name, *entry))
+                results.append(format_id(order.order_id))
+            self.send_response(BatchResult(batch.rq, *results))
+            return
+
+        searches = []  # (buyer_rq, search_rq, search_request) per valid entry
+        results = []
+        for index, entry in enumerate(batch.entries):
+            if len(entry) != 3 or not entry[2].isdigit():
+                results.append("ERROR:invalid_entry")
+                continue
+            buyer_rq = f"{batch.rq}.{index}"
+            search_rq = self.id_allocator.next_id()
+            searches.append((buyer_rq, search_rq, LookingFor(buyer_rq, batch.name, *entry)))
+            results.append(format_id(search_rq))
+
+        with self.requests_lock, self.offers_lock:
+            for buyer_rq, search_rq, search_request in searches:
+                self.ongoing_requests[search_rq] = search_request
+                self.offers_by_rq[search_rq] = []
+                self.transactions.open(search_rq, buyer_rq, batch.name, self.client_address,
+                                       search_request.item_name)
+        for _, search_rq, search_request in searches:
+            self.tracer.start(search_rq, search_request.name, search_request.item_name)
+
+        self.send_response(BatchResult(batch.rq, *results))
+
+        # Entries matching the inventory catalog are answered right away
+        unmatched = []
+        for buyer_rq, search_rq, search_request in searches:
+            with self.tracer.span(search_rq, "catalog_match", batch=batch.rq):
+                offers = self.catalog_offers(search_rq, search_request)
+            if offers:
+                self.finish_search(buyer_rq, search_rq, search_request, offers)
+            else:
+                unmatched.append((buyer_rq, search_rq, search_request))
+        searches = unmatched
+        if not searches:
+            return
+
+        # Broadcast every SEARCH in one pass over the registered clients that are alive
+        broadcast_start = time.time()
+        recipients = [client_info for client_name, client_info in self.registered_clients.snapshot().items()
+                      if client_name != batch.name and self.reachable(client_name)]
+        for client_info in recipients:
+            address = (client_info["ip"], int(client_info["udp_socket"]))
+            for _, search_rq, search_request in searches:
+                search_message = f"SEARCH {format_id(search_rq)} {search_request.item_name} {search_request.item_description} {search_request.name}"
+                self.send_to(address, search_message)
+        for _, search_rq, _ in searches:
+            self.tracer.stage(search_rq, "search_broadcast", broadcast_start,
+                              recipients=len(recipients), batch=batch.rq)
+
+        logging.info(f"SEARCH batch {batch.rq} with {len(searches)} items sent to clients.")
+
+        # One collection window for the whole batch
+        collection_start = time.time()
+        for _, _, search_request in searches:
+            search_request.window_ends = collection_start + self.offer_window
+        if self.handed_off.wait(self.offer_window):
+            return  # Handed off; the successor finishes the searches
+        with self.offers_lock:
+            collected = {search_rq: list(self.offers_by_rq.get(search_rq, []))
+                         for _, search_rq, _ in searches}
+        for _, search_rq, _ in searches:
+            self.tracer.stage(search_rq, "offer_collection", collection_start, batch=batch.rq)
+
+        for buyer_rq, search_rq, search_request in searches:
+            self.finish_search(buyer_rq, search_rq, search_request, collected[search_rq])
+
+    def catalog_offers(self, search_rq, search_request):
+        """
+        Build offers for a search from the sellers' standing inventory and store
+        them with the search, as if the sellers had answered a SEARCH.
+        """
+        matches = self.catalog.match(search_request.item_name, exclude=search_request.name)
+        offers = []
+        for entry in matches:
+            if not self.reachable(entry.seller):
+                continue
+            offer = Offer(format_id(search_rq), entry.seller, entry.item_name, str(entry.price))
+            offer.offer_id = self.id_allocator.next_id()
+            offer.policy = entry.policy
+            offer.from_catalog = True
+            offers.append(offer)
+        if offers:
+            with self.offers_lock:
+                self.offers_by_rq[search_rq].extend(offers)
+        return offers
+
+    def cached_offers(self, search_rq, search_request):
+        """
+        Take the cheapest offer from the offer cache within the buyer's max
+        price and from a seller that is alive, and store it with the search.
+        It keeps the original offer id, so only one BUY can pay for it.
+        """
+        entries = self.offer_cache.match(search_request.item_name, search_request.max_price,
+                                         exclude=search_request.name, usable=self.reachable)
+        offers = []
+        for entry in entries:
+            offer = Offer(format_id(search_rq), entry.seller, entry.item_name, str(entry.price))
+            offer.offer_id = entry.offer_id
+            offer.from_cache = True
+            offers.append(offer)
         if offers:
+            with self.offers_lock:
+                self.offers_by_rq[search_rq].extend(offers)
+        return offers
+
+    def finish_search(self, buyer_rq, search_rq, search_request, offers):
+        """
+        Close a search once its offer window ends: pick an offer or tell the buyer
+        that nothing is available. Offers from sellers that stopped sending
+        heartbeats are left out: a BUY would only wait for them to time out.
+        """
+        offers = [offer for offer in offers if self.reachable(offer.name)]
+        if offers:
+            if not self.advance(search_rq, OFFERED):
+                self.forget_search(search_rq)  # Cancelled while offers were collected
+                return
             # Process the collected offers
             print(f"Offers received: {[(o.name, o.price) for o in offers]}")
-            self.process_offers(buyer_rq, search_rq, offers, search_request.max_price)
+            with self.tracer.span(search_rq, "process_offers", offers=len(offers)):
+                self.process_offers(buyer_rq, search_rq, offers, search_request.max_price)
         else:
             # Handle case where no offers are received
             print(f"No offers received for {search_request.item_name}")
+            self.advance(search_rq, CANCELLED)
+            self.forget_search(search_rq)
+            self.tracer.end(search_rq, "no_offers")
             not_available = NotAvailable(buyer_rq, search_request.item_name)
             buyer_info = self.registered_clients.get(search_request.name)
             if buyer_info:
-                self.udp_socket.sendto(str(not_available).encode('utf-8'),
-                                    (buyer_info["ip"], int(buyer_info["udp_socket"])))
+                self.send_to((buyer_info["ip"], int(buyer_info["udp_socket"])), not_available)
 
     def process_offers(self, buyer_rq, search_rq, offers, max_price):
         """
@@ -231,72 +626,257 @@ class ServerRequestHandler(threading.Thread):
             # Finalize the deal if the offer is within the buyer's budget
             logging.info("Offer within buyer's max price, finalizing deal.")
             self.reserve_and_inform_buyer(search_rq, lowest_offer)
+        elif self.negotiate_automatically(search_rq, offers, int(max_price)):
+            return
         else:
+            # Ask the cheapest seller without a negotiation policy
+            interactive = [o for o in offers if not getattr(o, "policy", None)]
+            if not interactive:
+                logging.info(f"All sellers' negotiation policies refused max price {max_price}")
+                record = self.advance(search_rq, CANCELLED)
+                self.forget_search(search_rq)
+                self.tracer.end(search_rq, "refused")
+                if record:
+                    self.notify(record.buyer, NotAvailable(buyer_rq, record.item_name))
+                return
+            lowest_offer = min(interactive, key=lambda o: int(o.price))
+
             # Start negotiation if the lowest offer exceeds the max price
+            if not self.advance(search_rq, NEGOTIATING, seller=lowest_offer.name, offer=lowest_offer):
+                return
             logging.info(f"Negotiating with seller {lowest_offer.name} for price {max_price}")
             negotiate_message = Negotiate(lowest_offer.rq, lowest_offer.item_name, max_price)
-            with self.clients_lock:
-                seller_info = self.registered_clients.get(lowest_offer.name)
-                if seller_info:
-                    self.udp_socket.sendto(
-                        str(negotiate_message).encode('utf-8'),
-                        (seller_info["ip"], int(seller_info["udp_socket"])),
-                    )
+            self.tracer.event(search_rq, "negotiate", seller=lowest_offer.name, max_price=int(max_price))
+            seller_info = self.registered_clients.get(lowest_offer.name)
+            if seller_info:
+                self.send_to((seller_info["ip"], int(seller_info["udp_socket"])), negotiate_message)
+
+    def negotiate_automatically(self, search_rq, offers, max_price):
+        """
+        Resolve NEGOTIATE in-process with the sellers' negotiation policies: an
+        acceptance wins over a counter-offer, cheaper counter-offers win over dearer
+        ones. The chosen offer is repriced and reserved as if the seller had accepted.
+        Returns False when no policy accepts or counters.
+        """
+        candidates = []
+        for offer in offers:
+            policy = getattr(offer, "policy", None)
+            if not policy:
+                continue
+            outcome, price = policy.respond(max_price)
+            if outcome != REFUSE:
+                candidates.append((outcome != ACCEPT, price, offer))
+        if not candidates:
+            return False
+
+        countered, price, offer = min(candidates, key=lambda c: (c[0], c[1]))
+        logging.info(f"Seller {offer.name}'s policy {'countered' if countered else 'accepted'} at {price}")
+        self.tracer.event(search_rq, "negotiate_policy", seller=offer.name, price=price,
+                          outcome="counter" if countered else "accept")
+        with self.offers_lock:
+            offer.price = str(price)
+        self.reserve_and_inform_buyer(search_rq, offer)
+        return True
+
+    def advance(self, search_rq, state, **fields):
+        """Move a transaction to state. Returns its record, or None (logged) if the move is not allowed."""
+        try:
+            return self.transactions.transition(search_rq, state, **fields)
+        except InvalidTransition as e:
+            logging.warning(str(e))
+            return None
 
     def reserve_and_inform_buyer(self, search_rq, lowest_offer):
-        # Retrieve buyer_rq using the mapping
-        buyer_rq = self.buyer_rq_map.get(search_rq)
-        if not buyer_rq:
-            logging.error(f"Error: Buyer request for search_rq {search_rq} not found.")
+        record = self.advance(search_rq, RESERVED, seller=lowest_offer.name,
+                              price=int(lowest_offer.price), offer=lowest_offer)
+        if not record:
             return
+        buyer_rq = record.buyer_rq
+        if self.offer_cache is not None:
+            self.offer_cache.discard(lowest_offer.name, lowest_offer.item_name, lowest_offer.offer_id)
 
         # Reserve the item with the seller
         reserve_message = Reserve(lowest_offer.rq, lowest_offer.item_name, lowest_offer.price)
-        with self.clients_lock:
-            seller_info = self.registered_clients.get(lowest_offer.name)
-            if seller_info:
-                self.udp_socket.sendto(
-                    str(reserve_message).encode('utf-8'),
-                    (seller_info["ip"], int(seller_info["udp_socket"])),
-                )
-                logging.info(f"Sent RESERVE message to seller {lowest_offer.name}")
+        seller_info = self.registered_clients.get(lowest_offer.name)
+        if seller_info:
+            self.send_to((seller_info["ip"], int(seller_info["udp_socket"])), reserve_message)
+            logging.info(f"Sent RESERVE message to seller {lowest_offer.name}")
 
         # Inform the buyer
         buyer_request = self.ongoing_requests.get(search_rq)
         buyer_info = self.registered_clients.get(buyer_request.name) if buyer_request else None
         if buyer_info:
             found_message = Found(buyer_rq, lowest_offer.item_name, lowest_offer.price)
-            self.udp_socket.sendto(
-                str(found_message).encode('utf-8'),
-                (buyer_info["ip"], int(buyer_info["udp_socket"])),
-            )
+            self.send_to((buyer_info["ip"], int(buyer_info["udp_socket"])), found_message)
             logging.info(f"Informed buyer {buyer_request.name} about item availability.")
+        self.tracer.event(search_rq, "reserve_found", seller=lowest_offer.name, price=int(lowest_offer.price))
 
     def handle_offer(self):
         """Handle OFFER responses."""
         data = self.message.split()
         offer = Offer(*data[1:])
-        with self.requests_lock:
-            if offer.rq in self.ongoing_requests:
-                with self.offers_lock:
-                    self.offers_by_rq[offer.rq].append(offer)
-            else:
-                error_message = f"ERROR: Request {offer.rq} does not exist or has been canceled."
-                self.send_response(error_message)
+
+        if self.engine:
+            # Continuous mode: the offer is an ask; its RQ# is the seller's own
+            self.post_ask(offer)
+            return
+
+        try:
+            offer.policy = NegotiationPolicy.parse(offer.terms)
+        except ValueError as e:
+            self.send_error(f"{e}")
+            return
+
+        search_rq = parse_id(offer.rq)
+        offer.offer_id = self.id_allocator.next_id()
+        with self.offers_lock:
+            offers = self.offers_by_rq.get(search_rq) if self.collecting_offers(search_rq) else None
+            if offers is not None:
+                offers.append(offer)
+        if offers is None:
+            self.send_error(f"Request {offer.rq} does not exist or has been canceled.")
+            return
+        self.record_offer_price(offer)
+        self.tracer.event(search_rq, "offer", seller=offer.name, price=int(offer.price))
+
+    def handle_offer_batch(self):
+        """
+        Handle OFFER_BATCH messages: many offers from one seller in one message,
+        stored under a single acquisition of the request and offer locks.
+        Replies with one BATCH_RESULT holding a result per entry.
+        """
+        data = self.message.split()
+        batch = OfferBatch(*data[1:])
+
+        results = []
+        if self.engine:
+            for entry in batch.entries:
+                if len(entry) != 3 or not entry[2].isdigit():
+                    results.append("ERROR:invalid_entry")
+                    continue
+                order = self.post_ask(Offer(entry[0], batch.name, entry[1], entry[2]))
+                results.append(format_id(order.order_id))
+            self.send_response(BatchResult(batch.rq, *results))
+            return
+
+        with self.offers_lock:
+            for entry in batch.entries:
+                if len(entry) not in (3, 4) or not all(field.isdigit() for field in entry[2:]):
+                    results.append("ERROR:invalid_entry")
+                    continue
+                search_rq = parse_id(entry[0])
+                if search_rq not in self.offers_by_rq or not self.collecting_offers(search_rq):
+                    results.append("ERROR:unknown_rq")
+                    continue
+                offer = Offer(entry[0], batch.name, entry[1], entry[2])
+                offer.offer_id = self.id_allocator.next_id()
+                offer.policy = NegotiationPolicy(accept_above=int(entry[3])) if len(entry) == 4 else None
+                self.offers_by_rq[search_rq].append(offer)
+                self.record_offer_price(offer)
+                results.append("OK")
+
+        self.send_response(BatchResult(batch.rq, *results))
+
+    def update_inventory(self):
+        """
+        Handle INVENTORY messages: a seller's standing listings
+        (item:price:quantity[:min_price]). A quantity of 0 withdraws a listing.
+        """
+        data = self.message.split()
+        inventory = Inventory(*data[1:])
+
+        if inventory.name not in self.registered_clients:
+            self.send_error(f"{inventory.name} is not registered.")
+            return
+
+        results = []
+        for entry in inventory.entries:
+            if len(entry) not in (3, 4) or not all(field.isdigit() for field in entry[1:]):
+                results.append("ERROR:invalid_entry")
+                continue
+            item_name, price, quantity = entry[0], int(entry[1]), int(entry[2])
+            min_price = int(entry[3]) if len(entry) == 4 else None
+            self.catalog.update(inventory.name, item_name, price, quantity, min_price)
+            if quantity and self.price_stats:
+                self.price_stats.record_offer(item_name, price)
+            results.append("OK")
+
+        self.send_response(BatchResult(inventory.rq, *results))
+
+    def post_bid(self, search_request):
+        """Submit a LOOKING_FOR to the matching engine as a bid at its max price."""
+        order, fills = self.engine.submit_bid(search_request.name, search_request.rq,
+                                              search_request.item_name, search_request.max_price)
+        logging.info(f"Bid {order.order_id} for {order.item_name} at {order.price}: {len(fills)} fills")
+        self.publish_fills(fills)
+        return order
+
+    def post_ask(self, offer):
+        """Submit an OFFER to the matching engine as an ask."""
+        order, fills = self.engine.submit_ask(offer.name, offer.rq, offer.item_name, offer.price)
+        self.record_offer_price(offer)
+        logging.info(f"Ask {order.order_id} for {order.item_name} at {order.price}: {len(fills)} fills")
+        self.publish_fills(fills)
+        return order
+
+    def publish_fills(self, fills):
+        """
+        Turn engine matches into reserved deals: RESERVE to the seller, FOUND to the
+        buyer, and a search/offer pair so the buyer's BUY completes as usual.
+        """
+        for fill in fills:
+            bid, ask = fill.bid, fill.ask
+            search_rq = self.id_allocator.next_id()
+            search_request = LookingFor(bid.rq, bid.owner, bid.item_name, bid.item_name, str(bid.price))
+            offer = Offer(format_id(search_rq), ask.owner, ask.item_name, str(fill.price))
+            offer.offer_id = ask.order_id
+            with self.requests_lock:
+                self.ongoing_requests[search_rq] = search_request
+            with self.offers_lock:
+                self.offers_by_rq[search_rq] = [offer]
+            # BUY finds the deal through the bidder's transaction, as for a broadcast search
+            buyer_address = self.address_of(bid.owner)
+            if buyer_address:
+                self.transactions.open(search_rq, bid.rq, bid.owner, buyer_address, bid.item_name)
+                self.advance(search_rq, OFFERED)
+                self.advance(search_rq, RESERVED, seller=ask.owner, price=fill.price, offer=offer)
+
+            self.notify(ask.owner, Reserve(ask.rq, ask.item_name, fill.price))
+            self.notify(bid.owner, Found(bid.rq, ask.item_name, fill.price))
+            logging.info(f"Matched bid {bid.order_id} with ask {ask.order_id} at {fill.price}")
+
+    def record_offer_price(self, offer):
+        if self.price_stats:
+            self.price_stats.record_offer(offer.item_name, int(offer.price))
+
+    def quote(self):
+        """
+        Handle QUOTE requests: rolling offer-price percentiles, offer count and trade
+        VWAP for each requested item, so buyers can choose a realistic max_price.
+        """
+        data = self.message.split()
+        quote_request = Quote(*data[1:])
+        if not self.price_stats:
+            self.send_error("Price statistics are not available on this server.")
+            return
+        if not quote_request.item_names:
+            self.send_error("QUOTE needs at least one item name.")
+            return
+        quotes = self.price_stats.quotes(quote_request.item_names)
+        self.send_response(QuoteRes(quote_request.rq, *(format_quote(q) for q in quotes)))
 
     def negotiate(self):
         """Handle NEGOTIATE responses."""
         data = self.message.split()
         negotiate_request = Negotiate(*data[1:])
         with self.requests_lock:
-            search_request = self.ongoing_requests.get(negotiate_request.rq)
+            search_request = self.ongoing_requests.get(parse_id(negotiate_request.rq))
         if search_request:
             seller_info = self.registered_clients.get(negotiate_request.name)
             if seller_info:
                 # Send NEGOTIATE message to the seller
                 negotiate_message = f"NEGOTIATE {negotiate_request.rq} {negotiate_request.item_name} {negotiate_request.max_price}"
-                self.udp_socket.sendto(negotiate_message.encode('utf-8'),
-                                   (seller_info["ip"], int(seller_info["udp_socket"])))
+                self.send_to((seller_info["ip"], int(seller_info["udp_socket"])), negotiate_message)
             else:
                 print(f"Seller {negotiate_request.name} not found for RQ {negotiate_request.rq}")
         else:
@@ -308,48 +888,50 @@ class ServerRequestHandler(threading.Thread):
         """
         data = self.message.split()
         accept_request = Accept(*data[1:])  
+        search_rq = parse_id(accept_request.rq)
 
-        with self.requests_lock:
-            # Retrieve the corresponding search request
-            search_request = self.ongoing_requests.get(accept_request.rq)
-            if not search_request:
-                self.send_response(f"ERROR: Request {accept_request.rq} does not exist or has been canceled.")
-                return
-
-        with self.offers_lock:
-            # Retrieve all offers for this RQ
-            offers = self.offers_by_rq.get(accept_request.rq, [])
-            # Find the lowest price offer
-            lowest_offer = min(offers, key=lambda o: int(o.price), default=None)
+        # The transaction must be waiting for this seller's answer to NEGOTIATE
+        record = self.transactions.get(search_rq)
+        if not record or record.state != NEGOTIATING:
+            self.send_error(f"Request {accept_request.rq} does not exist or has been canceled.")
+            return
 
-        if not lowest_offer or lowest_offer.item_name != accept_request.item_name:
-            self.send_response(f"ERROR: No valid offer found for RQ#: {accept_request.rq}")
+        offer = record.offer
+        if item_key(offer.item_name) != item_key(accept_request.item_name):
+            self.send_error(f"No valid offer found for RQ#: {accept_request.rq}")
             return
 
         # Get seller and buyer info
-        with self.clients_lock:
-            seller_info = self.registered_clients.get(lowest_offer.name)
-            buyer_info = self.registered_clients.get(search_request.name)
+        clients = self.registered_clients.snapshot()
+        seller_info = clients.get(record.seller)
+        buyer_info = clients.get(record.buyer)
 
         if not seller_info or not buyer_info:
-            self.send_response(f"ERROR: Seller or Buyer not registered for RQ#: {accept_request.rq}")
+            self.send_error(f"Seller or Buyer not registered for RQ#: {accept_request.rq}")
+            return
+
+        # The deal is now at the negotiated price; BUY is checked against it
+        try:
+            self.transactions.transition(search_rq, RESERVED, expected=(NEGOTIATING,),
+                                         price=int(accept_request.max_price))
+        except InvalidTransition as e:
+            self.send_error(f"{e}")
             return
+        with self.offers_lock:
+            offer.price = accept_request.max_price
+        if self.offer_cache is not None:
+            self.offer_cache.discard(record.seller, offer.item_name, offer.offer_id)
+        self.tracer.event(search_rq, "accept", seller=record.seller, price=int(accept_request.max_price))
 
         # Reserve the item with the seller offering the lowest price
         reserve = Reserve(accept_request.rq, accept_request.item_name, accept_request.max_price)
-        self.udp_socket.sendto(
-            str(reserve).encode('utf-8'),
-            (seller_info["ip"], int(seller_info["udp_socket"])),
-        )
-        print(f"Reserved item with seller {lowest_offer.name} at price {accept_request.max_price}")
+        self.send_to((seller_info["ip"], int(seller_info["udp_socket"])), reserve)
+        print(f"Reserved item with seller {record.seller} at price {accept_request.max_price}")
 
-        # Inform the buyer
-        found = Found(accept_request.rq, accept_request.item_name, accept_request.max_price)
-        self.udp_socket.sendto(
-            str(found).encode('utf-8'),
-            (buyer_info["ip"], int(buyer_info["udp_socket"])),
-        )
-        print(f"Informed buyer {search_request.name} about item availability at price {accept_request.max_price}")
+        # Inform the buyer, under the RQ# of their search
+        found = Found(record.buyer_rq, accept_request.item_name, accept_request.max_price)
+        self.send_to((buyer_info["ip"], int(buyer_info["udp_socket"])), found)
+        print(f"Informed buyer {record.buyer} about item availability at price {accept_request.max_price}")
         
     def refuse(self):
         """
@@ -358,36 +940,58 @@ class ServerRequestHandler(threading.Thread):
         data = self.message.split()
         refuse_request = Refuse(*data[1:])
 
-        with self.requests_lock:
-            # Retrieve the corresponding search request using the RQ#
-            search_request = self.ongoing_requests.get(refuse_request.rq)
-            if not search_request:
-                self.send_response(f"ERROR: Request {refuse_request.rq} does not exist or has been canceled.")
-                return
+        search_rq = parse_id(refuse_request.rq)
+        try:
+            record = self.transactions.transition(search_rq, CANCELLED, expected=(NEGOTIATING,))
+        except InvalidTransition:
+            self.send_error(f"Request {refuse_request.rq} does not exist or has been canceled.")
+            return
+        self.forget_search(search_rq)
+        self.tracer.end(search_rq, "refused")
 
         # Inform the buyer that the item is not available at the maximum price
-        not_found = NotAvailable(search_request.rq, refuse_request.item_name)
-        buyer_info = self.registered_clients.get(search_request.name)
+        not_found = NotAvailable(record.buyer_rq, refuse_request.item_name)
+        buyer_info = self.registered_clients.get(record.buyer)
         if buyer_info:
-            self.udp_socket.sendto(str(not_found).encode('utf-8'),
-                               (buyer_info["ip"], int(buyer_info["udp_socket"])))
+            self.send_to((buyer_info["ip"], int(buyer_info["udp_socket"])), not_found)
 
     def cancel(self):
-        """Handle CANCEL requests from the buyer or seller."""
+        """
+        Handle CANCEL requests. A buyer cancels with the RQ# of its search, a
+        seller with the SEARCH RQ#; a transaction that is paying cannot be cancelled.
+        """
         data = self.message.split()
-        cancel_request = Cancel(*data[1:])
-        with self.requests_lock:
-            if cancel_request.rq in self.ongoing_requests:
-                del self.ongoing_requests[cancel_request.rq]
-                response = f"CANCELED {cancel_request.rq} for {cancel_request.item_name}"
-            else:
-                response = f"ERROR: No ongoing request found for RQ: {cancel_request.rq}"
+        if len(data) < 4:
+            self.send_error("Invalid CANCEL message format.")
+            return
+        cancel_request = Cancel(*data[1:4])
 
-        with self.clients_lock:
-            seller_info = self.registered_clients.get(cancel_request.name)
-            if seller_info:
-                self.udp_socket.sendto(response.encode('utf-8'),
-                                    (seller_info["ip"], int(seller_info["udp_socket"])))
+        records = self.transactions.for_buyer(self.client_address, cancel_request.rq, cancel_request.item_name)
+        record = records[0] if records else self.transactions.get(parse_id(cancel_request.rq))
+        if record and not records and not (record.seller and self.sent_by(record.seller)):
+            record = None  # Buyer RQ#s and SEARCH RQ#s overlap; only the seller may cancel by SEARCH RQ#
+        if not record:
+            self.send_error(f"No ongoing request found for RQ: {cancel_request.rq}")
+            return
+        was_reserved = record.state == RESERVED
+        try:
+            self.transactions.transition(record.search_rq, CANCELLED, expected=CANCELLABLE)
+        except InvalidTransition as e:
+            self.send_error(f"{e}")
+            return
+
+        search_rq = record.search_rq
+        self.forget_cancelled(search_rq)
+        if was_reserved and records:
+            # The buyer backed out; release the seller's reservation
+            self.notify(record.seller, f"CANCEL {format_id(search_rq)} Buyer cancelled")
+        elif was_reserved:
+            # The seller did not confirm the RESERVE, e.g. a cached offer that no longer stands
+            self.notify(record.buyer, f"CANCEL {record.buyer_rq} Seller cancelled")
+            if self.offer_cache is not None:
+                self.offer_cache.discard(record.seller, record.offer.item_name)
+        self.tracer.end(search_rq, "cancelled")
+        self.send_response(f"CANCELED {cancel_request.rq} for {cancel_request.item_name}")
 
     def buy(self):
         """
@@ -395,58 +999,79 @@ class ServerRequestHandler(threading.Thread):
         """
         data = self.message.split()
         if len(data) < 4:
-            self.send_response("ERROR: Invalid BUY message format.")
+            self.send_error("Invalid BUY message format.")
             return
 
         buy_request = Buy(*data[1:])
         
-        # Find the search request
-        with self.requests_lock:
-            # Look for the search request that matches this buy request
-            search_request = None
-            for rq, req in self.ongoing_requests.items():
-                if (isinstance(req, LookingFor) and 
-                    req.item_name == buy_request.item_name and 
-                    req.name in self.registered_clients):
-                    search_request = req
-                    search_rq = rq
-                    break
-
-        if not search_request:
-            self.send_response(f"ERROR: No matching search request found for item {buy_request.item_name}")
+        # The buyer's reservation for this RQ# and item (PAYING ones fail the claim below)
+        reserved = [record for record in self.transactions.for_buyer(
+                        self.client_address, buy_request.rq, buy_request.item_name)
+                    if record.state in (RESERVED, PAYING)]
+        if not reserved:
+            self.send_error(f"No matching search request found for item {buy_request.item_name}")
+            return
+        record = reserved[0]
+        if record.price != int(buy_request.price):
+            self.send_error(f"No matching offer found for item {buy_request.item_name} at price {buy_request.price}")
             return
+        search_rq = record.search_rq
+        reserved_offer = record.offer
+        self.tracer.event(search_rq, "buy", price=int(buy_request.price))
 
         # Get buyer info
-        buyer_info = self.registered_clients.get(search_request.name)
+        search_request = self.ongoing_requests.get(search_rq)
+        buyer_info = self.registered_clients.get(record.buyer) if search_request else None
         if not buyer_info:
-            self.send_response("ERROR: Buyer not registered.")
+            self.send_error("Buyer not registered.")
             return
 
-        # Find the reserved offer
-        with self.offers_lock:
-            offers = self.offers_by_rq.get(search_rq, [])
-            reserved_offer = None
-            for offer in offers:
-                if (offer.item_name == buy_request.item_name and 
-                    int(offer.price) == int(buy_request.price)):
-                    reserved_offer = offer
-                    break
+        # Get seller info
+        seller_info = self.registered_clients.get(record.seller)
+        if not seller_info:
+            self.send_error("Seller not found.")
+            return
+        if not self.reachable(record.seller):
+            # Its heartbeats stopped; INFORM_REQ would only time out
+            if self.advance(search_rq, CANCELLED):
+                self.forget_search(search_rq)
+                self.tracer.end(search_rq, "seller_dead")
+            self.send_error(f"Seller of {buy_request.item_name} is not responding; search again.")
+            return
 
-        if not reserved_offer:
-            self.send_response(f"ERROR: No matching offer found for item {buy_request.item_name} at price {buy_request.price}")
+        # Claim the offer; a concurrent BUY for it is answered here, before any network I/O
+        token = self.reservations.claim(reserved_offer.offer_id)
+        if token is None:
+            if self.reservations.sold(reserved_offer.offer_id) and self.advance(search_rq, CANCELLED):
+                self.forget_search(search_rq)
+                self.tracer.end(search_rq, "sold_out")
+                self.send_error(f"{reserved_offer.item_name} has already been sold; search again.")
+                return
+            self.send_error(f"{reserved_offer.item_name} is already being bought.")
+            return
+        try:
+            self.transactions.transition(search_rq, PAYING, expected=(RESERVED,))
+        except InvalidTransition as e:
+            self.reservations.release(reserved_offer.offer_id, token)
+            self.send_error(f"{e}")
             return
 
-        # Get seller info
-        seller_info = self.registered_clients.get(reserved_offer.name)
-        if not seller_info:
-            self.send_response("ERROR: Seller not found.")
+        # Take catalog stock before contacting buyer and seller
+        from_catalog = getattr(reserved_offer, "from_catalog", False)
+        if from_catalog and not self.catalog.consume(reserved_offer.name, reserved_offer.item_name):
+            self.advance(search_rq, CANCELLED)
+            self.forget_search(search_rq)
+            self.reservations.release(reserved_offer.offer_id, token)
+            self.send_error(f"{reserved_offer.item_name} is sold out.")
             return
 
         # Initiate TCP transaction
+        handed_on = False
         try:
-            buyer_response, seller_response = self.initiate_tcp_transaction(
-                buyer_info, seller_info, buy_request.item_name, buy_request.price
-            )
+            with self.tracer.span(search_rq, "inform_req"):
+                buyer_response, seller_response = self.initiate_tcp_transaction(
+                    buyer_info, seller_info, buy_request.item_name, buy_request.price
+                )
 
             if not buyer_response or not seller_response:
                 self.cancel_transaction(
@@ -469,31 +1094,72 @@ class ServerRequestHandler(threading.Thread):
             seller_cc = seller_parts[3] if len(seller_parts) > 3 else "unknown"
             buyer_address = ' '.join(buyer_parts[5:]) if len(buyer_parts) > 5 else "unknown"
 
-            # Simulate payment processing
-            if not self.simulate_payment(buyer_cc, seller_cc, buy_request.price):
+            finish = functools.partial(self.finish_purchase, buy_request, search_rq, search_request,
+                                       buyer_info, seller_info, buyer_address, reserved_offer, from_catalog, token)
+            payment_start = time.time()
+            if self.settlement:
+                # Payment settles in the background; the BUY completes when its batch is done
+                self.settlement.submit(Payment(
+                    buy_request.rq, buyer_cc, seller_cc, buy_request.price,
+                    lambda payment, paid: threading.Thread(target=finish, args=(paid, payment_start)).start()))
+                handed_on = True
+                return
+
+            # Without a settlement queue, pay inline
+            handed_on = True
+            finish(self.simulate_payment(buyer_cc, seller_cc, buy_request.price), payment_start)
+
+        except Exception as e:
+            logging.error(f"Error during BUY transaction: {e}")
+            self.cancel_transaction(buy_request.rq, buyer_info, seller_info, f"Transaction error: {str(e)}")
+        finally:
+            if not handed_on:
+                self.end_purchase(search_rq, False, reserved_offer, from_catalog, token)
+
+    def finish_purchase(self, buy_request, search_rq, search_request, buyer_info, seller_info,
+                        buyer_address, reserved_offer, from_catalog, token, paid, payment_start):
+        """Ship and confirm a BUY once its payment is settled, or cancel it if the payment failed."""
+        completed = False
+        try:
+            self.tracer.stage(search_rq, "payment", payment_start, paid=paid)
+            if not paid:
                 self.cancel_transaction(buy_request.rq, buyer_info, seller_info, "Payment processing failed")
                 return
 
             # Send shipping information to seller
             shipping_info = ShippingInfo(buy_request.rq, search_request.name, buyer_address)
-            self.send_tcp_message(seller_info["ip"], int(seller_info["tcp_socket"]), str(shipping_info))
+            if self.outbound:
+                # The seller does not answer SHIPPING_INFO, so only send it
+                self.outbound.send_tcp((seller_info["ip"], int(seller_info["tcp_socket"])), str(shipping_info))
+                self.tracer.event(search_rq, "shipping_info")
+            else:
+                with self.tracer.span(search_rq, "shipping_info"):
+                    self.send_tcp_oneway(seller_info["ip"], int(seller_info["tcp_socket"]), str(shipping_info))
 
             # Send success response to buyer
             self.send_response(f"TRANSACTION_SUCCESS {buy_request.rq} {buy_request.item_name} {buy_request.price}")
-            
-            # Clean up
-            with self.requests_lock:
-                if search_rq in self.ongoing_requests:
-                    del self.ongoing_requests[search_rq]
-            with self.offers_lock:
-                if search_rq in self.offers_by_rq:
-                    del self.offers_by_rq[search_rq]
-            
+            if self.price_stats:
+                self.price_stats.record_trade(buy_request.item_name, int(buy_request.price))
+
             print(f"Transaction {buy_request.rq} completed successfully.")
+            completed = True
             
         except Exception as e:
             logging.error(f"Error during BUY transaction: {e}")
             self.cancel_transaction(buy_request.rq, buyer_info, seller_info, f"Transaction error: {str(e)}")
+        finally:
+            self.end_purchase(search_rq, completed, reserved_offer, from_catalog, token)
+
+    def end_purchase(self, search_rq, completed, reserved_offer, from_catalog, token):
+        self.advance(search_rq, SHIPPED if completed else CANCELLED)
+        self.forget_search(search_rq)
+        if completed:
+            self.reservations.settle(reserved_offer.offer_id, token)  # Copies of the offer elsewhere stay unbuyable
+        else:
+            self.reservations.release(reserved_offer.offer_id, token)
+        self.tracer.end(search_rq, "completed" if completed else "failed")
+        if from_catalog and not completed:
+            self.catalog.release(reserved_offer.name, reserved_offer.item_name)
 
     def initiate_tcp_transaction(self, buyer_info, seller_info, item_name, price):
         """Handle transaction details over TCP."""
@@ -505,12 +1171,20 @@ class ServerRequestHandler(threading.Thread):
             buyer_tcp = (buyer_info["ip"], int(buyer_info["tcp_socket"]))
             seller_tcp = (seller_info["ip"], int(seller_info["tcp_socket"]))
 
-            # Send INFORM_REQ to buyer
             inform_message = f"INFORM_REQ {item_name} {price}"
-            buyer_response = self.send_tcp_message(buyer_tcp[0], buyer_tcp[1], inform_message)
-            
-            # Send INFORM_REQ to seller  
-            seller_response = self.send_tcp_message(seller_tcp[0], seller_tcp[1], inform_message)
+            if self.outbound:
+                # Ask buyer and seller at the same time
+                buyer_future = self.outbound.request_tcp(buyer_tcp, inform_message, timeout=INFORM_TIMEOUT)
+                seller_future = self.outbound.request_tcp(seller_tcp, inform_message, timeout=INFORM_TIMEOUT)
+                buyer_response, seller_response = buyer_future.result(), seller_future.result()
+            else:
+                # Send INFORM_REQ to buyer
+                buyer_response = self.send_tcp_message(buyer_tcp[0], buyer_tcp[1], inform_message,
+                                                       timeout=INFORM_TIMEOUT)
+
+                # Send INFORM_REQ to seller
+                seller_response = self.send_tcp_message(seller_tcp[0], seller_tcp[1], inform_message,
+                                                        timeout=INFORM_TIMEOUT)
 
             logging.info(f"Buyer Response: {buyer_response}")
             logging.info(f"Seller Response: {seller_response}")
@@ -521,10 +1195,10 @@ class ServerRequestHandler(threading.Thread):
             logging.error(f"Error during TCP transaction: {e}")
             return None, None
 
-    def send_tcp_message(self, client_ip, client_port, message):
+    def send_tcp_message(self, client_ip, client_port, message, timeout=10):
         """Send a message via TCP and return the response."""
         try:
-            with socket.create_connection((client_ip, client_port), timeout=10) as tcp_socket:
+            with socket.create_connection((client_ip, client_port), timeout=timeout) as tcp_socket:
                 tcp_socket.sendall(message.encode('utf-8'))
                 response = tcp_socket.recv(1024).decode('utf-8')
                 logging.info(f"TCP Response from {client_ip}:{client_port} - {response}")
@@ -533,6 +1207,16 @@ class ServerRequestHandler(threading.Thread):
             logging.error(f"Error during TCP communication with {client_ip}:{client_port} - {e}")
             return None
     
+    def send_tcp_oneway(self, client_ip, client_port, message, timeout=10):
+        """Send a message via TCP that gets no reply. Returns False on error."""
+        try:
+            with socket.create_connection((client_ip, client_port), timeout=timeout) as tcp_socket:
+                tcp_socket.sendall(message.encode('utf-8'))
+                return True
+        except Exception as e:
+            logging.error(f"Error sending TCP message to {client_ip}:{client_port} - {e}")
+            return False
+
     def cancel_transaction(self, rq, buyer_info, seller_info, reason):
         """
         Cancel the transaction and notify buyer and seller.
@@ -540,15 +1224,10 @@ class ServerRequestHandler(threading.Thread):
         cancel_message = f"CANCEL {rq} {reason}"
 
         if buyer_info:
-            self.udp_socket.sendto(cancel_message.encode('utf-8'),
-                                (buyer_info["ip"], int(buyer_info["udp_socket"])))
+            self.send_to((buyer_info["ip"], int(buyer_info["udp_socket"])), cancel_message)
 
         if seller_info:
-            self.udp_socket.sendto(cancel_message.encode('utf-8'),
-                                (seller_info["ip"], int(seller_info["udp_socket"])))
-
-        # Clean up buyer_rq_map
-        self.buyer_rq_map.pop(rq, None)
+            self.send_to((seller_info["ip"], int(seller_info["udp_socket"])), cancel_message)
 
         print(f"Transaction {rq} cancelled: {reason}")
 
@@ -558,8 +1237,8 @@ class ServerRequestHandler(threading.Thread):
         """
         try:
             print(f"Processing payment: Charging buyer CC: {buyer_cc}, Crediting seller CC: {seller_cc}")
-            seller_amount = int(price) * 0.9  # Deduct 10% transaction fee
-            print(f"Payment successful: Seller credited with {seller_amount}")
+            payment = Payment(None, buyer_cc, seller_cc, price)  # Integer cents, 10% fee deducted
+            print(f"Payment successful: Seller credited with {format_cents(payment.seller_amount)}")
             return True
         except Exception as e:
             print(f"Payment simulation error: {e}")
@@ -573,5 +1252,23 @@ class ServerRequestHandler(threading.Thread):
         while time.time() - start_time < timeout:
             with self.offers_lock:
                 collected_offers = self.offers_by_rq.get(rq, [])
-            time.sleep(1)  # Allow time for other threads to process offers
-        return collected_offers
\ No newline at end of file
+            # Allow time for other threads to process offers
+            if self.handed_off.wait(min(1, max(0, timeout - (time.time() - start_time)))):
+                return None
+        with self.offers_lock:
+            return list(self.offers_by_rq.get(rq, []))
+
+    def resume_search(self, search_rq, search_request):
+        """
+        Finish a search handed over by a previous server process: wait out the
+        rest of its offer window, then answer the buyer as search_item would.
+        """
+        remaining = max(0, search_request.window_ends - time.time())
+        logging.info(f"Resuming search {search_rq} with {remaining:.1f}s of its offer window left")
+        pool = self.search_pools.pool_of(search_rq)
+        if pool:
+            offers = self.pooled_offers(search_rq, pool)
+        else:
+            offers = self.collect_responses(search_rq, timeout=remaining)
+        if offers is not None:
+            self.finish_search(search_request.rq, search_rq, search_request, offers)
\ No newline at end of file
@@ -0,0 +1,151 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from decimal import Decimal, ROUND_HALF_UP
+from threading import Lock
+
+FEE_RATE = Decimal("0.10")  # Marketplace fee deducted from the seller's credit
+SETTLEMENT_INTERVAL = 0.2  # Seconds between settlement batches
+MAX_BATCH = 100  # Payments handed to the processor at once
+
+
+def to_cents(price):
+    """Integer cents for a price given as int, str or Decimal ("30", "29.99")."""
+    return int((Decimal(str(price)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_cents(cents):
+    return f"{cents // 100}.{cents % 100:02d}"
+
+
+class Payment:
+    """One charge to the buyer and the matching credit to the seller, in integer cents."""
+    __slots__ = ("transaction_id", "buyer_cc", "seller_cc", "amount", "fee", "seller_amount",
+                 "on_settled", "submitted")
+
+    def __init__(self, transaction_id, buyer_cc, seller_cc, price, on_settled=None):
+        self.transaction_id = transaction_id
+        self.buyer_cc = buyer_cc
+        self.seller_cc = seller_cc
+        self.amount = to_cents(price)
+        self.fee = int((self.amount * FEE_RATE).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+        self.seller_amount = self.amount - self.fee
+        self.on_settled = on_settled  # on_settled(payment, ok), called once the batch is settled
+        self.submitted = time.time()
+
+
+class PaymentProcessor:
+    """Backend interface: settle a batch of payments and return one success flag per payment."""
+
+    def settle(self, payments):
+        raise NotImplementedError
+
+
+class SimulatedProcessor(PaymentProcessor):
+    """
+    Local stand-in for a payment backend. Every batch takes `latency` seconds
+    (one round trip, however many payments it holds) and each payment fails
+    with probability `failure_rate`.
+    """
+
+    def __init__(self, latency=0.05, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    def settle(self, payments):
+        time.sleep(self.latency)
+        results = []
+        for payment in payments:
+            ok = self._random.random() >= self.failure_rate
+            if ok:
+                print(f"Payment successful: Charged buyer CC: {payment.buyer_cc} {format_cents(payment.amount)}, "
+                      f"credited seller CC: {payment.seller_cc} {format_cents(payment.seller_amount)}")
+            else:
+                print(f"Payment declined: transaction {payment.transaction_id}")
+            results.append(ok)
+        return results
+
+
+class SettlementQueue:
+    """
+    Payment stage that runs beside the request handlers. BUY handlers submit
+    a Payment and return; a worker thread hands the queued payments to the
+    processor in batches every `interval` seconds and calls each payment's
+    on_settled(payment, ok). A processor error fails the whole batch.
+    """
+
+    def __init__(self, processor=None, interval=SETTLEMENT_INTERVAL, max_batch=MAX_BATCH):
+        self.processor = processor or SimulatedProcessor()
+        self.interval = interval
+        self.max_batch = max_batch
+        self._queue = deque()
+        self._lock = Lock()
+        self._wakeup = threading.Event()
+        self._running = False
+        self._thread = None
+        self.settled = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="settlement", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        """Settle what is still queued, then stop the worker."""
+        self._running = False
+        self._wakeup.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def submit(self, payment):
+        if not self._running:
+            raise RuntimeError("The settlement queue is not running")
+        with self._lock:
+            self._queue.append(payment)
+
+    def pending(self):
+        with self._lock:
+            return len(self._queue)
+
+    def describe(self):
+        return [f"settlement_pending {self.pending()}", f"settlement_batches {self.batches}",
+                f"payments_settled {self.settled}", f"payments_failed {self.failed}"]
+
+    def _next_batch(self):
+        with self._lock:
+            return [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            batch = self._next_batch()
+            while batch:
+                self.settle_batch(batch)
+                batch = self._next_batch()
+            if not self._running:
+                break
+
+    def settle_batch(self, batch):
+        try:
+            results = self.processor.settle(batch)
+        except Exception as e:
+            logging.error(f"Payment processor failed a batch of {len(batch)}: {e}")
+            results = [False] * len(batch)
+        self.batches += 1
+        for payment, ok in zip(batch, results):
+            if ok:
+                self.settled += 1
+            else:
+                self.failed += 1
+            if payment.on_settled:
+                try:
+                    payment.on_settled(payment, ok)
+                except Exception as e:
+                    logging.error(f"Settlement callback for transaction {payment.transaction_id} failed: {e}")
@@ -1,148 +1,101 @@
-import socket
-import threading
-import select
-import time
+from marketClient import MarketClient
+from clientRuntime import ClientRuntime, INFORM_TIMEOUT, BUY_TIMEOUT
 
 SERVER_IP = '127.0.0.1'
 SERVER_PORT = 5005
 TCP_PORT = 5006  # TCP port for additional functionality
 
 # Internal configuration
-request_counter = 1  # Tracks request numbers for the client
+client = None  # MarketClient owning this client's UDP and TCP sockets
+runtime = None  # ClientRuntime queueing notifications that need an answer
 client_name = None  # Client's name
-client_udp_port = None  # UDP port for this client
-client_tcp_port = None  # TCP port for this client
-tcp_server_socket = None  # TCP server socket for listening
-udp_socket = None  # Global UDP socket
 
-def send_command_with_response(command):
+def print_response(future):
     """
-    Sends a command to the server and returns the server's response.
+    Prints the server's response once a request completes.
     """
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    client_socket.settimeout(60)  # Timeout for server response
     try:
-        client_socket.sendto(command.encode('utf-8'), (SERVER_IP, SERVER_PORT))
-        response, _ = client_socket.recvfrom(1024)
-        return response.decode('utf-8')
-    except socket.timeout:
+        response = future.result()
+    except TimeoutError:
         print("Server is not responding. Please try again later.")
-        return None
+        return
     except Exception as e:
         print(f"Error: {e}")
-        return None
-    finally:
-        client_socket.close()
+        return
+    if not response.startswith("ERROR"):  # handle_error already printed it
+        print(f"Server response: {response}")
 
-def send_command(command):
+def wait_for_response(future):
     """
-    Sends a command to the server and prints the response.
+    Waits for the server's response to a request and returns it.
     """
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    client_socket.settimeout(120)  # Timeout for server response
     try:
-        client_socket.sendto(command.encode('utf-8'), (SERVER_IP, SERVER_PORT))
-        response, _ = client_socket.recvfrom(1024)
-        print(f"Server response: {response.decode('utf-8')}")
-    except socket.timeout:
+        return future.result()
+    except TimeoutError:
         print("Server is not responding. Please try again later.")
+        return None
     except Exception as e:
         print(f"Error: {e}")
-    finally:
-        client_socket.close()
+        return None
 
-def setup_tcp_server():
-    """Setup TCP server to listen for incoming connections from the main server."""
-    global tcp_server_socket, client_tcp_port
-    
-    try:
-        tcp_server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        tcp_server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        tcp_server_socket.bind(('127.0.0.1', 0))  # OS chooses available port
-        client_tcp_port = tcp_server_socket.getsockname()[1]
-        tcp_server_socket.listen(5)
-        
-        print(f"Client TCP server listening on port {client_tcp_port}")
-        
-        # Start TCP listener thread
-        tcp_listener = threading.Thread(target=handle_tcp_connections, daemon=True)
-        tcp_listener.start()
-        
-        return True
-    except Exception as e:
-        print(f"Error setting up TCP server: {e}")
-        return False
+def start_client():
+    """
+    Starts the client library and registers the notification handlers.
+    """
+    global client, runtime
+    client = MarketClient(server_ip=SERVER_IP, server_port=SERVER_PORT).start()
+    runtime = ClientRuntime(client, on_pending=notify_pending, on_reply=print_response)
+    client.on("SEARCH", handle_search)
+    client.on("RESERVE", handle_reserve)
+    client.on("NOT_AVAILABLE", handle_not_available)
+    client.on("ACCEPT", lambda parts: print(f"Item accepted for sale: {parts[1:]}"))
+    client.on("REFUSE", handle_refuse)
+    client.on("TRANSACTION_SUCCESS", handle_transaction_success)
+    client.on("CANCEL", lambda parts: print(f"Transaction cancelled: {' '.join(parts[1:])}"))
+    client.on("SHIPPING_INFO", handle_shipping_info)
+    client.on("ERROR", handle_error)
+    print(f"Client listening on UDP port {client.udp_port} and TCP port {client.tcp_port}")
 
-def handle_tcp_connections():
-    """Handle incoming TCP connections from the server."""
-    global tcp_server_socket
-    
-    while True:
-        try:
-            if tcp_server_socket:
-                client_conn, addr = tcp_server_socket.accept()
-                print(f"TCP connection accepted from {addr}")
-                
-                # Handle the connection in a separate thread
-                conn_thread = threading.Thread(
-                    target=handle_tcp_client, 
-                    args=(client_conn, addr), 
-                    daemon=True
-                )
-                conn_thread.start()
-        except Exception as e:
-            print(f"Error accepting TCP connection: {e}")
-            break
-
-def handle_tcp_client(client_conn, addr):
-    """Handle individual TCP client connection."""
-    try:
-        while True:
-            message = client_conn.recv(1024).decode('utf-8')
-            if not message:
-                break
-                
-            print(f"\nTCP Message from {addr}: {message}")
-            
-            # Process the message
-            parts = message.split()
-            if len(parts) >= 1:
-                message_type = parts[0]
-                
-                if message_type == "INFORM_REQ":
-                    response = handle_inform_req(parts)
-                    if response:
-                        client_conn.send(response.encode('utf-8'))
-                elif message_type == "SHIPPING_INFO":
-                    handle_shipping_info(parts)
-                elif message_type == "CANCEL":
-                    print(f"Transaction cancelled: {' '.join(parts[1:])}")
-                else:
-                    print(f"Unknown TCP message type: {message_type}")
-                    
-    except Exception as e:
-        print(f"Error handling TCP client {addr}: {e}")
-    finally:
-        client_conn.close()
+def notify_pending(decision):
+    """
+    Tells the user a notification is waiting for an answer.
+    """
+    print(f"\n{decision.kind} received: {decision}")
+    if decision.kind == "INFORM_REQ":
+        print(f"Choose option 12 (Answer pending notifications) within {INFORM_TIMEOUT} seconds, "
+              "or the purchase is cancelled.")
+    else:
+        print("Choose option 12 (Answer pending notifications) to respond.")
+
+def answer_pending():
+    """
+    Prompts the user for every notification waiting for an answer.
+    """
+    handlers = {
+        "FOUND": handle_found,
+        "NEGOTIATE": handle_negotiation,
+        "INFORM_REQ": handle_inform_req,
+    }
+    decision = runtime.next_decision()
+    if not decision:
+        print("No pending notifications.")
+    while decision:
+        runtime.resolve(decision, handlers[decision.kind](decision.parts))
+        decision = runtime.next_decision()
 
 def handle_inform_req(parts):
     """
-    Handles the INFORM_REQ message from the server and returns INFORM_RES.
+    Handles the INFORM_REQ message from the server and returns the INFORM_RES details.
     """
-    if len(parts) < 4:
+    if len(parts) < 3:
         print("Invalid INFORM_REQ message format.")
         return None
 
-    # Extract item name and price (RQ might not be present in some formats)
-    try:
-        if parts[1].isdigit():  # If second part is RQ number
-            rq, item_name, price = parts[1], parts[2], parts[3]
-        else:  # If no RQ number
-            item_name, price = parts[1], parts[2]
-            rq = "1"  # Default RQ
-    except IndexError:
-        print("Error parsing INFORM_REQ message")
-        return None
+    # The server sends INFORM_REQ <item> <price>; an RQ number may precede the item
+    if len(parts) > 3 and parts[1].isdigit():
+        item_name, price = parts[2], parts[3]
+    else:
+        item_name, price = parts[1], parts[2]
 
     print(f"INFORM_REQ received for Item={item_name}, Price={price}")
 
@@ -159,10 +112,9 @@ def handle_inform_req(parts):
     if not address:
         address = "123 Main St, City, State"  # Default for testing
 
-    # Send INFORM_RES
-    inform_res_response = f"INFORM_RES {rq} {client_name} {cc_number} {cc_exp_date} {address}"
-    print(f"Sending: {inform_res_response}")
-    return inform_res_response
+    # The client library sends these back as INFORM_RES
+    print("Sending payment and shipping details.")
+    return cc_number, cc_exp_date, address
 
 def handle_shipping_info(parts):
     """
@@ -178,99 +130,44 @@ def handle_shipping_info(parts):
 
 def handle_negotiation(parts):
     """
-    Handles the NEGOTIATE message received from the server.
+    Asks whether to accept a NEGOTIATE request; the runtime sends ACCEPT or REFUSE.
     """
     rq, item_name, max_price = parts[1], parts[2], parts[3]
     print(f"Negotiation Request: {item_name} for max price {max_price}")
     response = input("Do you accept the price? (yes/no): ").strip().lower()
-
-    if response == "yes":
-        command = f"ACCEPT {rq} {item_name} {max_price}"
-    else:
-        command = f"REFUSE {rq} {item_name} {max_price}"
-
-    send_command(command)
+    return response == "yes"
 
 def handle_found(parts):
     """
-    Handles the FOUND message received from the server.
+    Asks whether to buy a FOUND item; the runtime sends BUY or CANCEL.
     """
     rq, item_name, price = parts[1], parts[2], parts[3]
-    print(f"Item Found: {item_name} for price {price}")
+    print(f"Item Found: RQ={rq}, {item_name} for price {price}")
     response = input("Do you want to buy the item? (yes/no): ").strip().lower()
+    return response == "yes"
+
 
-    if response == "yes":
-        buy_item(rq, item_name, price)
-    else:
-        cancel_item(rq, item_name, price)
-        
 def buy_item(rq, item_name, price):
     """
     Sends a BUY request to the server.
     """
-    command = f"BUY {rq} {item_name} {price}"
-    send_command(command)
+    client.buy(rq, item_name, price, timeout=BUY_TIMEOUT).add_done_callback(print_response)
     print(f"BUY request sent for {item_name} at {price}.")
 
 def cancel_item(rq, item_name, price):
     """
     Sends a CANCEL request to the server.
     """
-    command = f"CANCEL {rq} {item_name} {price}"
-    send_command(command)
+    client.cancel(rq, item_name, price).add_done_callback(print_response)
 
-def listen_for_udp():
+def handle_error(parts):
     """
-    Continuously listens for incoming UDP messages and processes them.
+    Handles ERROR replies, including those to offers, which nothing waits on.
     """
-    global udp_socket
-    if not udp_socket:
-        print("UDP socket is not initialized.")
-        return
-
-    print(f"Listening for UDP messages on port {client_udp_port}...")
-
-    while True:
-        try:
-            # Wait for the socket to be ready for reading
-            ready, _, _ = select.select([udp_socket], [], [], 1)
-            if ready:
-                message, address = udp_socket.recvfrom(1024)
-                decoded_message = message.decode('utf-8')
-                print(f"\nUDP Message from {address}: {decoded_message}")
-                process_message(decoded_message)
-        except Exception as e:
-            print(f"Error receiving UDP message: {e}")
-            break
-
-def process_message(message):
-    """
-    Process a specific UDP message based on its type.
-    """
-    parts = message.split()
-    if len(parts) == 0:
-        return
-        
-    message_type = parts[0]
-    
-    if message_type == "SEARCH":
-        handle_search(parts)
-    elif message_type == "RESERVE":
-        handle_reserve(parts)
-    elif message_type == "FOUND":
-        handle_found(parts)
-    elif message_type == "NEGOTIATE":
-        handle_negotiation(parts)
-    elif message_type == "NOT_AVAILABLE":
-        handle_not_available(parts)
-    elif message_type == "ACCEPT":
-        print(f"Item accepted for sale: {parts[1:]}")
-    elif message_type == "REFUSE":
-        handle_refuse(parts)
-    elif message_type == "TRANSACTION_SUCCESS":
-        handle_transaction_success(parts)
-    elif message_type == "CANCEL":
-        print(f"Transaction cancelled: {' '.join(parts[1:])}")
+    if parts[0] == "ERROR:":  # No RQ#: the error answers an OFFER, ACCEPT or REFUSE
+        print(f"Server error: {' '.join(parts[1:])}")
+    else:
+        print(f"Server error for RQ {parts[1]}: {' '.join(parts[2:])}")
 
 def handle_search(parts):
     """
@@ -282,7 +179,7 @@ def handle_search(parts):
         
     search_rq, item_name, item_description, requester_name = parts[1], parts[2], parts[3], parts[4]
     print(f"\nSEARCH received: {item_name} ({item_description}) requested by {requester_name}")
-    print("You can respond by choosing option 4 (Offer an item) from the menu.")
+    print("You can respond by choosing option 4 (Offer an item) or 8 (Offer several items) from the menu.")
 
 def handle_reserve(parts):
     """
@@ -332,7 +229,7 @@ def register():
     """
     Registers the client with the server.
     """
-    global client_name, client_udp_port, client_tcp_port, request_counter, udp_socket
+    global client_name
 
     if client_name:
         print(f"You are already registered as {client_name}.")
@@ -343,69 +240,39 @@ def register():
         print("Name cannot be empty.")
         return
 
-    # Setup TCP server first
-    if not setup_tcp_server():
-        print("Failed to setup TCP server. Registration aborted.")
-        return
-
-    # Initialize and bind the global UDP socket
-    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    udp_socket.bind(('127.0.0.1', 0))  # OS chooses an available port
-    client_udp_port = udp_socket.getsockname()[1]
-
-    command = f"REGISTER {request_counter} {name} 127.0.0.1 {client_udp_port} {client_tcp_port}"
-    response = send_command_with_response(command)
+    response = wait_for_response(client.register(name))
 
     if response and response.startswith("REGISTERED"):
         print(response)
         client_name = name  # Set the client name only on success
-        
-        # Start UDP listener
-        udp_listener = threading.Thread(target=listen_for_udp, daemon=True)
-        udp_listener.start()
     elif response and response.startswith("REGISTER-DENIED"):
         print(response)
         client_name = None  # Ensure client_name is not set
-        # Close TCP server if registration failed
-        if tcp_server_socket:
-            tcp_server_socket.close()
     else:
         print("Registration failed. Please try again.")
 
-    request_counter += 1
-
 def deregister():
     """
     Deregisters the client from the server.
     """
-    global client_name, request_counter, tcp_server_socket
+    global client_name
 
     if not client_name:
         print("You need to register first.")
         return
 
-    command = f"DE-REGISTER {request_counter} {client_name}"
-    response = send_command_with_response(command)
+    response = wait_for_response(client.deregister())
 
     if response and response.startswith("DE-REGISTERED"):
         print(response)
         client_name = None  # Clear the client name after successful deregistration
-        
-        # Close TCP server
-        if tcp_server_socket:
-            tcp_server_socket.close()
-            tcp_server_socket = None
     else:
         print(response or "Deregistration failed. Please try again.")
 
-    request_counter += 1
-
 def look_for():
     """
     Sends a LOOKING_FOR request to the server.
     """
-    global request_counter
-
     if not client_name:
         print("You need to register first.")
         return
@@ -418,16 +285,15 @@ def look_for():
         print("Invalid input. Please try again.")
         return
 
-    command = f"LOOKING_FOR {request_counter} {client_name} {item_name} {description} {max_price}"
-    send_command(command)
-    request_counter += 1
+    # The FOUND / NOT_AVAILABLE reply is handled by the notification handlers
+    rq = client.next_rq()
+    client.look_for(item_name, description, max_price, rq=rq, timeout=120)
+    print(f"Search sent with RQ {rq}. You will be notified when offers are collected.")
 
 def offer():
     """
     Sends an OFFER to the server.
     """
-    global request_counter
-
     if not client_name:
         print("You need to register first.")
         return
@@ -439,80 +305,147 @@ def offer():
 
     item_name = input("Enter the item name: ").strip()
     price = input("Enter your offer price: ").strip()
+    accept_above = input("Lowest price to accept automatically if negotiated (blank to be asked): ").strip()
+
+    if not item_name or not price.isdigit() or (accept_above and not accept_above.isdigit()):
+        print("Invalid input. Please try again.")
+        return
+
+    client.offer(rq, item_name, price, accept_above=accept_above or None)
+    print("Offer sent.")
+
+def look_for_batch():
+    """
+    Sends a LOOKING_FOR_BATCH request for several items at once.
+    """
+    if not client_name:
+        print("You need to register first.")
+        return
+
+    line = input("Enter items as item:description:max_price separated by spaces: ").strip()
+    entries = [entry.split(":") for entry in line.split()]
+
+    if not entries or any(len(entry) != 3 or not entry[2].isdigit() for entry in entries):
+        print("Invalid input. Please try again.")
+        return
+
+    batch_future, _ = client.look_for_batch(entries, timeout=120)
+    print_response_when_done(batch_future)
+    print("Searches sent. You will be notified when offers are collected.")
+
+def offer_batch():
+    """
+    Sends an OFFER_BATCH with offers for several SEARCH requests at once.
+    """
+    if not client_name:
+        print("You need to register first.")
+        return
+
+    line = input("Enter offers as rq:item:price[:accept_above] separated by spaces: ").strip()
+    entries = [entry.split(":") for entry in line.split()]
+
+    if not entries or any(len(entry) not in (3, 4) or not all(f.isdigit() for f in entry[2:])
+                          for entry in entries):
+        print("Invalid input. Please try again.")
+        return
+
+    print_response_when_done(client.offer_batch(entries))
+
+def upload_inventory():
+    """
+    Uploads standing inventory the server can sell from without a SEARCH broadcast.
+    """
+    if not client_name:
+        print("You need to register first.")
+        return
+
+    line = input("Enter listings as item:price:quantity[:min_price] separated by spaces: ").strip()
+    entries = [entry.split(":") for entry in line.split()]
+
+    if not entries or any(len(entry) not in (3, 4) or not all(f.isdigit() for f in entry[1:])
+                          for entry in entries):
+        print("Invalid input. Please try again.")
+        return
+
+    print_response_when_done(client.inventory(entries))
 
-    if not item_name or not price.isdigit():
+def quote():
+    """
+    Asks the server for recent offer and trade prices of some items.
+    """
+    item_names = input("Enter item names separated by spaces: ").split()
+    if not item_names:
         print("Invalid input. Please try again.")
         return
 
-    command = f"OFFER {rq} {client_name} {item_name} {price}"
-    send_command(command)
-    print("Offer sent. Waiting for server response...")
+    response = wait_for_response(client.quote(item_names))
+    if not response or not response.startswith("QUOTE_RES"):
+        print(response or "Quote failed. Please try again.")
+        return
+    for entry in response.split()[2:]:
+        item_name, offers, p25, p50, p75, trades, vwap = entry.split(":")
+        print(f"{item_name}: {offers} recent offers, median {p50} (25%-75%: {p25}-{p75}), "
+              f"{trades} trades at VWAP {vwap}")
+
+def print_response_when_done(future):
+    """
+    Prints the server's response to a request once it arrives.
+    """
+    future.add_done_callback(print_response)
 
 def buy():
     """
     Sends a BUY request to the server.
     """
-    global request_counter
-
     if not client_name:
         print("You need to register first.")
         return
 
+    rq = input("Enter the RQ number from the FOUND message: ").strip()
     item_name = input("Enter the item name: ").strip()
     price = input("Enter the price of the item: ").strip()
 
-    if not item_name or not price.isdigit():
+    if not rq or not item_name or not price.isdigit():
         print("Invalid input. Please try again.")
         return
 
-    command = f"BUY {request_counter} {item_name} {price}"
-    send_command(command)
-    request_counter += 1
+    buy_item(rq, item_name, price)
 
 def cancel():
     """
     Sends a CANCEL request to the server.
     """
-    global request_counter
-
     if not client_name:
         print("You need to register first.")
         return
 
+    rq = input("Enter the RQ number of your search (as in its FOUND message): ").strip()
     item_name = input("Enter the item name to cancel: ").strip()
     price = input("Enter the price of the item to cancel: ").strip()
 
-    if not item_name or not price.isdigit():
+    if not rq or not item_name or not price.isdigit():
         print("Invalid input. Please try again.")
         return
 
-    command = f"CANCEL {request_counter} {item_name} {price}"
-    send_command(command)
-    request_counter += 1
+    cancel_item(rq, item_name, price)
 
 def reset_server():
     """
     Sends a RESET command to the server.
     """
-    command = "RESET"
-    send_command(command)
-    global client_name, tcp_server_socket
+    global client_name
+    response = wait_for_response(client.reset())
+    if response:
+        print(f"Server response: {response}")
     client_name = None
-    if tcp_server_socket:
-        tcp_server_socket.close()
-        tcp_server_socket = None
     print("The server has been reset. All clients are deregistered.")
 
 def exit_client():
     """
     Gracefully closes sockets and exits the program.
     """
-    global tcp_server_socket, udp_socket
-    
-    if tcp_server_socket:
-        tcp_server_socket.close()
-    if udp_socket:
-        udp_socket.close()
+    if client:
+        client.close()
     print("Client exited gracefully.")
     exit()
 
@@ -530,8 +463,13 @@ def menu():
         print("4. Offer an item")
         print("5. Buy an item")
         print("6. Cancel a request")
-        print("7. Reset server")
-        print("8. Exit")
+        print("7. Look for several items")
+        print("8. Offer several items")
+        print("9. Upload inventory")
+        print("10. Get price quotes")
+        print("11. Reset server")
+        print(f"12. Answer pending notifications ({runtime.pending_count()})")
+        print("13. Exit")
         print("="*50)
         if client_name:
             print(f"Status: Registered as '{client_name}'")
@@ -553,8 +491,18 @@ def menu():
         elif choice == "6":
             cancel()
         elif choice == "7":
-            reset_server()
+            look_for_batch()
         elif choice == "8":
+            offer_batch()
+        elif choice == "9":
+            upload_inventory()
+        elif choice == "10":
+            quote()
+        elif choice == "11":
+            reset_server()
+        elif choice == "12":
+            answer_pending()
+        elif choice == "13":
             exit_client()
         else:
             print("Invalid choice. Please try again.")
@@ -562,6 +510,7 @@ def menu():
 if __name__ == "__main__":
     print("Starting Client-Server Marketplace Client...")
     try:
+        start_client()
         menu()
     except KeyboardInterrupt:
         print("\nShutting down client...")
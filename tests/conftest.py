@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+# The server modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clientRuntime import ClientRuntime  # noqa: E402
+from marketClient import MarketClient  # noqa: E402
+from marketplaceServer import MarketplaceServer  # noqa: E402
+
+OFFER_WINDOW = 1.0
+
+
+@pytest.fixture
+def market(request):
+    """An embedded server on ephemeral ports, and a factory for registered clients of it."""
+    mode = getattr(request, "param", "search")
+    server = MarketplaceServer(udp_port=0, tcp_port=0, admin_port=None, market_mode=mode,
+                               offer_window=OFFER_WINDOW, trace_path=None).start()
+    clients = []
+
+    def client(name, policy=None):
+        market_client = MarketClient(server_port=server.udp_port, heartbeat_interval=None).start()
+        clients.append(market_client)
+        if policy is not None:
+            ClientRuntime(market_client, policy)
+        market_client.register(name).result(5)
+        return market_client
+
+    yield server, client
+    for market_client in clients:
+        market_client.close()
+    server.stop()
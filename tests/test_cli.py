@@ -0,0 +1,36 @@
+"""Prompts of the interactive client in test.py."""
+import importlib.util
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def cli(monkeypatch):
+    # Loaded by path: "test" would import the standard library's test package
+    spec = importlib.util.spec_from_file_location("marketplace_cli", os.path.join(ROOT, "test.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    answers = iter(["4000000000000002", "01/30", "5 High St"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    return module
+
+
+def test_inform_req_as_the_server_sends_it_is_answered(cli):
+    assert cli.handle_inform_req(["INFORM_REQ", "lamp", "30"]) == ("4000000000000002", "01/30", "5 High St")
+
+
+def test_inform_req_with_an_rq_is_answered(cli, capsys):
+    assert cli.handle_inform_req(["INFORM_REQ", "12", "lamp", "30"]) is not None
+    assert "Item=lamp, Price=30" in capsys.readouterr().out
+
+
+def test_inform_req_for_a_numeric_item_name_is_answered(cli, capsys):
+    assert cli.handle_inform_req(["INFORM_REQ", "1984", "30"]) is not None
+    assert "Item=1984, Price=30" in capsys.readouterr().out
+
+
+def test_truncated_inform_req_is_rejected(cli):
+    assert cli.handle_inform_req(["INFORM_REQ", "lamp"]) is None
@@ -0,0 +1,46 @@
+import pytest
+
+from clientRegistry import ClientRegistry
+
+INFO = {"ip": "127.0.0.1", "udp_socket": 40001, "tcp_socket": 40002}
+
+
+def test_a_name_registers_once():
+    registry = ClientRegistry()
+    assert registry.register("b1", INFO)
+    assert not registry.register("b1", dict(INFO, udp_socket=40003))
+    assert registry.get("b1")["udp_socket"] == 40001
+    assert "b1" in registry and len(registry) == 1
+
+
+def test_a_snapshot_does_not_change_when_clients_come_and_go():
+    registry = ClientRegistry()
+    registry.register("b1", INFO)
+    snapshot = registry.snapshot()
+    registry.register("s1", INFO)
+    registry.deregister("b1")
+    assert list(snapshot) == ["b1"]
+    assert list(registry.snapshot()) == ["s1"]
+
+
+def test_published_info_is_read_only():
+    registry = ClientRegistry()
+    info = dict(INFO)
+    registry.register("b1", info)
+    info["ip"] = "10.0.0.1"
+    assert registry.get("b1")["ip"] == "127.0.0.1"
+    with pytest.raises(TypeError):
+        registry.get("b1")["ip"] = "10.0.0.1"
+    with pytest.raises(TypeError):
+        registry.snapshot()["s1"] = INFO
+
+
+def test_deregister_returns_the_info_and_every_change_bumps_the_version():
+    registry = ClientRegistry()
+    registry.register("b1", INFO)
+    assert registry.deregister("b1")["tcp_socket"] == 40002
+    assert registry.deregister("b1") is None
+    registry.register("s1", INFO)
+    registry.clear()
+    assert len(registry) == 0
+    assert registry.version == 4
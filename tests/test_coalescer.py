@@ -0,0 +1,67 @@
+import threading
+
+from coalescer import NotificationCoalescer
+
+
+class Recorder:
+    def __init__(self):
+        self.datagrams = []
+        self.sent = threading.Event()
+
+    def __call__(self, data, address):
+        self.datagrams.append((data, address))
+        self.sent.set()
+
+
+A = ("127.0.0.1", 40001)
+B = ("127.0.0.1", 40002)
+
+
+def test_messages_to_one_client_share_a_datagram():
+    recorder = Recorder()
+    coalescer = NotificationCoalescer(recorder, window=60)
+    coalescer.send("SEARCH 1 lamp d", A)
+    coalescer.send("SEARCH 2 desk d", A)
+    coalescer.send("SEARCH 3 lamp d", B)
+    assert recorder.datagrams == []
+    coalescer.close()
+    assert sorted(recorder.datagrams) == [(b"SEARCH 1 lamp d\nSEARCH 2 desk d", A), (b"SEARCH 3 lamp d", B)]
+    assert (coalescer.messages, coalescer.datagrams) == (3, 2)
+
+
+def test_the_window_flushes_without_close():
+    recorder = Recorder()
+    coalescer = NotificationCoalescer(recorder, window=0.01)
+    coalescer.send("SEARCH 1 lamp d", A)
+    assert recorder.sent.wait(2)
+    assert recorder.datagrams == [(b"SEARCH 1 lamp d", A)]
+    coalescer.close()
+
+
+def test_urgent_messages_go_out_at_once_after_what_is_waiting():
+    recorder = Recorder()
+    coalescer = NotificationCoalescer(recorder, window=60)
+    coalescer.send("SEARCH 1 lamp d", A)
+    coalescer.send("FOUND 5 lamp 30", A)
+    assert recorder.datagrams == [(b"SEARCH 1 lamp d", A), (b"FOUND 5 lamp 30", A)]
+    coalescer.close()
+    assert len(recorder.datagrams) == 2
+
+
+def test_a_full_datagram_is_sent_before_the_next_message():
+    recorder = Recorder()
+    coalescer = NotificationCoalescer(recorder, window=60, max_packet=20)
+    coalescer.send("SEARCH 1 lamp d", A)
+    coalescer.send("SEARCH 2 lamp d", A)
+    assert recorder.datagrams == [(b"SEARCH 1 lamp d", A)]
+    coalescer.close()
+    assert recorder.datagrams[-1] == (b"SEARCH 2 lamp d", A)
+    assert all(len(data) <= 20 for data, _ in recorder.datagrams)
+
+
+def test_messages_after_close_are_sent_directly():
+    recorder = Recorder()
+    coalescer = NotificationCoalescer(recorder, window=60)
+    coalescer.close()
+    coalescer.send("SEARCH 1 lamp d", A)
+    assert recorder.datagrams == [(b"SEARCH 1 lamp d", A)]
@@ -0,0 +1,63 @@
+from itemIndex import ItemIndex, normalize, item_key
+
+
+def catalog():
+    index = ItemIndex()
+    for doc_id, name in enumerate(["iPhone13-Pro", "iphone12 mini", "galaxy s21", "thinkpad x1 carbon", "desk lamp"]):
+        index.add(doc_id, name)
+    return index
+
+
+def test_normalize_splits_letters_from_digits_and_drops_punctuation():
+    assert normalize("iPhone13-Pro") == "iphone 13 pro"
+    assert item_key("iPhone 13") == item_key("iphone13") == item_key("IPHONE_13")
+
+
+def test_exact_keys_score_one():
+    index = catalog()
+    assert index.search("iphone 13 pro") == [(0, 1.0)]
+    assert index.exact("IPHONE13PRO") == {0}
+
+
+def test_transposed_letters_still_find_the_item_first():
+    hits = catalog().search("iphnoe13pro")
+    assert hits[0][0] == 0
+    assert hits[0][1] < 1.0
+
+
+def test_closer_names_rank_higher():
+    hits = catalog().search("iphone13 mini")
+    assert [doc_id for doc_id, _ in hits] == [1, 0]
+    assert hits[0][1] > hits[1][1]
+
+
+def test_a_name_token_alone_finds_the_item():
+    assert [doc_id for doc_id, _ in catalog().search("thinkpad")] == [3]
+
+
+def test_unrelated_queries_find_nothing():
+    assert catalog().search("bicycle helmet") == []
+
+
+def test_limit_caps_the_results():
+    index = ItemIndex()
+    for doc_id in range(20):
+        index.add(doc_id, f"lamp{doc_id}")
+    assert len(index.search("lamp", limit=5)) == 5
+
+
+def test_readding_a_doc_replaces_its_name():
+    index = catalog()
+    index.add(4, "office chair")
+    assert index.search("desk lamp") == []
+    assert index.search("office chair") == [(4, 1.0)]
+    assert len(index) == 5
+
+
+def test_removed_docs_are_not_found():
+    index = catalog()
+    index.remove(2)
+    assert index.search("galaxy s21") == []
+    assert len(index) == 4
+    index.clear()
+    assert len(index) == 0
@@ -0,0 +1,55 @@
+import time
+
+from liveness import LivenessIndex
+
+
+def wheel():
+    expired = []
+    index = LivenessIndex(timeout=15, tick=1.0, on_expire=expired.append)
+    return index, expired, time.monotonic()
+
+
+def test_a_silent_client_expires_within_a_tick_of_its_timeout():
+    index, expired, start = wheel()
+    index.touch("s1", start)
+    assert index.advance(start + 14) == []
+    assert index.alive("s1", start + 14)
+    assert not index.alive("s1", start + 15)  # Skipped before the wheel reaches its slot
+    assert index.advance(start + 17) == ["s1"]
+    assert expired == ["s1"] and len(index) == 0
+
+
+def test_a_heartbeat_moves_the_deadline():
+    index, expired, start = wheel()
+    index.touch("s1", start)
+    index.touch("s1", start + 10)
+    assert index.advance(start + 17) == []
+    assert index.advance(start + 27) == ["s1"]
+    assert index.heartbeats == 2 and index.expired == 1
+
+
+def test_a_forgotten_client_never_expires():
+    index, expired, start = wheel()
+    index.touch("s1", start)
+    index.forget("s1")
+    assert index.advance(start + 30) == []
+    assert not index.alive("s1", start)
+
+
+def test_a_long_pause_expires_every_client_once():
+    index, expired, start = wheel()
+    for i in range(50):
+        index.touch(f"c{i}", start + i % 7)
+    assert sorted(index.advance(start + 1000)) == sorted(f"c{i}" for i in range(50))
+    assert index.advance(start + 2000) == []
+
+
+def test_an_on_expire_error_does_not_stop_the_wheel():
+    def fail(name):
+        raise RuntimeError(name)
+
+    index = LivenessIndex(timeout=15, tick=1.0, on_expire=fail)
+    start = time.monotonic()
+    index.touch("s1", start)
+    index.touch("s2", start)
+    assert sorted(index.advance(start + 17)) == ["s1", "s2"]
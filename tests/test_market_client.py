@@ -0,0 +1,38 @@
+"""MarketClient request / reply correlation against an embedded server."""
+import time
+
+
+def test_an_error_resolves_the_request_it_answers(market):
+    server, client = market
+    buyer = client("b1")
+    search = buyer.look_for("lamp", "d", 40)
+
+    assert buyer.buy("99", "lamp", "10").result(5).startswith("ERROR 99 ")
+    assert not search.done()
+    assert search.result(5).startswith("NOT_AVAILABLE")
+
+
+def test_an_offer_error_resolves_no_request(market):
+    server, client = market
+    seller = client("s1")
+    errors = []
+    seller.on("ERROR", errors.append)
+    search = seller.look_for("desk", "d", 40)
+
+    seller.offer("12345", "lamp", 10)
+    end = time.time() + 5
+    while not errors and time.time() < end:
+        time.sleep(0.05)
+    assert errors and errors[0][0] == "ERROR:"
+    assert not search.done()
+
+
+def test_a_rejected_batch_fails_every_entry(market):
+    server, client = market
+    buyer = client("b1")
+    server.draining.set()
+
+    batch, entries = buyer.look_for_batch([("lamp", "d", 40), ("desk", "d", 50)])
+    assert batch.result(5).startswith("ERROR ")
+    for entry in entries:
+        assert isinstance(entry.exception(5), RuntimeError)
@@ -0,0 +1,224 @@
+"""End-to-end purchases against an embedded server on ephemeral ports."""
+import socket
+import time
+
+import pytest
+
+from clientRuntime import AutoPolicy
+from marketClient import MarketClient
+from marketplaceServer import MarketplaceServer
+
+DETAILS = ("4111111111111111", "12/25", "1 Main St")
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.05)
+    return condition()
+
+
+def test_a_search_ends_in_a_purchase(market):
+    server, client = market
+    buyer = client("b1", AutoPolicy(details=DETAILS))
+    seller = client("s1", AutoPolicy(details=DETAILS))
+    successes, shipped = [], []
+    seller.on("SEARCH", lambda parts: seller.offer(parts[1], parts[2], 30))
+    buyer.on("TRANSACTION_SUCCESS", successes.append)
+    seller.on("SHIPPING_INFO", shipped.append)
+
+    found = buyer.look_for("lamp", "d", 40).result(5).split()
+    assert (found[0], found[2], found[3]) == ("FOUND", "lamp", "30")
+    assert wait_for(lambda: successes and shipped)
+    assert shipped[0][2:] == ["b1", "1", "Main", "St"]
+
+
+def test_a_name_registers_once(market):
+    server, client = market
+    client("b1")
+    other = MarketClient(server_port=server.udp_port, heartbeat_interval=None).start()
+    try:
+        assert other.register("b1").result(5).startswith("REGISTER-DENIED")
+    finally:
+        other.close()
+
+
+def test_servers_run_side_by_side_in_one_process():
+    servers = [MarketplaceServer(udp_port=0, tcp_port=0, admin_port=None, trace_path=None).start()
+               for _ in range(2)]
+    try:
+        assert servers[0].udp_port != servers[1].udp_port
+        for index, server in enumerate(servers):
+            with MarketClient(server_port=server.udp_port, heartbeat_interval=None) as market_client:
+                assert market_client.register(f"b{index}").result(5).startswith("REGISTERED")
+        assert [list(server.registered_clients.snapshot()) for server in servers] == [["b0"], ["b1"]]
+    finally:
+        for server in servers:
+            server.stop()
+
+
+def assert_forgotten(server):
+    assert server.ongoing_requests == {} and server.offers_by_rq == {}
+    assert len(server.transactions) == 0
+
+
+def test_cancel_with_a_colliding_rq_does_not_touch_another_buyers_deal(market):
+    server, client = market
+    b1, b2, seller = client("b1"), client("b2"), client("s1")
+    reserves, cancels = [], []
+    seller.on("SEARCH", lambda parts: seller.offer(parts[1], parts[2], 10))
+    seller.on("RESERVE", reserves.append)
+    b1.on("CANCEL", cancels.append)
+
+    assert b1.look_for("lamp", "d", 40).result(5).startswith("FOUND")
+    assert wait_for(lambda: reserves)
+    search_rq = reserves[-1][1]
+    assert b2.cancel(search_rq, "lamp", "10").result(5).startswith("ERROR")
+    assert server.transactions.snapshot()[int(search_rq)][0] == "RESERVED"
+    assert cancels == []
+
+    # The seller holding the reservation may cancel it by SEARCH RQ#
+    assert seller.cancel(search_rq, "lamp", "10").result(5).startswith("CANCELED")
+    assert wait_for(lambda: cancels)
+    assert_forgotten(server)
+
+
+def test_a_cancel_without_a_price_is_rejected(market):
+    server, client = market
+    client("b1")
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(5)
+        sock.sendto(b"CANCEL 5 lamp", ("127.0.0.1", server.udp_port))
+        assert sock.recv(1024) == b"ERROR 5 Invalid CANCEL message format."
+
+
+@pytest.mark.parametrize("market", ["continuous"], indirect=True)
+def test_continuous_mode_fills_can_be_bought(market):
+    server, client = market
+    buyer = client("b1", AutoPolicy(details=DETAILS))
+    seller = client("s1", AutoPolicy(details=DETAILS))
+    successes, shipped = [], []
+    buyer.on("TRANSACTION_SUCCESS", successes.append)
+    seller.on("SHIPPING_INFO", shipped.append)
+
+    seller.offer(seller.next_rq(), "desk", 20)
+    time.sleep(0.2)
+    assert buyer.look_for("desk", "d", 40).result(5).split()[-1] == "20"
+    assert wait_for(lambda: successes and shipped)
+    assert wait_for(lambda: len(server.transactions) == 0)
+    assert_forgotten(server)
+
+
+def test_a_search_that_ends_unanswered_takes_no_late_offers(market):
+    server, client = market
+    buyer, seller = client("b1"), client("s1")
+    searches, errors = [], []
+    seller.on("SEARCH", searches.append)
+    seller.on("ERROR", errors.append)
+
+    assert buyer.look_for("lamp", "d", 40).result(5).startswith("NOT_AVAILABLE")
+    assert_forgotten(server)
+    seller.offer(searches[0][1], "lamp", 10)
+    assert wait_for(lambda: errors)
+    assert server.offers_by_rq == {}
+
+    batch = seller.offer_batch([(searches[0][1], "lamp", 10)]).result(5)
+    assert batch.split()[2:] == ["ERROR:unknown_rq"]
+
+
+def test_a_refused_negotiation_ends_the_search(market):
+    server, client = market
+    buyer, seller = client("b1"), client("s1")
+    seller.on("SEARCH", lambda parts: seller.offer(parts[1], parts[2], 50))
+    seller.on("NEGOTIATE", lambda parts: seller.refuse(parts[1], parts[2], parts[3]))
+
+    assert buyer.look_for("lamp", "d", 40).result(5).startswith("NOT_AVAILABLE")
+    assert wait_for(lambda: not server.ongoing_requests)
+    assert_forgotten(server)
+
+
+def test_a_search_every_policy_refuses_is_forgotten(market):
+    server, client = market
+    buyer, seller = client("b1"), client("s1")
+    seller.on("SEARCH", lambda parts: seller.offer(parts[1], parts[2], 50, accept_above=45))
+
+    assert buyer.look_for("lamp", "d", 40).result(5).startswith("NOT_AVAILABLE")
+    assert_forgotten(server)
+
+
+def test_a_seller_leaving_ends_its_reserved_deals(market):
+    server, client = market
+    buyer, seller = client("b1"), client("s1")
+    seller.on("SEARCH", lambda parts: seller.offer(parts[1], parts[2], 10))
+
+    assert buyer.look_for("lamp", "d", 40).result(5).startswith("FOUND")
+    assert seller.deregister().result(5).startswith("DE-REGISTERED")
+    assert_forgotten(server)
+
+
+def test_shipping_info_does_not_hold_an_outbound_worker(market):
+    server, client = market
+    buyer = client("b1", AutoPolicy(details=DETAILS))
+    seller = client("s1", AutoPolicy(details=DETAILS))
+    shipped = []
+    seller.on("SEARCH", lambda parts: seller.offer(parts[1], parts[2], 10))
+    seller.on("SHIPPING_INFO", shipped.append)
+
+    assert buyer.look_for("lamp", "d", 40).result(5).startswith("FOUND")
+    assert wait_for(lambda: shipped)
+    # Two INFORM_REQ exchanges and the SHIPPING_INFO send, which must not wait out the TCP timeout for a reply
+    assert wait_for(lambda: len(server.outbound.tcp_latencies) == 3, timeout=3)
+    assert max(server.outbound.tcp_latencies) < 3
+
+
+def test_pooled_searches_never_reserve_one_unit_twice(market):
+    server, client = market
+    b1 = client("b1", AutoPolicy(details=DETAILS))
+    b2 = client("b2", AutoPolicy(details=DETAILS))
+    seller = client("s1", AutoPolicy(details=DETAILS))
+    reserves, shipped, successes = [], [], []
+    seller.on("SEARCH", lambda parts: seller.offer(parts[1], parts[2], 50, accept_above=35))
+    seller.on("RESERVE", reserves.append)
+    seller.on("SHIPPING_INFO", shipped.append)
+    for buyer in (b1, b2):
+        buyer.on("TRANSACTION_SUCCESS", successes.append)
+
+    first = b1.look_for("lamp", "d", 40)
+    time.sleep(0.2)
+    second = b2.look_for("lamp", "d", 45)
+    answers = sorted(future.result(5).split()[0] for future in (first, second))
+    assert answers == ["FOUND", "NOT_AVAILABLE"]
+    assert wait_for(lambda: successes)
+    time.sleep(0.5)
+    assert (len(reserves), len(successes), len(shipped)) == (1, 1, 1)
+
+
+def test_an_offer_in_negotiation_is_not_served_from_the_cache(market):
+    server, client = market
+    b1 = client("b1", AutoPolicy(details=DETAILS))
+    b2 = client("b2", AutoPolicy(details=DETAILS))
+    seller = client("s1")
+    seller.inform_handler = lambda parts: DETAILS
+    offered, negotiations, shipped, successes = [], [], [], []
+
+    def offer_once(parts):
+        if not offered:  # One unit: only the first SEARCH is answered
+            offered.append(parts)
+            seller.offer(parts[1], parts[2], 30)
+
+    seller.on("SEARCH", offer_once)
+    seller.on("NEGOTIATE", negotiations.append)
+    seller.on("SHIPPING_INFO", shipped.append)
+    for buyer in (b1, b2):
+        buyer.on("TRANSACTION_SUCCESS", successes.append)
+
+    first = b1.look_for("lamp", "d", 20)
+    assert wait_for(lambda: negotiations, timeout=5)
+    assert b2.look_for("lamp", "d", 40).result(5).startswith("NOT_AVAILABLE")
+
+    negotiate = negotiations[0]
+    seller.accept(negotiate[1], negotiate[2], negotiate[3])
+    assert first.result(5).startswith("FOUND")
+    assert wait_for(lambda: successes)
+    time.sleep(0.5)
+    assert (len(successes), len(shipped)) == (1, 1)
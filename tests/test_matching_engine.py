@@ -0,0 +1,99 @@
+import threading
+
+from idAllocator import IdAllocator
+from matchingEngine import MatchingEngine, BID, ASK
+
+
+def engine():
+    return MatchingEngine(IdAllocator())
+
+
+def test_a_crossing_bid_trades_at_the_resting_ask_price():
+    book = engine()
+    ask, fills = book.submit_ask("s1", "1", "lamp", 30)
+    assert fills == []
+    bid, fills = book.submit_bid("b1", "2", "lamp", 45)
+    assert [(fill.bid, fill.ask, fill.price, fill.quantity) for fill in fills] == [(bid, ask, 30, 1)]
+    assert book.resting_orders() == 0
+
+
+def test_orders_that_do_not_cross_rest():
+    book = engine()
+    book.submit_ask("s1", "1", "lamp", 50)
+    _, fills = book.submit_bid("b1", "2", "lamp", 40)
+    assert fills == []
+    assert book.export_orders() == [(ASK, "s1", "1", "lamp", 50, 1), (BID, "b1", "2", "lamp", 40, 1)]
+
+
+def test_best_price_then_oldest_order_trades_first():
+    book = engine()
+    book.submit_ask("s1", "1", "lamp", 30)
+    cheapest_first, _ = book.submit_ask("s2", "2", "lamp", 25)
+    cheapest_second, _ = book.submit_ask("s3", "3", "lamp", 25)
+    _, first = book.submit_bid("b1", "4", "lamp", 40)
+    _, second = book.submit_bid("b2", "5", "lamp", 40)
+    _, third = book.submit_bid("b3", "6", "lamp", 40)
+    assert [fills[0].ask.owner for fills in (first, second, third)] == ["s2", "s3", "s1"]
+
+
+def test_a_large_order_sweeps_several_levels_and_rests_the_rest():
+    book = engine()
+    book.submit_ask("s1", "1", "lamp", 20, quantity=2)
+    book.submit_ask("s2", "2", "lamp", 30, quantity=1)
+    book.submit_ask("s3", "3", "lamp", 60, quantity=1)
+    bid, fills = book.submit_bid("b1", "4", "lamp", 40, quantity=5)
+    assert [(fill.ask.owner, fill.price, fill.quantity) for fill in fills] == [("s1", 20, 2), ("s2", 30, 1)]
+    assert bid.quantity == 2
+    assert book.export_orders() == [(ASK, "s3", "3", "lamp", 60, 1), (BID, "b1", "4", "lamp", 40, 2)]
+
+
+def test_item_names_match_through_their_key():
+    book = engine()
+    book.submit_ask("s1", "1", "iPhone13-Pro", 30)
+    _, fills = book.submit_bid("b1", "2", "iphone 13 pro", 30)
+    assert len(fills) == 1
+
+
+def test_cancelled_orders_do_not_trade():
+    book = engine()
+    ask, _ = book.submit_ask("s1", "1", "lamp", 30)
+    assert book.cancel(ask.order_id)
+    assert not book.cancel(ask.order_id)
+    _, fills = book.submit_bid("b1", "2", "lamp", 40)
+    assert fills == []
+
+
+def test_a_filled_order_cannot_be_cancelled():
+    book = engine()
+    ask, _ = book.submit_ask("s1", "1", "lamp", 30)
+    book.submit_bid("b1", "2", "lamp", 40)
+    assert not book.cancel(ask.order_id)
+
+
+def test_cancel_owner_withdraws_only_that_clients_orders():
+    book = engine()
+    book.submit_ask("s1", "1", "lamp", 30)
+    book.submit_ask("s1", "2", "desk", 80)
+    book.submit_ask("s2", "3", "lamp", 35)
+    book.cancel_owner("s1")
+    assert book.export_orders() == [(ASK, "s2", "3", "lamp", 35, 1)]
+
+
+def test_concurrent_bids_never_fill_one_unit_twice():
+    book = engine()
+    for rq in range(100):
+        book.submit_ask("s1", str(rq), "lamp", 30)
+    filled = []
+
+    def buy(buyer):
+        for rq in range(50):
+            _, fills = book.submit_bid(buyer, str(rq), "lamp", 30)
+            filled.extend(fill.ask.order_id for fill in fills)
+
+    threads = [threading.Thread(target=buy, args=(f"b{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(filled) == len(set(filled)) == 100
+    assert book.resting_orders() == 100  # The unfilled bids
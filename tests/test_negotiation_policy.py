@@ -0,0 +1,61 @@
+import pytest
+
+from negotiationPolicy import NegotiationPolicy, ACCEPT, COUNTER, REFUSE
+
+
+def test_parse_reads_terms_and_the_floor_alias():
+    policy = NegotiationPolicy.parse(["floor=25", "counter=30"])
+    assert (policy.accept_above, policy.counter) == (25, 30)
+    assert policy.terms() == ["accept_above=25", "counter=30"]
+
+
+def test_an_offer_without_terms_has_no_policy():
+    assert NegotiationPolicy.parse([]) is None
+
+
+@pytest.mark.parametrize("term", ["accept_above=", "counter=cheap", "discount=5", "accept_above"])
+def test_parse_rejects_invalid_terms(term):
+    with pytest.raises(ValueError):
+        NegotiationPolicy.parse([term])
+
+
+def test_max_prices_at_or_above_the_floor_are_accepted_at_the_buyers_price():
+    policy = NegotiationPolicy(accept_above=25)
+    assert policy.respond(25) == (ACCEPT, 25)
+    assert policy.respond(28) == (ACCEPT, 28)
+    assert policy.respond(24) == (REFUSE, None)
+
+
+def test_below_the_floor_a_counter_price_is_offered():
+    policy = NegotiationPolicy(accept_above=25, counter=27)
+    assert policy.respond(20) == (COUNTER, 27)
+    assert NegotiationPolicy(counter=27).respond(100) == (COUNTER, 27)
+
+
+def test_a_policy_accepts_without_asking_the_seller(market):
+    server, client = market
+    buyer, seller = client("b1"), client("s1")
+    negotiations = []
+    seller.on("SEARCH", lambda parts: seller.offer(parts[1], parts[2], 50, accept_above=35))
+    seller.on("NEGOTIATE", negotiations.append)
+
+    found = buyer.look_for("lamp", "d", 40).result(5)
+    assert found.split()[0] == "FOUND" and found.split()[-1] == "40"
+    assert negotiations == []
+
+
+def test_an_acceptance_wins_over_a_cheaper_counter(market):
+    server, client = market
+    buyer, s1, s2 = client("b1"), client("s1"), client("s2")
+    s1.on("SEARCH", lambda parts: s1.offer(parts[1], parts[2], 50, counter=41))
+    s2.on("SEARCH", lambda parts: s2.offer(parts[1], parts[2], 60, accept_above=40, counter=45))
+
+    assert buyer.look_for("lamp", "d", 40).result(5).split()[-1] == "40"
+
+
+def test_a_search_every_policy_refuses_is_not_available(market):
+    server, client = market
+    buyer, seller = client("b1"), client("s1")
+    seller.on("SEARCH", lambda parts: seller.offer(parts[1], parts[2], 50, accept_above=45))
+
+    assert buyer.look_for("lamp", "d", 40).result(5).startswith("NOT_AVAILABLE")
@@ -0,0 +1,82 @@
+from offerCache import OfferCache
+
+
+class _Offer:
+    def __init__(self, name, item_name, price, offer_id):
+        self.name, self.item_name, self.price, self.offer_id = name, item_name, price, offer_id
+
+
+def cache_with(*offers, now=0, **kwargs):
+    cache = OfferCache(**kwargs)
+    for offer in offers:
+        cache.add(offer, now=now)
+    return cache
+
+
+def test_match_takes_the_cheapest_offer_within_budget():
+    cache = cache_with(_Offer("s1", "lamp", "30", 1), _Offer("s2", "lamp", "20", 2), _Offer("s3", "lamp", "50", 3))
+    [entry] = cache.match("lamp", 40, now=1)
+    assert (entry.seller, entry.price, entry.offer_id) == ("s2", 20, 2)
+
+
+def test_a_matched_offer_leaves_the_cache():
+    cache = cache_with(_Offer("s1", "lamp", "30", 1))
+    assert cache.match("lamp", 40, now=1)
+    assert cache.match("lamp", 40, now=1) == []
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_offers_over_budget_stay_cached():
+    cache = cache_with(_Offer("s1", "lamp", "30", 1))
+    assert cache.match("lamp", 20, now=1) == []
+    assert len(cache) == 1
+
+
+def test_match_skips_the_buyer_and_unusable_sellers():
+    cache = cache_with(_Offer("buyer", "lamp", "10", 1), _Offer("dead", "lamp", "15", 2), _Offer("s1", "lamp", "30", 3))
+    [entry] = cache.match("lamp", 40, exclude="buyer", usable=lambda seller: seller != "dead", now=1)
+    assert entry.seller == "s1"
+    assert len(cache) == 2
+
+
+def test_item_names_are_normalised():
+    cache = cache_with(_Offer("s1", "Desk Lamp", "30", 1))
+    assert cache.match("desk_lamp", 40, now=1)
+
+
+def test_offers_expire_after_the_ttl():
+    cache = cache_with(_Offer("s1", "lamp", "30", 1), ttl=30)
+    assert cache.match("lamp", 40, now=31) == []
+    assert len(cache) == 0
+
+
+def test_discard_with_an_offer_id_keeps_a_newer_offer():
+    cache = cache_with(_Offer("s1", "lamp", "30", 1))
+    cache.add(_Offer("s1", "lamp", "25", 2), now=0)  # The seller's newer offer replaces the old one
+    cache.discard("s1", "lamp", offer_id=1)
+    assert len(cache) == 1
+    cache.discard("s1", "lamp", offer_id=2)
+    assert len(cache) == 0
+
+
+def test_remove_seller_drops_all_its_offers():
+    cache = cache_with(_Offer("s1", "lamp", "30", 1), _Offer("s1", "desk", "60", 2), _Offer("s2", "lamp", "35", 3))
+    cache.remove_seller("s1")
+    assert len(cache) == 1
+    [entry] = cache.match("lamp", 40, now=1)
+    assert entry.seller == "s2"
+
+
+def test_only_the_cheapest_offers_per_item_are_kept():
+    cache = cache_with(*(_Offer(f"s{price}", "lamp", str(price), price) for price in (50, 10, 40, 20)), max_offers=2)
+    assert len(cache) == 2
+    assert [entry.price for entry in cache.match("lamp", 100, limit=5, now=1)] == [10, 20]
+
+
+def test_least_recently_used_items_are_evicted():
+    cache = cache_with(_Offer("s1", "lamp", "30", 1), _Offer("s1", "desk", "30", 2), max_items=2)
+    cache.match("lamp", 10, now=1)  # A lookup makes lamp recently used
+    cache.add(_Offer("s1", "chair", "30", 3), now=1)
+    assert cache.match("desk", 40, now=1) == []
+    assert cache.match("lamp", 40, now=1)
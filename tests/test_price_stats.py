@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from priceStats import PriceStats, format_quote  # noqa: E402
+
+
+def test_offer_percentiles_and_trade_vwap():
+    stats = PriceStats()
+    for price in (10, 20, 30, 40, 50):
+        stats.record_offer("lamp", price)
+    stats.record_trade("lamp", 20, 1)
+    stats.record_trade("lamp", 40, 3)
+    [quote] = stats.quotes(["lamp"])
+    assert quote == {"item_name": "lamp", "offers": 5, "p25": 20.0, "p50": 30.0, "p75": 40.0,
+                     "trades": 2, "vwap": 35.0}
+
+
+def test_a_ring_keeps_only_the_latest_observations():
+    stats = PriceStats(capacity=4)
+    for price in (1000, 1000, 10, 20, 30, 40):
+        stats.record_offer("lamp", price)
+    [quote] = stats.quotes(["lamp"])
+    assert quote["offers"] == 4
+    assert quote["p50"] == 25.0
+
+
+def test_items_share_statistics_through_their_key():
+    stats = PriceStats()
+    stats.record_offer("iPhone 13", 500)
+    stats.record_offer("iphone13", 700)
+    assert stats.quotes(["IPHONE_13"])[0]["offers"] == 2
+
+
+def test_items_without_data_have_empty_quotes_in_a_batch():
+    stats = PriceStats()
+    stats.record_offer("lamp", 30)
+    stats.record_trade("desk", 80)
+    lamp, chair, desk = stats.quotes(["lamp", "chair", "desk"])
+    assert (lamp["p50"], lamp["trades"], lamp["vwap"]) == (30.0, 0, None)
+    assert chair == {"item_name": "chair", "offers": 0, "p25": None, "p50": None, "p75": None,
+                     "trades": 0, "vwap": None}
+    assert (desk["offers"], desk["vwap"]) == (0, 80.0)
+
+
+def test_format_quote_marks_missing_values():
+    stats = PriceStats()
+    stats.record_offer("lamp", 30)
+    assert format_quote(stats.quotes(["lamp"])[0]) == "lamp:1:30.0:30.0:30.0:0:-"
+
+
+def test_memory_per_item_follows_the_capacity():
+    assert PriceStats(capacity=512).memory_per_item() == 2 * PriceStats(capacity=256).memory_per_item()
+
+
+def test_clear_drops_every_series():
+    stats = PriceStats()
+    stats.record_offer("lamp", 30)
+    stats.clear()
+    assert stats.quotes(["lamp"])[0]["offers"] == 0
+
+
+def test_quote_reports_the_offers_a_search_collected(market):
+    server, client = market
+    buyer, seller = client("b1"), client("s1")
+    seller.on("SEARCH", lambda parts: seller.offer(parts[1], parts[2], 30))
+
+    assert buyer.look_for("lamp", "d", 40).result(5).startswith("FOUND")
+    assert buyer.quote(["lamp", "desk"]).result(5).split()[2:] == ["lamp:1:30.0:30.0:30.0:0:-", "desk:0:-:-:-:0:-"]
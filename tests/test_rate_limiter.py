@@ -0,0 +1,80 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import rateLimiter
+from rateLimiter import RateLimiter, TokenBucket
+
+CLIENT = ("127.0.0.1", 40001)
+OTHER = ("127.0.0.1", 40002)
+
+
+@pytest.fixture
+def limiter(tmp_path, monkeypatch):
+    # Client: 1 token per second, burst 2. Global: 10 tokens per second, burst 4.
+    path = tmp_path / "rate_limits.json"
+    path.write_text(json.dumps({"LOOKING_FOR": {"client_rate": 1, "client_burst": 2,
+                                                "global_rate": 10, "global_burst": 4}}))
+    clock = [1000.0]
+    monkeypatch.setattr(rateLimiter, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    limiter = RateLimiter(path=str(path))
+    limiter.clock = clock
+    return limiter
+
+
+def test_a_bucket_refills_at_its_rate_up_to_its_burst():
+    bucket = TokenBucket(rate=2, burst=3, now=0)
+    assert [bucket.take(0) for _ in range(4)] == [True, True, True, False]
+    assert bucket.take(0.5)
+    assert not bucket.take(0.5)
+    assert not bucket.idle(1.0)
+    assert bucket.idle(10.0)
+    bucket.refill(10.0)
+    assert bucket.tokens == 3
+
+
+def test_a_client_is_limited_to_its_burst_and_then_its_rate(limiter):
+    assert [limiter.allow("LOOKING_FOR", CLIENT) for _ in range(3)] == [True, True, False]
+    limiter.clock[0] += 1
+    assert limiter.allow("LOOKING_FOR", CLIENT)
+    assert (limiter.allowed["LOOKING_FOR"], limiter.limited["LOOKING_FOR"]) == (3, 1)
+
+
+def test_a_limited_client_does_not_drain_the_global_bucket(limiter):
+    for _ in range(10):
+        limiter.allow("LOOKING_FOR", CLIENT)
+    assert limiter.allow("LOOKING_FOR", OTHER)
+    assert limiter.allow("LOOKING_FOR", OTHER)
+
+
+def test_a_global_overload_does_not_spend_a_clients_tokens(limiter):
+    for other in (OTHER, ("127.0.0.1", 40003)):
+        assert limiter.allow("LOOKING_FOR", other)
+        assert limiter.allow("LOOKING_FOR", other)
+    # The global bucket is empty: every message is rejected, without costing the client anything
+    for _ in range(5):
+        assert not limiter.allow("LOOKING_FOR", CLIENT)
+    limiter.clock[0] += 0.5
+    assert [limiter.allow("LOOKING_FOR", CLIENT) for _ in range(3)] == [True, True, False]
+
+
+def test_types_without_their_own_limit_share_the_default(limiter):
+    assert all(limiter.allow("OFFER", CLIENT) for _ in range(40))
+    assert not limiter.allow("BUY", CLIENT)
+
+
+def test_reload_applies_the_file_and_refills_every_bucket(limiter):
+    limiter.allow("LOOKING_FOR", CLIENT)
+    limiter.allow("LOOKING_FOR", CLIENT)
+    with open(limiter.path, "w") as f:
+        json.dump({"LOOKING_FOR": {"client_rate": 1, "client_burst": 4, "global_rate": 1, "global_burst": 10}}, f)
+    assert limiter.reload()["LOOKING_FOR"] == (1.0, 4.0, 1.0, 10.0)
+    assert all(limiter.allow("LOOKING_FOR", CLIENT) for _ in range(4))
+
+
+def test_reload_rejects_incomplete_limits(limiter):
+    with open(limiter.path, "w") as f:
+        json.dump({"LOOKING_FOR": {"client_rate": 1}}, f)
+    with pytest.raises(ValueError):
+        limiter.reload()
@@ -0,0 +1,89 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import reservationTable
+from reservationTable import ReservationTable
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(reservationTable, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    return clock
+
+
+def test_claim_is_exclusive_until_released():
+    table = ReservationTable()
+    token = table.claim(5)
+    assert token is not None
+    assert table.claim(5) is None
+    assert table.holder(5) == token
+    assert table.release(5, token)
+    assert table.claim(5) is not None
+
+
+def test_only_the_holder_can_release():
+    table = ReservationTable()
+    token = table.claim(5)
+    assert not table.release(5, token + 1)
+    assert table.holder(5) == token
+
+
+def test_settled_offer_can_never_be_claimed_again():
+    table = ReservationTable()
+    token = table.claim(5)
+    assert table.settle(5, token)
+    assert table.sold(5)
+    assert table.claim(5) is None
+    assert not table.release(5, token)  # The sale cannot be undone by its old token
+    assert table.sold(5)
+
+
+def test_settle_needs_the_claim():
+    table = ReservationTable()
+    assert not table.settle(5, 1)
+    assert not table.sold(5)
+
+
+def test_sold_markers_expire_after_the_ttl(clock):
+    table = ReservationTable(sold_ttl=30)
+    table.settle(5, table.claim(5))
+    clock[0] += 20
+    table.settle(6, table.claim(6))
+    clock[0] += 15
+    table.settle(7, table.claim(7))  # Drops the marker of 5, which is 35 seconds old
+    assert not table.sold(5) and table.sold(6) and table.sold(7)
+    assert len(table) == 2
+
+
+def test_sold_offers_survive_export_and_restore(clock):
+    table = ReservationTable(sold_ttl=30)
+    table.settle(5, table.claim(5))
+    table.claim(6)  # A purchase in progress ends with its process
+    clock[0] += 10
+    successor = ReservationTable(sold_ttl=30)
+    successor.restore(table.export())
+    assert successor.sold(5)
+    assert successor.claim(6) is not None
+    clock[0] += 20  # The marker keeps its original expiry
+    successor.settle(7, successor.claim(7))
+    assert not successor.sold(5)
+
+
+def test_concurrent_claims_have_one_winner():
+    table = ReservationTable()
+    tokens = []
+    barrier = threading.Barrier(16)
+
+    def buy():
+        barrier.wait()
+        tokens.extend(token for token in [table.claim(5)] if token is not None)
+
+    threads = [threading.Thread(target=buy) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(tokens) == 1 and table.holder(5) == tokens[0]
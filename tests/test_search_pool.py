@@ -0,0 +1,77 @@
+import time
+
+from classes.searching import Offer
+from searchPool import SearchPools, allocate_offers
+
+
+def offers(*sellers_and_prices):
+    return [Offer("1", seller, "lamp", str(price)) for seller, price in sellers_and_prices]
+
+
+def allocated_ids(allocation):
+    return [id(offer) for shares in allocation.values() for offer in shares]
+
+
+def test_a_single_search_gets_every_offer_but_its_own():
+    pool_offers = offers(("s1", 30), ("b1", 10), ("s2", 50))
+    allocation = allocate_offers([(1, "b1", "20")], pool_offers)
+    assert [offer.name for offer in allocation[1]] == ["s1", "s2"]
+
+
+def test_tightest_budget_gets_the_cheapest_offer_it_can_afford():
+    pool_offers = offers(("s1", 20), ("s2", 35))
+    allocation = allocate_offers([(1, "b1", "40"), (2, "b2", "25")], pool_offers)
+    assert [offer.name for offer in allocation[2]] == ["s1"]
+    assert [offer.name for offer in allocation[1]] == ["s2"]
+
+
+def test_an_unaffordable_offer_goes_to_one_search_only():
+    # One unit at 50 and two buyers below it: only one may negotiate (and so reserve) it
+    pool_offers = offers(("s1", 50))
+    allocation = allocate_offers([(1, "b1", "40"), (2, "b2", "45")], pool_offers)
+    assert [offer.name for offer in allocation[2]] == ["s1"]
+    assert allocation[1] == []
+
+
+def test_no_offer_is_allocated_twice():
+    pool_offers = offers(("s1", 10), ("s2", 60), ("s3", 70), ("s4", 80))
+    members = [(rq, f"b{rq}", str(budget)) for rq, budget in enumerate((15, 20, 30, 40, 50), 1)]
+    allocation = allocate_offers(members, pool_offers)
+    ids = allocated_ids(allocation)
+    assert len(ids) == len(set(ids)) == len(pool_offers)
+    assert set(allocation) == {rq for rq, _, _ in members}
+
+
+def test_leftovers_skip_a_searchs_own_offer():
+    pool_offers = offers(("b2", 60), ("s1", 70))
+    allocation = allocate_offers([(1, "b1", "30"), (2, "b2", "40")], pool_offers)
+    assert [offer.name for offer in allocation[2]] == ["s1"]
+    assert [offer.name for offer in allocation[1]] == ["b2"]
+
+
+def test_searches_join_an_open_pool_for_the_same_item():
+    pools = SearchPools()
+    pool, leading = pools.join(1, "b1", "Desk Lamp", "40", window=60)
+    joined, joined_leading = pools.join(2, "b2", "desk_lamp", "30", window=60)
+    other, other_leading = pools.join(3, "b3", "chair", "30", window=60)
+    assert leading and not joined_leading and other_leading
+    assert joined is pool and other is not pool
+    assert pools.pool_of(2) is pool
+    assert (pools.broadcasts, pools.pooled) == (2, 1)
+
+
+def test_a_pool_near_its_end_does_not_take_searches():
+    pools = SearchPools(min_shared_window=0.25)
+    pool, _ = pools.join(1, "b1", "lamp", "40", window=60)
+    pool.closes_at = time.time() + 10  # Less than a quarter of the window left
+    joined, leading = pools.join(2, "b2", "lamp", "40", window=60)
+    assert leading and joined is not pool
+
+
+def test_close_returns_the_members_and_forgets_them():
+    pools = SearchPools()
+    pool, _ = pools.join(1, "b1", "lamp", "40", window=60)
+    pools.join(2, "b2", "lamp", "30", window=60)
+    assert pools.close(pool) == [(1, "b1", "40"), (2, "b2", "30")]
+    assert pools.pool_of(1) is None
+    assert pools.join(3, "b3", "lamp", "30", window=60)[1]  # A new pool leads a new broadcast
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from settlement import Payment, PaymentProcessor, SettlementQueue, SimulatedProcessor, to_cents, format_cents
+
+
+class RecordingProcessor(PaymentProcessor):
+    def __init__(self, results=None, error=None):
+        self.batches = []
+        self.results = results
+        self.error = error
+
+    def settle(self, payments):
+        self.batches.append([payment.transaction_id for payment in payments])
+        if self.error:
+            raise self.error
+        return self.results or [True] * len(payments)
+
+
+def settled_queue(processor, payments, **kwargs):
+    """Submit payments, stop the queue (which settles them) and return the (transaction_id, ok) outcomes."""
+    outcomes = []
+    queue = SettlementQueue(processor, interval=60, **kwargs).start()
+    for payment in payments:
+        payment.on_settled = lambda payment, ok: outcomes.append((payment.transaction_id, ok))
+        queue.submit(payment)
+    queue.stop()
+    return queue, outcomes
+
+
+@pytest.mark.parametrize("price, cents", [(30, 3000), ("29.99", 2999), ("0.015", 2), ("0.005", 1), ("12.3", 1230)])
+def test_prices_become_integer_cents(price, cents):
+    assert to_cents(price) == cents
+
+
+def test_format_cents_pads_the_cents():
+    assert [format_cents(cents) for cents in (3000, 2999, 5, 0)] == ["30.00", "29.99", "0.05", "0.00"]
+
+
+def test_the_fee_is_rounded_to_a_cent_and_the_seller_gets_the_rest():
+    payment = Payment(1, "4111", "4222", "29.99")
+    assert (payment.amount, payment.fee, payment.seller_amount) == (2999, 300, 2699)
+    assert payment.fee + payment.seller_amount == payment.amount
+
+
+def test_queued_payments_settle_in_batches_on_stop():
+    processor = RecordingProcessor()
+    queue, outcomes = settled_queue(processor, [Payment(n, "4111", "4222", 10) for n in range(5)], max_batch=2)
+    assert processor.batches == [[0, 1], [2, 3], [4]]
+    assert outcomes == [(n, True) for n in range(5)]
+    assert (queue.settled, queue.failed, queue.batches, queue.pending()) == (5, 0, 3, 0)
+
+
+def test_declined_payments_are_reported_as_failed():
+    queue, outcomes = settled_queue(RecordingProcessor(results=[True, False]),
+                                    [Payment(n, "4111", "4222", 10) for n in range(2)])
+    assert outcomes == [(0, True), (1, False)]
+    assert (queue.settled, queue.failed) == (1, 1)
+
+
+def test_a_processor_error_fails_the_whole_batch():
+    queue, outcomes = settled_queue(RecordingProcessor(error=ConnectionError("down")),
+                                    [Payment(n, "4111", "4222", 10) for n in range(3)])
+    assert outcomes == [(0, False), (1, False), (2, False)]
+
+
+def test_a_failing_callback_does_not_stop_the_batch():
+    processor = RecordingProcessor()
+    queue = SettlementQueue(processor, interval=60).start()
+    outcomes = []
+    queue.submit(Payment(0, "4111", "4222", 10, on_settled=lambda payment, ok: 1 / 0))
+    queue.submit(Payment(1, "4111", "4222", 10, on_settled=lambda payment, ok: outcomes.append(ok)))
+    queue.stop()
+    assert outcomes == [True]
+
+
+def test_the_worker_settles_without_being_stopped():
+    done = threading.Event()
+    queue = SettlementQueue(RecordingProcessor(), interval=0.05).start()
+    queue.submit(Payment(0, "4111", "4222", 10, on_settled=lambda payment, ok: done.set()))
+    assert done.wait(2)
+    queue.stop()
+
+
+def test_a_stopped_queue_rejects_payments():
+    queue = SettlementQueue(RecordingProcessor())
+    with pytest.raises(RuntimeError):
+        queue.submit(Payment(0, "4111", "4222", 10))
+
+
+def test_the_simulated_processor_declines_at_its_failure_rate(capsys):
+    processor = SimulatedProcessor(latency=0, failure_rate=0.5, seed=7)
+    results = processor.settle([Payment(n, "4111", "4222", 10) for n in range(200)])
+    assert 60 < results.count(False) < 140
+    assert "Payment declined" in capsys.readouterr().out
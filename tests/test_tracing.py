@@ -0,0 +1,50 @@
+import json
+
+from tracing import Tracer
+
+
+def records(path):
+    with open(path) as traces:
+        return [json.loads(line) for line in traces]
+
+
+def test_every_stage_of_a_search_shares_its_trace(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(path=str(path))
+    trace_id = tracer.start(7, "b1", "lamp")
+    with tracer.span(7, "offer_collection", offers=2):
+        pass
+    tracer.event(7, "reserve", seller="s1")
+    tracer.end(7, "sold")
+    tracer.event(7, "late")  # After end: the trace is closed
+
+    lines = records(path)
+    assert [record["stage"] for record in lines] == ["looking_for", "offer_collection", "reserve", "trace"]
+    assert {record["trace_id"] for record in lines} == {trace_id}
+    assert lines[1]["offers"] == 2 and lines[2]["duration_ms"] == 0.0
+    assert lines[-1]["outcome"] == "sold"
+
+
+def test_searches_without_a_trace_are_not_recorded(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(path=str(path))
+    tracer.event(8, "offer")
+    tracer.end(8, "sold")
+    assert not path.exists()
+
+
+def test_a_disabled_tracer_writes_nothing(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(path=str(path), enabled=False)
+    assert tracer.start(7, "b1", "lamp") is None
+    tracer.end(7, "sold")
+    assert not path.exists()
+
+
+def test_clear_closes_open_traces(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(path=str(path))
+    tracer.start(7, "b1", "lamp")
+    tracer.clear()
+    tracer.end(7, "sold")
+    assert [record["stage"] for record in records(path)] == ["looking_for"]
@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+from transactionTable import (TransactionTable, InvalidTransition, SEARCHING, OFFERED, NEGOTIATING,
+                              RESERVED, PAYING, SHIPPED, CANCELLED)
+
+BUYER = ("127.0.0.1", 40001)
+
+
+class _Offer:
+    def __init__(self, item_name):
+        self.item_name = item_name
+
+
+def reserved_table():
+    table = TransactionTable()
+    table.open(7, "1", "buyer", BUYER, "lamp")
+    table.transition(7, OFFERED)
+    table.transition(7, RESERVED, seller="seller", price=30, offer=_Offer("lamp"))
+    return table
+
+
+def test_open_starts_searching():
+    table = TransactionTable()
+    record = table.open(7, "1", "buyer", BUYER, "lamp")
+    assert record.state == SEARCHING
+    assert table.get(7) is record
+    assert len(table) == 1
+
+
+def test_full_purchase_path_removes_the_record():
+    table = reserved_table()
+    record = table.transition(7, PAYING, expected=(RESERVED,))
+    assert (record.state, record.seller, record.price) == (PAYING, "seller", 30)
+    assert table.in_flight() == [record]
+    table.transition(7, SHIPPED)
+    assert table.get(7) is None
+    assert table.for_participant("buyer") == [] and table.for_participant("seller") == []
+
+
+def test_disallowed_transition_raises_and_keeps_state():
+    table = TransactionTable()
+    table.open(7, "1", "buyer", BUYER, "lamp")
+    with pytest.raises(InvalidTransition):
+        table.transition(7, PAYING)
+    assert table.get(7).state == SEARCHING
+
+
+def test_expected_narrows_the_allowed_states():
+    table = TransactionTable()
+    table.open(7, "1", "buyer", BUYER, "lamp")
+    table.transition(7, OFFERED)
+    with pytest.raises(InvalidTransition):
+        table.transition(7, CANCELLED, expected=(NEGOTIATING,))
+
+
+def test_transition_of_an_ended_record_raises():
+    table = reserved_table()
+    table.transition(7, CANCELLED)
+    with pytest.raises(InvalidTransition):
+        table.transition(7, PAYING)
+
+
+def test_for_buyer_needs_the_buyers_address_and_rq():
+    table = reserved_table()
+    assert [r.search_rq for r in table.for_buyer(BUYER, "1")] == [7]
+    assert table.for_buyer(("127.0.0.1", 40002), "1") == []  # Another client using the same RQ#
+    assert table.for_buyer(BUYER, "7") == []  # The SEARCH RQ# is not the buyer's RQ#
+
+
+def test_for_buyer_filters_by_searched_or_offered_item():
+    table = TransactionTable()
+    table.open(7, "1", "buyer", BUYER, "desk lamp")
+    table.transition(7, OFFERED)
+    table.transition(7, RESERVED, seller="seller", price=30, offer=_Offer("desk_lamp"))
+    assert len(table.for_buyer(BUYER, "1", "Desk Lamp")) == 1
+    assert len(table.for_buyer(BUYER, "1", "desk_lamp")) == 1
+    assert table.for_buyer(BUYER, "1", "chair") == []
+
+
+def test_cancel_participant_leaves_payments_alone():
+    table = reserved_table()
+    table.open(8, "2", "buyer", BUYER, "chair")
+    table.transition(7, PAYING)
+    cancelled = table.cancel_participant("buyer")
+    assert [record.search_rq for record in cancelled] == [8]
+    assert table.get(7).state == PAYING and table.get(8) is None
+
+
+def test_export_and_restore_keep_the_indexes():
+    table = reserved_table()
+    restored = TransactionTable()
+    restored.restore(table.export())
+    assert restored.get(7).state == RESERVED
+    assert [r.search_rq for r in restored.for_buyer(BUYER, "1", "lamp")] == [7]
+    assert [r.search_rq for r in restored.for_participant("seller")] == [7]
+
+
+def test_only_one_concurrent_buy_moves_a_reservation_to_paying():
+    for _ in range(50):
+        table = reserved_table()
+        winners = []
+        barrier = threading.Barrier(8)
+
+        def buy():
+            barrier.wait()
+            try:
+                table.transition(7, PAYING, expected=(RESERVED,))
+                winners.append(1)
+            except InvalidTransition:
+                pass
+
+        threads = [threading.Thread(target=buy) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(winners) == 1
@@ -0,0 +1,69 @@
+import socket
+import time
+
+import pytest
+
+from udpReceiver import UdpReceiver, message_type_of
+
+
+@pytest.fixture
+def sockets():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    yield server, sender
+    sender.close()
+    server.close()
+
+
+def receive_all(receiver, count, timeout=2):
+    received = []
+    end = time.time() + timeout
+    while len(received) < count and time.time() < end:
+        received.extend((bytes(view), address) for view, address in receiver.receive(0.1))
+    return received
+
+
+def test_queued_datagrams_are_received_in_order(sockets):
+    server, sender = sockets
+    receiver = UdpReceiver(server, batch=8)
+    messages = [f"OFFER {rq} s1 lamp 30".encode() for rq in range(20)]
+    for message in messages:
+        sender.sendto(message, server.getsockname())
+    received = receive_all(receiver, len(messages))
+    assert [data for data, _ in received] == messages
+    assert {address[1] for _, address in received} == {sender.getsockname()[1]}
+    receiver.close()
+
+
+def test_several_queued_datagrams_come_back_from_one_wakeup(sockets):
+    server, sender = sockets
+    receiver = UdpReceiver(server, batch=8)
+    if receiver.batch == 1:
+        pytest.skip("The platform has no MSG_DONTWAIT")
+    for rq in range(5):
+        sender.sendto(f"PING {rq} b1".encode(), server.getsockname())
+    time.sleep(0.1)
+    assert len(receiver.receive(1)) == 5
+    receiver.close()
+
+
+def test_an_oversized_datagram_is_longer_than_max_datagram(sockets):
+    server, sender = sockets
+    receiver = UdpReceiver(server, max_datagram=16)
+    sender.sendto(b"LOOKING_FOR 1 b1 a-long-item-name", server.getsockname())
+    [(data, _)] = receive_all(receiver, 1)
+    assert len(data) == 17  # Truncated to the buffer, one byte past the limit
+    receiver.close()
+
+
+def test_receive_returns_nothing_after_the_timeout(sockets):
+    server, _ = sockets
+    receiver = UdpReceiver(server)
+    assert receiver.receive(0.05) == []
+    receiver.close()
+
+
+def test_message_type_of_reads_the_first_word():
+    assert message_type_of(memoryview(b"LOOKING_FOR 1 b1 lamp d 40")) == "LOOKING_FOR"
+    assert message_type_of(memoryview(b"RESET")) == "RESET"
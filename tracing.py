@@ -0,0 +1,86 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+TRACE_FILE = "traces.jsonl"
+
+
+class Tracer:
+    """
+    Per-search timelines. A trace starts with LOOKING_FOR and is keyed by the
+    server's search RQ#, so every handler thread that later touches the search
+    (OFFER, NEGOTIATE/ACCEPT, BUY) adds spans to the same trace. Each span and
+    the final trace record are appended to a JSONL file:
+
+      {"trace_id": ..., "search_rq": 12, "stage": "offer_collection",
+       "start": <epoch seconds>, "duration_ms": 60012.4, ...attributes}
+
+    `python benchmarks/run.py trace_report traces.jsonl` prints per-stage latency percentiles.
+    """
+
+    def __init__(self, path=TRACE_FILE, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self._traces = {}  # search_rq -> (trace_id, start time)
+        self._lock = Lock()
+        self._file = None
+
+    def start(self, search_rq, buyer, item_name):
+        """Open a trace for a new search. Returns its trace id (None when tracing is off)."""
+        if not self.enabled:
+            return None
+        trace_id = os.urandom(8).hex()
+        with self._lock:
+            self._traces[search_rq] = (trace_id, time.time())
+        self.event(search_rq, "looking_for", buyer=buyer, item_name=item_name)
+        return trace_id
+
+    @contextmanager
+    def span(self, search_rq, stage, **attributes):
+        """Time the enclosed block as one stage of the search's trace."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.stage(search_rq, stage, start, **attributes)
+
+    def stage(self, search_rq, stage, start, **attributes):
+        """Record a stage that began at start (epoch seconds) and ends now."""
+        self._emit(search_rq, stage, start, time.time() - start, attributes)
+
+    def event(self, search_rq, stage, **attributes):
+        """Record an instantaneous stage, e.g. a message sent or received."""
+        self._emit(search_rq, stage, time.time(), 0.0, attributes)
+
+    def end(self, search_rq, outcome):
+        """Close the trace with its outcome and total duration."""
+        with self._lock:
+            trace = self._traces.pop(search_rq, None)
+        if trace:
+            trace_id, start = trace
+            self._write(trace_id, search_rq, "trace", start, time.time() - start, {"outcome": outcome})
+
+    def _emit(self, search_rq, stage, start, duration, attributes):
+        trace = self._traces.get(search_rq)
+        if trace:
+            self._write(trace[0], search_rq, stage, start, duration, attributes)
+
+    def _write(self, trace_id, search_rq, stage, start, duration, attributes):
+        record = {"trace_id": trace_id, "search_rq": search_rq, "stage": stage,
+                  "start": round(start, 6), "duration_ms": round(duration * 1000, 3)}
+        record.update(attributes)
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", buffering=1)  # Line buffered
+            self._file.write(line)
+
+    def clear(self):
+        """Forget open traces (RESET); records already written stay in the file."""
+        with self._lock:
+            self._traces.clear()
+
+
+NULL_TRACER = Tracer(enabled=False)
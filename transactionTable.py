@@ -0,0 +1,187 @@
+import time
+from threading import Lock
+from itemIndex import item_key
+
+SEARCHING = "SEARCHING"  # SEARCH sent, offer window open
+OFFERED = "OFFERED"  # Offers collected, best one being chosen
+NEGOTIATING = "NEGOTIATING"  # NEGOTIATE sent to a seller, waiting for ACCEPT / REFUSE
+RESERVED = "RESERVED"  # RESERVE / FOUND sent, waiting for the buyer's BUY
+PAYING = "PAYING"  # BUY accepted: INFORM exchange and payment settlement
+SHIPPED = "SHIPPED"  # SHIPPING_INFO and TRANSACTION_SUCCESS sent
+CANCELLED = "CANCELLED"
+
+TRANSITIONS = {
+    SEARCHING: {OFFERED, CANCELLED},
+    OFFERED: {NEGOTIATING, RESERVED, CANCELLED},
+    NEGOTIATING: {NEGOTIATING, RESERVED, CANCELLED},
+    RESERVED: {PAYING, CANCELLED},
+    PAYING: {SHIPPED, CANCELLED},
+    SHIPPED: set(),
+    CANCELLED: set(),
+}
+CANCELLABLE = (SEARCHING, OFFERED, NEGOTIATING, RESERVED)  # A CANCEL cannot interrupt a payment
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+class TransactionRecord:
+    """One search from LOOKING_FOR to SHIPPED or CANCELLED."""
+    __slots__ = ("search_rq", "buyer_rq", "buyer", "buyer_address", "item_name", "state",
+                 "seller", "price", "offer", "started", "updated")
+
+    def __init__(self, search_rq, buyer_rq, buyer, buyer_address, item_name, now):
+        self.search_rq = search_rq
+        self.buyer_rq = buyer_rq  # The RQ# the buyer used, echoed in FOUND / NOT_AVAILABLE
+        self.buyer = buyer
+        self.buyer_address = buyer_address  # Where LOOKING_FOR came from; BUY and CANCEL arrive from there
+        self.item_name = item_name
+        self.state = SEARCHING
+        self.seller = None  # Set once a seller is negotiated with or reserved
+        self.price = None
+        self.offer = None  # The Offer being negotiated or reserved
+        self.started = now
+        self.updated = now
+
+    def export(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    @classmethod
+    def restore(cls, values):
+        record = cls.__new__(cls)
+        for field, value in zip(cls.__slots__, values):
+            setattr(record, field, value)
+        return record
+
+
+class TransactionTable:
+    """
+    Shared table of open transactions with explicit states. Records are found
+    in O(1) by search RQ#, by (buyer address, buyer RQ#) and by participant
+    name; a state change is checked against TRANSITIONS under the table lock,
+    so two handlers cannot both move a record out of the same state (e.g. two
+    BUYs for one reservation). Records leave the table when they reach
+    SHIPPED or CANCELLED.
+    """
+
+    def __init__(self):
+        self._records = {}  # search_rq -> TransactionRecord
+        self._by_buyer_rq = {}  # (buyer address, buyer RQ#) -> [search_rq]; batch entries share an RQ#
+        self._by_participant = {}  # name -> {search_rq}, as buyer or seller
+        self._lock = Lock()
+
+    def open(self, search_rq, buyer_rq, buyer, buyer_address, item_name):
+        record = TransactionRecord(search_rq, buyer_rq, buyer, buyer_address, item_name, time.time())
+        with self._lock:
+            self._add(record)
+        return record
+
+    def _add(self, record):
+        self._records[record.search_rq] = record
+        self._by_buyer_rq.setdefault((record.buyer_address, record.buyer_rq), []).append(record.search_rq)
+        self._by_participant.setdefault(record.buyer, set()).add(record.search_rq)
+        if record.seller:
+            self._by_participant.setdefault(record.seller, set()).add(record.search_rq)
+
+    def _remove(self, record):
+        del self._records[record.search_rq]
+        key = (record.buyer_address, record.buyer_rq)
+        search_rqs = self._by_buyer_rq[key]
+        search_rqs.remove(record.search_rq)
+        if not search_rqs:
+            del self._by_buyer_rq[key]
+        for name in {record.buyer, record.seller} - {None}:
+            self._unindex_participant(name, record.search_rq)
+
+    def _unindex_participant(self, name, search_rq):
+        search_rqs = self._by_participant.get(name)
+        if search_rqs is not None:
+            search_rqs.discard(search_rq)
+            if not search_rqs:
+                del self._by_participant[name]
+
+    def get(self, search_rq):
+        return self._records.get(search_rq)
+
+    def for_buyer(self, buyer_address, buyer_rq, item_name=None):
+        """
+        Open records of a buyer's RQ#, optionally only those for item_name
+        (as searched for, or as named by the offer being negotiated or reserved).
+        """
+        with self._lock:
+            records = [self._records[rq] for rq in self._by_buyer_rq.get((buyer_address, buyer_rq), ())]
+        if item_name is not None:
+            key = item_key(item_name)
+            records = [record for record in records if key == item_key(record.item_name)
+                       or (record.offer and key == item_key(record.offer.item_name))]
+        return records
+
+    def for_participant(self, name):
+        with self._lock:
+            return [self._records[rq] for rq in self._by_participant.get(name, ())]
+
+    def transition(self, search_rq, state, expected=None, **fields):
+        """
+        Move a record to state, updating seller / price / offer from fields.
+        expected optionally narrows the states the record may be in. Raises
+        InvalidTransition when the record is gone or the move is not allowed.
+        """
+        with self._lock:
+            record = self._records.get(search_rq)
+            if record is None:
+                raise InvalidTransition(f"Transaction {search_rq} does not exist or has ended")
+            if state not in TRANSITIONS[record.state] or (expected and record.state not in expected):
+                raise InvalidTransition(f"Transaction {search_rq} is {record.state}, cannot become {state}")
+            seller = fields.get("seller")
+            if seller and seller != record.seller:
+                self._by_participant.setdefault(seller, set()).add(search_rq)
+                if record.seller and record.seller != record.buyer:
+                    self._unindex_participant(record.seller, search_rq)
+            for field, value in fields.items():
+                setattr(record, field, value)
+            record.state = state
+            record.updated = time.time()
+            if not TRANSITIONS[state]:
+                self._remove(record)
+            return record
+
+    def cancel_participant(self, name):
+        """Cancel the open, not yet paying, transactions a client takes part in. Returns them."""
+        with self._lock:
+            records = [self._records[rq] for rq in self._by_participant.get(name, ())
+                       if self._records[rq].state in CANCELLABLE]
+            for record in records:
+                record.state = CANCELLED
+                self._remove(record)
+        return records
+
+    def in_flight(self):
+        """Transactions whose payment exchange is in progress."""
+        with self._lock:
+            return [record for record in self._records.values() if record.state == PAYING]
+
+    def snapshot(self):
+        """search_rq -> (state, buyer, seller, item_name, price, started) for every open record."""
+        with self._lock:
+            return {rq: (r.state, r.buyer, r.seller, r.item_name, r.price, r.started)
+                    for rq, r in self._records.items()}
+
+    def __len__(self):
+        return len(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._by_buyer_rq.clear()
+            self._by_participant.clear()
+
+    def export(self):
+        """Open records as plain tuples, for a hot restart."""
+        with self._lock:
+            return [record.export() for record in self._records.values()]
+
+    def restore(self, exported):
+        with self._lock:
+            for values in exported:
+                self._add(TransactionRecord.restore(values))
@@ -0,0 +1,58 @@
+import selectors
+import socket
+
+MAX_DATAGRAM = 65507  # Largest UDP payload over IPv4; longer messages are rejected, not truncated
+RECV_BATCH = 64  # Datagrams drained per wakeup when several are queued
+RECV_BUFFER = 4 * 1024 * 1024  # Kernel receive buffer, absorbs bursts between drains
+_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+
+
+class UdpReceiver:
+    """
+    Batched receive path for the server's UDP socket. One wakeup drains up to
+    `batch` queued datagrams with recvfrom_into into preallocated buffers and
+    returns (memoryview, address) pairs over them. The views are only valid
+    until the next receive() call, which reuses the buffers.
+
+    Each buffer holds max_datagram + 1 bytes, so a view longer than
+    max_datagram marks a message that would otherwise have been truncated.
+    The socket stays in blocking mode (handlers send on it); draining uses
+    MSG_DONTWAIT where the platform has it and one datagram per wakeup elsewhere.
+    """
+
+    def __init__(self, udp_socket, max_datagram=MAX_DATAGRAM, batch=RECV_BATCH):
+        self.udp_socket = udp_socket
+        self.max_datagram = max_datagram
+        self.batch = batch if _DONTWAIT else 1
+        self._buffers = [bytearray(max_datagram + 1) for _ in range(self.batch)]
+        self._views = [memoryview(buffer) for buffer in self._buffers]
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(udp_socket, selectors.EVENT_READ)
+        try:
+            udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        except OSError:
+            pass  # Keep the system default
+
+    def receive(self, timeout):
+        """Wait up to timeout seconds and return the queued datagrams (possibly none)."""
+        if not self._selector.select(timeout):
+            return []
+        received = []
+        for view in self._views:
+            try:
+                nbytes, address = self.udp_socket.recvfrom_into(view, 0, _DONTWAIT)
+            except BlockingIOError:
+                break
+            received.append((view[:nbytes], address))
+            if not _DONTWAIT:
+                break
+        return received
+
+    def close(self):
+        self._selector.close()
+
+
+def message_type_of(view):
+    """The first word of a datagram, without decoding the rest of it."""
+    end = bytes(view[:32]).find(b" ")
+    return str(view[:end] if end >= 0 else view[:32], "utf-8", "replace")